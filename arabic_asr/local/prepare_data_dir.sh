@@ -5,9 +5,18 @@
 #: Description : Prepare Kaldi data directory from TDF files in an LDC corpus
 #: Input : - Path of TDF corpus files directory
 #          - Destination of Kaldi the data directory
+#: Options : --nj <n> Number of parallel jobs (default: number of CPU cores)
+
+nj=
+
+# Read options
+if [ "$1" == "--nj" ]; then
+    nj=$2
+    shift 2
+fi
 
 # Read arguments
-usage="USAGE: prepare_data_dir.sh <LDC_corpus> <Kaldi_data_dir>"
+usage="USAGE: prepare_data_dir.sh [--nj <n>] <LDC_corpus> <Kaldi_data_dir>"
 eg="e.g.: prepare_data_dir.sh local/gale_p2_arb_bc_transcripts_p1 data"
 ldc_corpus_help="  LDC_corpus: String specifying the path to the LDC"
 ldc_corpus_help="$ldc_corpus_help transcript corpus."
@@ -46,28 +55,10 @@ error_msg="Error: Could not create Kaldi data directory at the specified "
 error_msg="$error_msg: location $kaldi_data_dir."
 mkdir $kaldi_data_dir || [ $(echo $error_msg && exit 1)
 
-# Produce Kaldi data dir for each file in the LDC corpus
-# Append similar files together
-num_processed=0
-for ldc_file in $ldc_corpus/*.tdf; do
-    success_msg="Successfully created Kaldi files for ldc corpus file "
-    success_msg="$success_msg $ldc_file"
-    error_msg="Error: Could not create Kaldi files for ldc corpus file "
-    error_msg="$error_msg $ldc_file"
-    success=0
-    python utils/ldc_corpus2kaldi_dir.py $ldc_file $kaldi_data_dir \
-        --ignore-absent && success=1
-    if [ $success == 1 ]; then
-        echo $success_msg
-        num_processed=$((num_processed + 1))
-    else
-        echo $error_msg
-    fi
-done
-
-if [ $num_processed == 0 ]; then
-    warning_msg="Warning: No LDC corupus files found in the specified "
-    warning_msg=" directory: $ldc_corpus. Make sure files exist in tdf format."
-else
-    echo "Successfully processed $num_processed LDC files."
-fi
+# Produce the Kaldi data directory from all files in the LDC corpus in a
+# single pass. TDF files are parsed in parallel (one worker per CPU core) and
+# the output files are sorted, so fix_data_dir.sh is not needed afterwards.
+nj_opt=
+[ -n "$nj" ] && nj_opt="--nj $nj"
+python utils/ldc_corpus_dir2kaldi_dir.py $ldc_corpus $kaldi_data_dir \
+    --ignore-absent $nj_opt || exit 1
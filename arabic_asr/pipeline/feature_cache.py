@@ -0,0 +1,182 @@
+#: Title : feature_cache.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : A content-addressed cache of per-recording front-end output
+#    (features, CMVN statistics and online i-vectors), with entries evicted
+#    in least recently used order once the cache grows beyond a size limit
+
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import Counter
+from stage_runner import FileHasher
+
+__author__ = "Ahmed Ismail"
+__license__ = "GPL"
+__version__ = "1.0"
+__email__ = "ahmed.ismail.zahran@gmail.com"
+__status__ = "Development"
+
+
+# Changing the version invalidates all cache entries
+CACHE_VERSION = '1'
+HASH_CACHE_FILE_NAME = 'hashes.json'
+TMP_PREFIX = 'tmp.'
+# Default cache size limit in GB
+MAX_SIZE = 50
+
+
+def _dir_size(dir_path):
+    size = 0
+    for dir_entry in os.scandir(dir_path):
+        if dir_entry.is_dir(follow_symlinks=False):
+            size += _dir_size(dir_entry.path)
+        else:
+            size += dir_entry.stat(follow_symlinks=False).st_size
+    return size
+
+
+class FeatureCache(object):
+    ''' A directory of cache entries keyed by content hashes
+
+    Every entry is a directory at <cache dir>/<key[:2]>/<key>. Entries are
+    filled in a temporary directory and renamed into place, so an entry
+    which exists is complete. The modification time of an entry records its
+    last use.
+    '''
+
+    def __init__(self, cache_dir_path, max_size=MAX_SIZE):
+        ''' Opens (or creates) a cache
+
+        Arguments
+        ---------
+
+        cache_dir_path : Directory of the cache.
+
+        max_size : Size limit in GB, applied by evict, or None for no limit.
+        '''
+        self.cache_dir_path = os.path.abspath(cache_dir_path)
+        if not os.path.isdir(self.cache_dir_path):
+            os.makedirs(self.cache_dir_path)
+        self.max_size = max_size
+        self.hasher = FileHasher(os.path.join(self.cache_dir_path,
+            HASH_CACHE_FILE_NAME))
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evicted = 0
+        self.evicted_size = 0
+
+    def key(self, kind, *parts):
+        ''' Returns the key of an entry of a kind (e.g. 'feats'), from the
+        strings it depends on (e.g. content hashes and configurations). '''
+        sha1 = hashlib.sha1(('%s\0%s' % (CACHE_VERSION, kind)).encode(
+            'utf-8'))
+        for part in parts:
+            sha1.update(b'\0' + part.encode('utf-8'))
+        return sha1.hexdigest()
+
+    def hash_path(self, path):
+        ''' Returns the content hash of a file or directory. File hashes are
+        kept in the cache directory, so unchanged files are not read again.
+        '''
+        return self.hasher.hash_path(path)
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir_path, key[:2], key)
+
+    def lookup(self, kind, key):
+        ''' Looks up an entry, counting a hit or a miss for its kind
+
+        Returns
+        -------
+
+        entry_path : Directory of the entry, or None if it is not cached.
+        '''
+        entry_path = self.entry_path(key)
+        if os.path.isdir(entry_path):
+            try:
+                os.utime(entry_path)
+            except OSError:
+                pass
+            self.hits[kind] += 1
+            return entry_path
+        self.misses[kind] += 1
+        return None
+
+    def new_entry(self):
+        ''' Returns a temporary directory to fill an entry in, before adding
+        it with add. '''
+        return tempfile.mkdtemp(prefix=TMP_PREFIX, dir=self.cache_dir_path)
+
+    def add(self, key, tmp_entry_path):
+        ''' Moves a filled temporary directory into the cache
+
+        Returns
+        -------
+
+        entry_path : Directory of the entry.
+        '''
+        entry_path = self.entry_path(key)
+        if not os.path.isdir(os.path.dirname(entry_path)):
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        try:
+            os.rename(tmp_entry_path, entry_path)
+        except OSError:
+            # Added by another run in the meantime
+            if not os.path.isdir(entry_path):
+                raise
+            shutil.rmtree(tmp_entry_path)
+        return entry_path
+
+    def entries(self):
+        ''' Returns a list of (last use time, size in bytes, path) tuples of
+        the entries of the cache. '''
+        entries = []
+        for prefix_entry in os.scandir(self.cache_dir_path):
+            if not prefix_entry.is_dir() or prefix_entry.name.startswith(
+                TMP_PREFIX):
+                continue
+            for dir_entry in os.scandir(prefix_entry.path):
+                if dir_entry.is_dir():
+                    entries.append((dir_entry.stat().st_mtime,
+                        _dir_size(dir_entry.path), dir_entry.path))
+        return entries
+
+    def evict(self):
+        ''' Removes the least recently used entries until the cache fits in
+        its size limit, and saves the file hashes.
+
+        Returns
+        -------
+
+        size : Size of the remaining entries in bytes.
+        '''
+        self.hasher.save()
+        entries = sorted(self.entries())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        if self.max_size is None:
+            return size
+        max_size = int(self.max_size * (1 << 30))
+        for _, entry_size, entry_path in entries:
+            if size <= max_size:
+                break
+            shutil.rmtree(entry_path, ignore_errors=True)
+            size -= entry_size
+            self.evicted += 1
+            self.evicted_size += entry_size
+        return size
+
+    def report(self, size=None):
+        ''' Returns a summary of the hits and misses of every kind of entry,
+        and of the evicted entries. '''
+        lines = []
+        for kind in sorted(set(self.hits) | set(self.misses)):
+            lines.append('%s: %d hits, %d misses' % (kind, self.hits[kind],
+                self.misses[kind]))
+        if self.evicted:
+            lines.append('%d entries (%.1f MB) evicted' % (self.evicted,
+                self.evicted_size / float(1 << 20)))
+        if size is not None:
+            lines.append('Cache size: %.1f MB' % (size / float(1 << 20)))
+        return '\n'.join(lines)
@@ -0,0 +1,297 @@
+#: Title : lattices2srt.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : Convert the lattices of all the jobs of a decoding directory
+#    to CTM concurrently through pipes, and write the subtitle files of the
+#    recordings as their CTM lines are complete
+#: Arguments :
+#  1- Decoding directory (containing lat.*.gz)
+#  2- Destination of SRT files
+#  3- Path to Kaldi words file
+
+import argparse
+import io
+import os
+import re
+import shlex
+import signal
+import subprocess
+import sys
+import threading
+from queue import Empty, Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    os.pardir, 'utils'))
+from ctm2srt import iter_recordings
+from ctm_index import FORMATS, write_subtitles_stream
+from symbol_table import get_symbol_table
+
+__author__ = "Ahmed Ismail"
+__license__ = "GPL"
+__version__ = "1.0"
+__email__ = "ahmed.ismail.zahran@gmail.com"
+__status__ = "Development"
+
+
+# Command writing the CTM of a lattice file ({lat}) to the standard output
+LATTICE_TO_CTM = 'lattice-to-ctm-conf "ark:gunzip -c {lat} |" -'
+# Run before the command, in the directory the commands run in
+PREAMBLE = 'if [ -f ./path.sh ]; then . ./path.sh; fi; '
+# Maximum number of finished recordings waiting to be written
+QUEUE_SIZE = 64
+_lat_re = re.compile(r'^lat\.(\d+)\.gz$')
+
+
+def lattice_files(decode_dir_path):
+    ''' Returns the absolute paths of the lattice files of a decoding
+    directory, in job order
+
+    If the directory has a num_jobs file (written by the Kaldi decoding
+    scripts), only the lattices of these jobs are returned, so lattices left
+    by an earlier decode with more jobs are ignored.
+    '''
+    jobs = []
+    for file_name in os.listdir(decode_dir_path):
+        match = _lat_re.match(file_name)
+        if match is not None:
+            jobs.append(int(match.group(1)))
+    num_jobs_file_path = os.path.join(decode_dir_path, 'num_jobs')
+    if os.path.exists(num_jobs_file_path):
+        with open(num_jobs_file_path, 'r') as num_jobs_file:
+            num_jobs = int(num_jobs_file.read())
+        missing_jobs = set(range(1, num_jobs + 1)) - set(jobs)
+        if missing_jobs:
+            raise IOError('Lattices of jobs %s are missing from %s.' % (
+                ', '.join(str(job) for job in sorted(missing_jobs)),
+                decode_dir_path))
+        jobs = [job for job in jobs if job <= num_jobs]
+    return [os.path.abspath(os.path.join(decode_dir_path, 'lat.%d.gz' % job))
+        for job in sorted(jobs)]
+
+
+def _kill(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def stream_ctm(lattice_file_paths, cwd='.', command=LATTICE_TO_CTM,
+    preamble=PREAMBLE, queue_size=QUEUE_SIZE):
+    ''' Converts lattice files to CTM with one process per file, and yields
+    the recordings of all files as they are finished
+
+    Nothing is written to disk: every process writes its CTM to a pipe read
+    by its own thread, which groups the lines by recording.
+
+    Arguments
+    ---------
+
+    lattice_file_paths : List of paths to lattice files.
+
+    cwd : Directory the commands run in (e.g. the Kaldi recipe directory).
+
+    command : Bash command writing the CTM of the lattice file {lat} to the
+    standard output. It can be replaced by a stand-in for testing.
+
+    preamble : Bash commands run before the command.
+
+    queue_size : Maximum number of finished recordings waiting to be
+    consumed.
+
+    Yields
+    ------
+
+    recording : Tuple of the recording ID and the list of its CTM lines, each
+    split into fields.
+
+    Raises CalledProcessError when a conversion fails, after stopping the
+    other ones.
+    '''
+    queue = Queue(queue_size)
+    stop = threading.Event()
+    processes = []
+    threads = []
+
+    def read(process, process_command):
+        try:
+            ctm_stream = io.TextIOWrapper(process.stdout, 'utf-8')
+            for recording in iter_recordings(ctm_stream):
+                if stop.is_set():
+                    return
+                queue.put(('recording', recording))
+            return_code = process.wait()
+            if return_code != 0:
+                queue.put(('error', subprocess.CalledProcessError(
+                    return_code, process_command)))
+            else:
+                queue.put(('done', None))
+        except Exception as e:
+            queue.put(('error', e))
+
+    try:
+        for lattice_file_path in lattice_file_paths:
+            process_command = command.replace('{lat}', shlex.quote(
+                lattice_file_path))
+            process = subprocess.Popen(['bash', '-c', preamble +
+                process_command], cwd=cwd, stdout=subprocess.PIPE,
+                start_new_session=True)
+            processes.append(process)
+            thread = threading.Thread(target=read, args=(process,
+                process_command), daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        seen_utt_ids = set()
+        num_done = 0
+        while num_done < len(processes):
+            kind, item = queue.get()
+            if kind == 'error':
+                raise item
+            if kind == 'done':
+                num_done += 1
+                continue
+            if item[0] in seen_utt_ids:
+                raise Exception('Recording %s is in the lattices of more '
+                    'than one job.' % item[0])
+            seen_utt_ids.add(item[0])
+            yield item
+    finally:
+        # Stop the conversions left, and unblock their threads
+        stop.set()
+        for process in processes:
+            if process.poll() is None:
+                _kill(process)
+        while any(thread.is_alive() for thread in threads):
+            try:
+                queue.get(timeout=0.1)
+            except Empty:
+                pass
+        for process in processes:
+            process.stdout.close()
+            process.wait()
+
+
+def _save_ctm(recordings, ctm_file):
+    for utt_id, ctm_lines in recordings:
+        ctm_file.writelines(' '.join(line) + '\n' for line in ctm_lines)
+        yield utt_id, ctm_lines
+
+
+def lattices2srt(decode_dir_path, srt_dir_path, symbol_table, cwd='.',
+    srt_file_names=None, ctm_file_path=None, formats=('srt',),
+    command=LATTICE_TO_CTM, nj=1):
+    ''' Writes the subtitle files of every recording of the lattices of a
+    decoding directory
+
+    Finished recordings are indexed and written in batches by a pool of
+    workers (see ctm_index.write_subtitles_stream).
+
+    Arguments
+    ---------
+
+    decode_dir_path : Decoding directory, relative to cwd.
+
+    srt_dir_path : Destination of the subtitle files.
+
+    symbol_table : SymbolTable object decoding the word IDs.
+
+    cwd : Directory the conversion commands run in.
+
+    srt_file_names : Dictionary mapping recording IDs to SRT file paths
+    relative to srt_dir_path (other formats replace the extension). Default
+    is to name SRT files by recording ID, and other files by recording ID and
+    format.
+
+    ctm_file_path : If given, the CTM lines are also saved to this file, in
+    the order the recordings are finished.
+
+    formats : Subtitle formats to write, among 'srt', 'vtt' and 'json'.
+
+    command : Command converting a lattice file to CTM (see stream_ctm).
+
+    nj : Number of workers writing subtitle files.
+
+    Returns
+    -------
+
+    num_recordings : Number of recordings written.
+    '''
+    lattice_file_paths = lattice_files(os.path.join(cwd, decode_dir_path))
+    if lattice_file_paths == []:
+        raise IOError('No lattices were found in %s.' % os.path.join(cwd,
+            decode_dir_path))
+    recordings = stream_ctm(lattice_file_paths, cwd, command)
+    try:
+        if ctm_file_path is None:
+            return write_subtitles_stream(recordings, srt_dir_path,
+                symbol_table, formats, file_names=srt_file_names, nj=nj)
+        with open(ctm_file_path, 'w', encoding='utf-8') as ctm_file:
+            return write_subtitles_stream(_save_ctm(recordings, ctm_file),
+                srt_dir_path, symbol_table, formats,
+                file_names=srt_file_names, nj=nj)
+    finally:
+        # Stops the conversions if writing failed
+        recordings.close()
+
+
+def main():
+    ''' Write subtitle files from the lattices of a decoding directory.
+    '''
+    arg_parser = argparse.ArgumentParser(description=('Convert the lattices '
+        'of all the jobs of a decoding directory to CTM concurrently, and '
+        'write the subtitle files of every recording.'))
+    arg_parser.add_argument('decode_dir_path', type=str, help=('Decoding '
+        'directory containing lat.*.gz, relative to the Kaldi recipe '
+        'directory.'))
+    arg_parser.add_argument('srt_dir_path', type=str,
+        help='Destination of the subtitle files.')
+    arg_parser.add_argument('words_file_path', type=str,
+        help='Path to the Kaldi words file.')
+    arg_parser.add_argument('--kaldi-dir', dest='kaldi_dir', type=str,
+        default='.', help=('Kaldi recipe directory, where path.sh is sourced '
+        'and the commands are run. Default is the current directory.'))
+    arg_parser.add_argument('--nj', type=int, default=1, help=('Number of '
+        'workers writing subtitle files in parallel. Default is 1.'))
+    arg_parser.add_argument('--formats', type=str, default='srt',
+        help=('Comma-separated subtitle formats to write, among %s. Default '
+        'is srt.' % ', '.join(FORMATS)))
+    arg_parser.add_argument('--ctm', dest='ctm_file_path', type=str,
+        default=None, help='Also save the CTM lines to this file.')
+    arg_parser.add_argument('--lattice-to-ctm', dest='command', type=str,
+        default=LATTICE_TO_CTM, help=('Command writing the CTM of lattice '
+        'file {lat} to the standard output. Default is \'%s\'.' %
+        LATTICE_TO_CTM))
+    arg_parser.add_argument('--symbol-table-cache', dest='symbol_table_cache',
+        type=str, default=None, help=('Directory where compiled symbol tables '
+        'are cached. Default is a .symbol_tables directory next to the words '
+        'file.'))
+    args = vars(arg_parser.parse_args())
+
+    formats = args['formats'].split(',')
+    for output_format in formats:
+        if output_format not in FORMATS:
+            print('Unknown subtitle format %s.' % output_format)
+            exit(1)
+    if not os.path.exists(args['words_file_path']):
+        print('Could not find words file in specified location: %s.' %
+            args['words_file_path'])
+        exit(1)
+    symbol_table = get_symbol_table(args['words_file_path'], 'buckwalter',
+        'unicode', args['symbol_table_cache'])
+    if not os.path.isdir(args['srt_dir_path']):
+        os.makedirs(args['srt_dir_path'])
+    try:
+        num_recordings = lattices2srt(args['decode_dir_path'],
+            args['srt_dir_path'], symbol_table, args['kaldi_dir'],
+            ctm_file_path=args['ctm_file_path'], formats=formats,
+            command=args['command'], nj=args['nj'])
+    except (IOError, subprocess.CalledProcessError) as e:
+        print('Error: %s' % e)
+        exit(1)
+    print('Subtitles of %d recordings were written to %s.' % (num_recordings,
+        args['srt_dir_path']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,523 @@
+#: Title : recognize.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : Run the Arabic ASR pipeline on a batch of recordings, with
+#    feature extraction, i-vector extraction and decoding split into
+#    parallel jobs, and write one SRT file per recording
+#: Arguments :
+#  1- Wave files or directories containing wave files
+#  Option -o gives the destination of the SRT files. Features and i-vectors
+#  are cached by audio content (see feature_cache.py) unless --no-cache is
+#  given.
+
+import argparse
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    os.pardir, 'utils'))
+from ctm_index import FORMATS, empty_document, subtitle_file_path
+from feature_cache import MAX_SIZE, FeatureCache
+from lattices2srt import lattices2srt
+from symbol_table import get_symbol_table
+
+__author__ = "Ahmed Ismail"
+__license__ = "GPL"
+__version__ = "1.0"
+__email__ = "ahmed.ismail.zahran@gmail.com"
+__status__ = "Development"
+
+
+EG_DIR = 'egs/gale_arabic_2/s5'
+MODEL_DIR = 'exp/nnet3/tdnn'
+IVECTOR_EXTRACTOR_DIR = 'exp/ivector_extractor'
+MFCC_CONFIG = 'conf/mfcc.conf'
+IVECTOR_PERIOD = 10
+BATCH_NAME = 'recs'
+conf_options = ['kaldi_dir', 'feat_dir', 'cache_dir']
+_invalid_id_chars_re = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def parse_args():
+    ''' Parses command line arguments
+
+    Returns
+    -------
+
+    args : A dictionary of arguments
+    '''
+    arg_parser = argparse.ArgumentParser(description=('Recognize a batch of '
+        'recordings and write one SRT file per recording.'),
+        epilog='e.g.: python recognize.py -r --nj 16 -o srt data/recordings')
+    arg_parser.add_argument('inputs', type=str, nargs='+',
+        help='Wave files, or directories containing wave files.')
+    arg_parser.add_argument('-o', '--output', dest='output_dir', type=str,
+        required=True, help='Directory to write the SRT files to.')
+    arg_parser.add_argument('-r', '--recursive', dest='recursive',
+        action='store_true', help=('Find files recursively inside the '
+        'directories specified.'))
+    arg_parser.add_argument('--nj', type=int, default=None, help=('Number '
+        'of parallel jobs. Default is the number of CPUs.'))
+    arg_parser.add_argument('--conf', type=str, default='config',
+        help=('Configuration file containing the Kaldi directory\'s path '
+        '(kaldi_dir), the feature files destination (feat_dir) and the '
+        'feature cache directory (cache_dir), one <var>=<value> per line. '
+        'Default is ./config.'))
+    arg_parser.add_argument('--extensions', type=str, default='wav',
+        help=('Comma-separated extensions of the files to recognize in '
+        'directories. Default is wav.'))
+    arg_parser.add_argument('--batch-name', dest='batch_name', type=str,
+        default=BATCH_NAME, help=('Name of the data, feature and decoding '
+        'directories of the batch. Default is %s.' % BATCH_NAME))
+    arg_parser.add_argument('--model-dir', dest='model_dir', type=str,
+        default=MODEL_DIR, help='Model directory. Default is %s.' % MODEL_DIR)
+    arg_parser.add_argument('--formats', type=str, default='srt',
+        help=('Comma-separated subtitle formats to write, among %s. Default '
+        'is srt.' % ', '.join(FORMATS)))
+    arg_parser.add_argument('--no-cache', dest='no_cache', action='store_true',
+        help='Compute features and i-vectors without the cache.')
+    arg_parser.add_argument('--cache-size', dest='cache_size', type=float,
+        default=MAX_SIZE, help=('Size limit of the feature cache in GB, '
+        'beyond which the least recently used entries are removed. Default '
+        'is %d.' % MAX_SIZE))
+    args = vars(arg_parser.parse_args())
+    return args
+
+
+def read_conf(conf_file_path):
+    ''' Reads a configuration file of <var>=<value> lines
+
+    Returns
+    -------
+
+    conf : Dictionary of configurations, with defaults for the ones left
+    out.
+    '''
+    conf = {'kaldi_dir': '.', 'feat_dir': 'feats', 'cache_dir': 'cache'}
+    with open(conf_file_path, 'r') as conf_file:
+        for line in conf_file:
+            line = line.strip()
+            if line == '':
+                continue
+            var, _, val = line.partition('=')
+            if var not in conf_options:
+                raise ValueError('Unknown configuration file option %s.' %
+                    var)
+            if val != '':
+                conf[var] = val
+    return conf
+
+
+def find_recordings(input_paths, recursive=False, extensions=('wav',)):
+    ''' Finds the files to recognize
+
+    Arguments
+    ---------
+
+    input_paths : List of files and directories.
+
+    recursive : If True, directories are searched recursively.
+
+    extensions : Extensions of the files to pick from directories.
+
+    Returns
+    -------
+
+    recordings : Sorted list of (absolute path, path relative to the input
+    directory) tuples. Files passed directly are relative to their own
+    directory.
+    '''
+    extensions = tuple('.' + extension.lower().lstrip('.') for extension in
+        extensions)
+    recordings = set()
+    for input_path in input_paths:
+        input_path = os.path.abspath(input_path)
+        if os.path.isfile(input_path):
+            recordings.add((input_path, os.path.basename(input_path)))
+            continue
+        if not os.path.isdir(input_path):
+            raise IOError('Cannot find specified file or directory: %s.' %
+                input_path)
+        for dir_path, dir_names, file_names in os.walk(input_path):
+            if not recursive:
+                dir_names[:] = []
+            for file_name in file_names:
+                if file_name.lower().endswith(extensions):
+                    file_path = os.path.join(dir_path, file_name)
+                    recordings.add((file_path, os.path.relpath(file_path,
+                        input_path)))
+    return sorted(recordings)
+
+
+def assign_rec_ids(recordings):
+    ''' Gives every recording a unique Kaldi recording ID and SRT file name
+
+    IDs are derived from the relative paths of the recordings, with
+    characters Kaldi does not accept in IDs replaced by '_' and a suffix
+    added to IDs which would collide.
+
+    Arguments
+    ---------
+
+    recordings : List of (absolute path, relative path) tuples.
+
+    Returns
+    -------
+
+    rec_ids : List of (recording ID, absolute path, SRT file name) tuples,
+    sorted by recording ID.
+    '''
+    rec_ids = []
+    used_ids = set()
+    for file_path, rel_path in recordings:
+        stem = os.path.splitext(rel_path)[0]
+        base_id = _invalid_id_chars_re.sub('_', stem.replace(os.sep, '-'))
+        rec_id, suffix, count = base_id, '', 1
+        while rec_id in used_ids:
+            count += 1
+            suffix = '_%d' % count
+            rec_id = base_id + suffix
+        used_ids.add(rec_id)
+        rec_ids.append((rec_id, file_path, stem + suffix + '.srt'))
+    # Kaldi expects C-locale order, which is the order of (ASCII) strings
+    return sorted(rec_ids)
+
+
+def make_data_dir(data_dir_path, rec_ids):
+    ''' Writes a Kaldi data directory with one utterance (and speaker) per
+    recording. Any previous content of the directory is removed. '''
+    if os.path.isdir(data_dir_path):
+        shutil.rmtree(data_dir_path)
+    os.makedirs(data_dir_path)
+    with open(os.path.join(data_dir_path, 'wav.scp'), 'w') as wav_scp_file:
+        for rec_id, file_path, _ in rec_ids:
+            if re.search(r'\s', file_path):
+                wav_scp_file.write('%s cat %s |\n' % (rec_id,
+                    shlex.quote(file_path)))
+            else:
+                wav_scp_file.write('%s %s\n' % (rec_id, file_path))
+    for file_name in ['utt2spk', 'spk2utt']:
+        with open(os.path.join(data_dir_path, file_name), 'w') as f:
+            f.writelines('%s %s\n' % (rec_id, rec_id) for rec_id, _, _ in
+                rec_ids)
+
+
+def run_kaldi(command, cwd, input_text=None, echo=True):
+    ''' Runs a command in the Kaldi recipe directory, with its cmd.sh and
+    path.sh sourced, and optionally a string as its standard input. '''
+    if echo:
+        print(command)
+    subprocess.run(['bash', '-c', '. ./cmd.sh && . ./path.sh && ' + command],
+        cwd=cwd, input=None if input_text is None else input_text.encode(
+        'utf-8'), check=True)
+
+
+def read_scp(scp_file_path):
+    ''' Reads a Kaldi script file into a dictionary mapping keys to the rest
+    of their lines. '''
+    scp = dict()
+    with open(scp_file_path, 'r') as scp_file:
+        for line in scp_file:
+            key, _, rxfilename = line.strip().partition(' ')
+            scp[key] = rxfilename
+    return scp
+
+
+def make_feats(data_dir, nj, eg_dir_path, feat_dir_path, cmvn=True):
+    ''' Computes the MFCC features (and CMVN statistics) of a data
+    directory. '''
+    name = os.path.basename(data_dir)
+    run_kaldi('steps/make_mfcc.sh --nj %d --cmd "$train_cmd" --mfcc-config '
+        '%s %s exp/make_mfcc/%s %s' % (nj, MFCC_CONFIG, data_dir, name,
+        feat_dir_path), eg_dir_path)
+    if cmvn:
+        run_kaldi('steps/compute_cmvn_stats.sh %s exp/make_mfcc/%s %s' % (
+            data_dir, name, feat_dir_path), eg_dir_path)
+
+
+def extract_ivectors(data_dir, ivectors_dir, nj, eg_dir_path):
+    ''' Extracts the online i-vectors of a data directory. '''
+    run_kaldi('steps/online/nnet2/extract_ivectors_online.sh --cmd '
+        '"$train_cmd" --nj %d --ivector-period %d %s %s %s' % (nj,
+        IVECTOR_PERIOD, data_dir, IVECTOR_EXTRACTOR_DIR, ivectors_dir),
+        eg_dir_path)
+
+
+def _entry_scp_line(rec_id, entry_path, name):
+    ''' Returns a script file line pointing a recording to the object in the
+    archive of a cache entry. Every archive holds a single object, so its
+    offset does not depend on the recording ID. '''
+    with open(os.path.join(entry_path, name + '.scp'), 'r') as scp_file:
+        offset = scp_file.read().split()[1].rpartition(':')[2]
+    return '%s %s:%s\n' % (rec_id, os.path.join(entry_path, name + '.ark'),
+        offset)
+
+
+def _store_entries(commands, scp, tmp_entry_paths, nj, eg_dir_path):
+    ''' Runs a command for every recording computed for the cache, with its
+    script file line as the standard input and {entry} replaced with its
+    temporary entry directory. '''
+    def store(rec_id):
+        run_kaldi(commands.format(entry=shlex.quote(tmp_entry_paths[
+            rec_id])), eg_dir_path, '%s %s\n' % (rec_id, scp[rec_id]),
+            echo=False)
+
+    with ThreadPoolExecutor(nj) as pool:
+        list(pool.map(store, sorted(tmp_entry_paths)))
+
+
+def _fill_cache(cache, kind, rec_ids, keys, compute):
+    ''' Looks up the cache entries of a kind for a batch of recordings, and
+    computes the missing ones (once per key) with compute(missing rec_ids,
+    dictionary mapping recording IDs to temporary entry directories).
+
+    Returns
+    -------
+
+    entry_paths : Dictionary mapping recording IDs to entry directories.
+    '''
+    entry_paths = dict()
+    missing = []
+    for rec in rec_ids:
+        key = keys[rec[0]]
+        if key in entry_paths:
+            continue
+        entry_paths[key] = cache.lookup(kind, key)
+        if entry_paths[key] is None:
+            missing.append(rec)
+    if missing:
+        print('Computing %s of %d recordings (%d cached).' % (kind,
+            len(missing), len(entry_paths) - len(missing)))
+        tmp_entry_paths = dict((rec[0], cache.new_entry()) for rec in missing)
+        try:
+            compute(missing, tmp_entry_paths)
+            for rec_id, tmp_entry_path in tmp_entry_paths.items():
+                entry_paths[keys[rec_id]] = cache.add(keys[rec_id],
+                    tmp_entry_path)
+        finally:
+            for tmp_entry_path in tmp_entry_paths.values():
+                if os.path.isdir(tmp_entry_path):
+                    shutil.rmtree(tmp_entry_path)
+    return dict((rec[0], entry_paths[keys[rec[0]]]) for rec in rec_ids)
+
+
+def cached_front_end(rec_ids, cache, data_dir, ivectors_dir, nj, eg_dir_path,
+    feat_dir_path):
+    ''' Fills a data directory and an i-vector directory from the feature
+    cache, computing and caching the features, CMVN statistics and i-vectors
+    of the recordings which are not cached
+
+    Features are keyed by the content of the audio and the MFCC
+    configuration, and i-vectors by the features and the i-vector extractor,
+    so a new i-vector extractor reuses the cached features. Every recording
+    is its own speaker, so its CMVN statistics only depend on its features.
+
+    Arguments
+    ---------
+
+    rec_ids : List of (recording ID, path, SRT file name) tuples.
+
+    cache : FeatureCache object.
+
+    data_dir, ivectors_dir : Data and i-vector directories to write,
+    relative to the recipe directory.
+
+    nj : Maximum number of parallel jobs.
+
+    eg_dir_path : Path to the recipe directory.
+
+    feat_dir_path : Directory to extract the features of the recordings which
+    are not cached to, before they are moved to the cache.
+    '''
+    uncached_data_dir = data_dir + '_uncached'
+    feats_config = cache.hash_path(os.path.join(eg_dir_path, MFCC_CONFIG))
+    ivectors_config = '%s %d' % (cache.hash_path(os.path.join(eg_dir_path,
+        IVECTOR_EXTRACTOR_DIR)), IVECTOR_PERIOD)
+    feats_keys = dict((rec_id, cache.key('feats', cache.hash_path(
+        file_path), feats_config)) for rec_id, file_path, _ in rec_ids)
+    ivectors_keys = dict((rec_id, cache.key('ivectors', key,
+        ivectors_config)) for rec_id, key in feats_keys.items())
+
+    def compute_feats(missing, tmp_entry_paths):
+        make_data_dir(os.path.join(eg_dir_path, uncached_data_dir), missing)
+        make_feats(uncached_data_dir, min(nj, len(missing)), eg_dir_path,
+            feat_dir_path, cmvn=False)
+        scp = read_scp(os.path.join(eg_dir_path, uncached_data_dir,
+            'feats.scp'))
+        _store_entries('copy-feats scp:- ark,scp:{entry}/feats.ark,'
+            '{entry}/feats.scp && compute-cmvn-stats scp:{entry}/feats.scp '
+            'ark,scp:{entry}/cmvn.ark,{entry}/cmvn.scp', scp, tmp_entry_paths,
+            nj, eg_dir_path)
+        # The cache holds a copy of the features
+        for ark_file_path in set(rxfilename.rpartition(':')[0] for rxfilename
+            in scp.values()):
+            os.remove(os.path.join(eg_dir_path, ark_file_path))
+
+    def write_feats_scps(data_dir_path, recs):
+        for name in ['feats', 'cmvn']:
+            with open(os.path.join(data_dir_path, name + '.scp'), 'w') as f:
+                f.writelines(_entry_scp_line(rec[0], feats_entries[rec[0]],
+                    name) for rec in recs)
+
+    def compute_ivectors(missing, tmp_entry_paths):
+        uncached_ivectors_dir = ivectors_dir + '_uncached'
+        data_dir_path = os.path.join(eg_dir_path, uncached_data_dir)
+        make_data_dir(data_dir_path, missing)
+        write_feats_scps(data_dir_path, missing)
+        extract_ivectors(uncached_data_dir, uncached_ivectors_dir, min(nj,
+            len(missing)), eg_dir_path)
+        scp = read_scp(os.path.join(eg_dir_path, uncached_ivectors_dir,
+            'ivector_online.scp'))
+        _store_entries('copy-feats scp:- ark,scp:{entry}/ivector_online.ark,'
+            '{entry}/ivector_online.scp', scp, tmp_entry_paths, nj,
+            eg_dir_path)
+        shutil.rmtree(os.path.join(eg_dir_path, uncached_ivectors_dir))
+
+    feats_entries = _fill_cache(cache, 'feats', rec_ids, feats_keys,
+        compute_feats)
+    ivectors_entries = _fill_cache(cache, 'ivectors', rec_ids, ivectors_keys,
+        compute_ivectors)
+    if os.path.isdir(os.path.join(eg_dir_path, uncached_data_dir)):
+        shutil.rmtree(os.path.join(eg_dir_path, uncached_data_dir))
+
+    # Point the data and i-vector directories of the batch to the cache
+    data_dir_path = os.path.join(eg_dir_path, data_dir)
+    make_data_dir(data_dir_path, rec_ids)
+    write_feats_scps(data_dir_path, rec_ids)
+    ivectors_dir_path = os.path.join(eg_dir_path, ivectors_dir)
+    if os.path.isdir(ivectors_dir_path):
+        shutil.rmtree(ivectors_dir_path)
+    os.makedirs(ivectors_dir_path)
+    with open(os.path.join(ivectors_dir_path, 'ivector_online.scp'),
+        'w') as scp_file:
+        scp_file.writelines(_entry_scp_line(rec_id, ivectors_entries[rec_id],
+            'ivector_online') for rec_id, _, _ in rec_ids)
+    with open(os.path.join(ivectors_dir_path, 'ivector_period'), 'w') as f:
+        f.write('%d\n' % IVECTOR_PERIOD)
+    # Checked by decode.sh against the model's i-vector extractor
+    ie_id_file_path = os.path.join(eg_dir_path, IVECTOR_EXTRACTOR_DIR,
+        'final.ie.id')
+    if os.path.exists(ie_id_file_path):
+        shutil.copy(ie_id_file_path, ivectors_dir_path)
+
+
+def recognize(rec_ids, output_dir_path, conf, nj,
+    batch_name=BATCH_NAME, model_dir=MODEL_DIR, cache=None, formats=('srt',)):
+    ''' Runs the ASR pipeline on a batch of recordings
+
+    Arguments
+    ---------
+
+    rec_ids : List of (recording ID, path, SRT file name) tuples from
+    assign_rec_ids.
+
+    output_dir_path : Directory to write the SRT files to.
+
+    conf : Configuration dictionary from read_conf.
+
+    nj : Number of parallel jobs (at most the number of recordings).
+
+    batch_name : Name of the data, feature and decoding directories.
+
+    model_dir : Model directory, relative to the recipe directory.
+
+    cache : FeatureCache object to take features and i-vectors from, or None
+    to compute them for every recording.
+
+    formats : Subtitle formats to write, among 'srt', 'vtt' and 'json'.
+    '''
+    eg_dir_path = os.path.join(conf['kaldi_dir'], EG_DIR)
+    feat_dir_path = os.path.abspath(conf['feat_dir'])
+    output_dir_path = os.path.abspath(output_dir_path)
+    nj = max(1, min(nj, len(rec_ids)))
+    data_dir = 'data/%s' % batch_name
+    ivectors_dir = 'exp/ivectors_%s' % batch_name
+    decode_dir = '%s/decode_%s' % (model_dir, batch_name)
+
+    # Extract features and i-vectors
+    if cache is not None:
+        cached_front_end(rec_ids, cache, data_dir, ivectors_dir, nj,
+            eg_dir_path, feat_dir_path)
+    else:
+        make_data_dir(os.path.join(eg_dir_path, data_dir), rec_ids)
+        make_feats(data_dir, nj, eg_dir_path, feat_dir_path)
+        extract_ivectors(data_dir, ivectors_dir, nj, eg_dir_path)
+
+    # Decode
+    run_kaldi('steps/nnet3/decode.sh --nj %d --cmd "$decode_cmd" '
+        '--online-ivector-dir %s %s/graph %s %s' % (nj, ivectors_dir,
+        model_dir, data_dir, decode_dir), eg_dir_path)
+
+    # Convert the lattices of all jobs to CTM through pipes, writing the
+    # subtitles of the recordings as their CTM is complete
+    symbol_table = get_symbol_table(os.path.join(eg_dir_path, model_dir,
+        'graph', 'words.txt'), 'buckwalter', 'unicode')
+    srt_file_names = dict((rec_id, srt_file_name) for rec_id, _,
+        srt_file_name in rec_ids)
+    lattices2srt(decode_dir, output_dir_path, symbol_table, eg_dir_path,
+        srt_file_names, os.path.join(eg_dir_path, decode_dir, 'output.ctm'),
+        formats, nj=nj)
+
+    # Recordings without any recognized word get empty subtitles
+    for rec_id in srt_file_names:
+        for output_format in formats:
+            file_path = subtitle_file_path(output_dir_path, rec_id,
+                output_format, srt_file_names)
+            if not os.path.exists(file_path):
+                if not os.path.isdir(os.path.dirname(file_path)):
+                    os.makedirs(os.path.dirname(file_path))
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    f.write(empty_document(output_format, rec_id))
+
+    if cache is not None:
+        size = cache.evict()
+        print('Feature cache (%s):' % cache.cache_dir_path)
+        print(cache.report(size))
+
+
+def main():
+    args = parse_args()
+    try:
+        conf = read_conf(args['conf'])
+        recordings = find_recordings(args['inputs'], args['recursive'],
+            args['extensions'].split(','))
+    except (IOError, ValueError) as e:
+        print('Error: %s' % e)
+        exit(1)
+    if not os.path.isdir(conf['kaldi_dir']):
+        print('Error: Cannot find Kaldi directory %s.' % conf['kaldi_dir'])
+        exit(1)
+    if recordings == []:
+        print('Error: No files to recognize were found.')
+        exit(1)
+
+    formats = args['formats'].split(',')
+    for output_format in formats:
+        if output_format not in FORMATS:
+            print('Error: Unknown subtitle format %s.' % output_format)
+            exit(1)
+    rec_ids = assign_rec_ids(recordings)
+    print('Recognizing %d recordings.' % len(rec_ids))
+    cache = None if args['no_cache'] else FeatureCache(conf['cache_dir'],
+        args['cache_size'])
+    try:
+        recognize(rec_ids, args['output_dir'], conf, args['nj'] or
+            cpu_count(), args['batch_name'], args['model_dir'], cache,
+            formats)
+    except subprocess.CalledProcessError as e:
+        print('Error: Command failed with exit status %d.' % e.returncode)
+        exit(1)
+    except IOError as e:
+        print('Error: %s' % e)
+        exit(1)
+    print('Subtitles were written to %s.' % args['output_dir'])
+
+
+if __name__ == '__main__':
+    main()
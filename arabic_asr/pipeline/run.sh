@@ -9,13 +9,22 @@ display_usage() {
     echo "e.g.: run.sh -f data/1.wav"
     echo "main options (please specify exactly one option, unless otherwise" \
 	"specified):"
+    echo "  --cache-size        # size limit of the feature cache in GB"
+    echo "                      # (default is 50)."
     echo "  --conf              # configuration file containing the Kaldi"
     echo "                      # directory's path and the feature files"
     echo "                      # destination."
     echo "  -d|--dir            # directory containing wave files to perform"
     echo "                      # recognition on."
     echo "  -f|--file           # wave file to perform recognition on."
+    echo "  --formats           # comma-separated subtitle formats to write,"
+    echo "                      # among srt, vtt and json (default is srt)."
     echo "  -h|--help           # Display help"
+    echo "  -j|--nj             # number of parallel jobs (default is the"
+    echo "                      # number of CPUs)."
+    echo "  --no-cache          # compute features and i-vectors without the"
+    echo "                      # feature cache."
+    echo "  -o|--output         # directory to write the SRT files to."
     echo "  -r                  # find files recursively inside the directory"
     echo "                      # specified (only used when -d is used)."
     echo "Configuration file format:"
@@ -27,89 +36,21 @@ display_usage() {
     echo "                      # the script runs as if it is already inside"
     echo "                      # the Kaldi directory)."
     echo "  feat_dir            # Path to the directory to extract features to"
-    echo "                      # Default is ./mfcc"
+    echo "                      # Default is ./feats"
+    echo "  cache_dir           # Path to the directory caching the features"
+    echo "                      # and i-vectors of recordings by content."
+    echo "                      # Default is ./cache"
 
 }
 
-parse_conf() {
-    # If no configuration file is specified, use default configuration file
-    if [ $# -eq 0 ]; then
-        conf_file_path=config
-    else
-        conf_file_path=$1
-    fi
-    
-    if [ ! -f $conf_file_path ]; then
-        echo "Error: Cannot find configuration file: $conf_file_path"
-        exit 1
-    fi
-
-    # Parse configurations
-    while IFS='=' read -r var val || [[ -n "$var" ]]; do
-        case $var in
-            kaldi_dir)
-                kaldi_dir=$val
-                ;;
-            feat_dir)
-                feat_dir=$val
-                ;;
-            *)
-                echo "Error: Unknown configuration file option $var."
-                exit 1
-                ;;
-        esac
-        # if [ -n "$var $val" ]; then
-        #     break
-        # fi
-    done < $conf_file_path
-
-    # Process left-out configurations
-    [ -n $kaldi_dir ] || [ $kaldi_dir != "" ] || [ kaldi_dir='.' ]
-    [ -n $feat_dir ] || feat_dir='feats'
-
-    [ -d $kaldi_dir ] || { echo "Cannot find Kaldi directory $kaldi_dir";
-        exit 1; }
-
-    echo "Using Kaldi dir at: $kaldi_dir"
-    echo "Dumping features to: $feat_dir"
-}
-
-make_data_dir_from_file() {
-    file_path=$1
-    if [ ! -f $file_path ]; then
-        echo "Error: Cannot find specified file: $file_path"
-        exit 1
-    fi
-    data_dir='data/recs'
-    [ -d $data_dir ] || mkdir $data_dir
-    echo "rec $file_path" > $data_dir/wav.scp
-    echo "rec rec" > $data_dir/utt2spk
-    utils/utt2spk_to_spk2utt.pl $data_dir/utt2spk > $data_dir/spk2utt
-}
-
-make_data_dir_from_dir() {
-    dir_path=$1
-    if [ ! -d $dir_path ]; then
-        echo "Error: Cannot find specified directory: $dir_path"
-        exit 1
-    fi
-    file_paths=$(find $dir_path -name '*.wav')
-    data_dir='data/recs'
-    [ -d $data_dir ] || mkdir $data_dir
-    echo "" > $data_dir/wav.scp
-    echo "" > $data_dir/utt2spk
-    for file_count in ${!file_paths[@]}; do
-        file_path=${file_path[$file_count]}
-        echo "rec_$file_count $file_path" >> $data_dir/wav.scp
-        echo "rec_$file_count rec_$file_count" >> $data_dir/utt2spk
-    done
-    utils/utt2spk_to_spk2utt.pl $data_dir/utt2spk > $data_dir/spk2utt
-}
-
 # Script starts here
 
-nj=1
+nj=
 recursive=0
+no_cache=0
+cache_size=
+formats=
+inputs=()
 
 if [ $# -eq 0 ]; then
     display_usage
@@ -125,7 +66,7 @@ while [ $# -gt 0 ]; do
         -f|--file)
             shift
             if [ $# -gt 0 ]; then
-                file_path=$1
+                inputs+=("$1")
             else
                 echo "Error: No file specified."
                 exit 1
@@ -135,7 +76,7 @@ while [ $# -gt 0 ]; do
         -d|--dir)
             shift
             if [ $# -gt 0 ]; then
-                dir_path=$1
+                inputs+=("$1")
             else
                 echo "Error: No directory specified."
                 exit 1
@@ -146,6 +87,30 @@ while [ $# -gt 0 ]; do
             recursive=1
             shift
             ;;
+        -j|--nj)
+            shift
+            nj=$1
+            shift
+            ;;
+        --formats)
+            shift
+            formats=$1
+            shift
+            ;;
+        --no-cache)
+            no_cache=1
+            shift
+            ;;
+        --cache-size)
+            shift
+            cache_size=$1
+            shift
+            ;;
+        --conf)
+            shift
+            conf_path=$1
+            shift
+            ;;
         -o|--output)
 	    shift
             output_dir=$1
@@ -159,51 +124,23 @@ while [ $# -gt 0 ]; do
     esac
 done
 
-if [ -z $output_dir ]; then
+if [ -z "$output_dir" ]; then
     echo "Error: No output directory specified. Please specify an output" \
     "directory through -o."
     exit 1
 fi
-[ -d $output_dir ] || mkdir -p $output_dir || exit 1
-
-# Define the model to use
-eg_dir=egs/gale_arabic_2
-model_dir=exp/nnet3/tdnn
-
-# Read configuration
-if [ -n $conf_path ]; then
-    parse_conf $conf_path
-else
-    parse_conf
-fi
-
-# Produce a data directory from the specified files
-cd $kaldi_dir/$eg_dir/s5
-echo "Changed dir to $kaldi_dir/$eg_dir/s5"
-. ./cmd.sh
-. ./path.sh
-if [ -n file_path ]; then
-    make_data_dir_from_file $file_path
-elif [ -n dir_path ]; then
-    make_data_dir_from_dir $dir_path
-else
-    echo "Error: No files specified. Please specify a file through -f or a "
+if [ ${#inputs[@]} -eq 0 ]; then
+    echo "Error: No files specified. Please specify a file through -f or a" \
         "directory through -d."
+    exit 1
 fi
 
-# Extract features and i-vectors
-#steps/make_mfcc.sh --nj $nj --cmd "$train_cmd" $data_dir \
-#    exp/make_mfcc/rec $feat_dir || exit 1;
-#steps/compute_cmvn_stats.sh $data_dir exp/make_mfcc/rec $feat_dir || exit 1;
-#steps/online/nnet2/extract_ivectors_online.sh --cmd "$train_cmd" \
-#  --nj 1 $data_dir exp/ivector_extractor exp/ivectors_rec || exit 1;
-
-# Decode
-#steps/nnet3/decode.sh --nj 1 --cmd "$decode_cmd" --online-ivector-dir \
-#    exp/ivectors_rec $model_dir/graph $data_dir $model_dir/decode
-
-# Produce ctm from lattice
-lattice-copy ark:"gunzip -c $model_dir/decode/lat.1.gz |" \
-    ark,t:$model_dir/decode/lat.1
-lattice-to-ctm-conf ark:$model_dir/decode/lat.1 output.ctm
-python utils/ctm2srt.py output.ctm $output_dir data/lang/words.txt
+# Build a data directory with one recording per file, decode it in parallel
+# jobs and write one SRT file per recording
+driver_args=(-o "$output_dir" --conf "${conf_path:-config}")
+[ $recursive -eq 1 ] && driver_args+=(-r)
+[ -n "$nj" ] && driver_args+=(--nj $nj)
+[ $no_cache -eq 1 ] && driver_args+=(--no-cache)
+[ -n "$cache_size" ] && driver_args+=(--cache-size $cache_size)
+[ -n "$formats" ] && driver_args+=(--formats "$formats")
+python "$(dirname "$0")/recognize.py" "${driver_args[@]}" "${inputs[@]}"
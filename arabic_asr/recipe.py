@@ -0,0 +1,315 @@
+#: Title : recipe.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : The stages of run.sh declared as a DAG, run by
+#    utils/stage_runner.py so that stages whose commands and inputs have not
+#    changed are skipped and independent stages run concurrently
+#: Arguments :
+#  Names of the stages to bring up to date [optional, default is all]
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    'utils'))
+from stage_runner import Stage, StageRunner
+
+__author__ = "Ahmed Ismail"
+__license__ = "GPL"
+__version__ = "1.0"
+__email__ = "ahmed.ismail.zahran@gmail.com"
+__status__ = "Development"
+
+
+# Sourced before every stage. Commands refer to $nj and $mfccdir, so
+# changing them does not invalidate completed stages.
+preamble = '''. ./cmd.sh
+. ./path_custom.sh > /dev/null
+. ./path.sh
+nj=16
+mfccdir="/home/aiz2/Zahran/gale_arabic/feats/mfcc"
+'''
+
+whole_dir = 'data/whole'
+train_dir = 'data/train'
+train_dir_cleaned = 'data/train_cleaned'
+train_dir_10000 = 'data/train_10000'
+train_dir_vp = 'data/train_vp'
+train_dir_vp_sp = 'data/train_vp_sp'
+train_dir_vp_sp_20 = 'data/train_dir_speed_pert_20'
+test_dir = 'data/test'
+lang_dir = 'data/lang'
+mgb3_adapt_dir = 'data/mgb3_adapt.20170322'
+mgb3_dev_dir = 'data/mgb3_dev.20170322'
+
+
+def data(data_dir):
+    ''' Input files of a data directory. '''
+    return [os.path.join(data_dir, file_name) for file_name in ['wav.scp',
+        'segments', 'text', 'utt2spk', 'spk2utt']]
+
+
+def feats(data_dir):
+    ''' Input files of a data directory with features. '''
+    return data(data_dir) + [os.path.join(data_dir, file_name) for file_name
+        in ['feats.scp', 'cmvn.scp']]
+
+
+def lang(with_g=False):
+    ''' Input files of the lang directory. '''
+    paths = [os.path.join(lang_dir, path) for path in ['L.fst',
+        'L_disambig.fst', 'words.txt', 'phones.txt', 'oov.int', 'topo',
+        'phones']]
+    if with_g:
+        paths.append(os.path.join(lang_dir, 'G.fst'))
+    return paths
+
+
+def model(exp_dir):
+    ''' Input files of a trained model. '''
+    return [os.path.join(exp_dir, file_name) for file_name in ['final.mdl',
+        'tree']]
+
+
+def cmvn_stage(name, data_dir):
+    ''' Stage computing the CMVN stats of a data directory. '''
+    return Stage('cmvn_' + name, 'steps/compute_cmvn_stats.sh %s '
+        'exp/make_mfcc/%s $mfccdir' % (data_dir, name), inputs=data(data_dir)
+        + [data_dir + '/feats.scp'], outputs=[data_dir + '/cmvn.scp'])
+
+
+def feats_stages(name, data_dir):
+    ''' Stages extracting the MFCC's and CMVN stats of a data directory. '''
+    return [Stage('mfcc_' + name, 'steps/make_mfcc.sh --nj $nj --cmd '
+        '"$train_cmd" %s exp/make_mfcc/%s $mfccdir' % (data_dir, name),
+        inputs=data(data_dir) + ['conf/mfcc.conf'],
+        outputs=[data_dir + '/feats.scp']), cmvn_stage(name, data_dir)]
+
+
+def align_stage(name, align_script, data_dir, exp_dir):
+    ''' Stage aligning a data directory with a model into exp/<name>. '''
+    return Stage(name, 'steps/%s.sh --nj $nj --cmd "$train_cmd" %s %s %s '
+        'exp/%s' % (align_script, data_dir, lang_dir, exp_dir, name),
+        inputs=feats(data_dir) + lang() + model(exp_dir),
+        outputs=['exp/' + name])
+
+
+def gmm_stages(name, train_command, leaves_gauss, data_dir, ali_dir,
+    decode=True):
+    ''' Stages training a GMM into exp/<name> and, if decode is True,
+    building its graph and decoding the test set with it. '''
+    exp_dir = 'exp/' + name
+    stages = [Stage(name, '%s --cmd "$train_cmd" %s %s %s %s %s' % (
+        train_command, leaves_gauss, data_dir, lang_dir, ali_dir, exp_dir),
+        inputs=feats(data_dir) + lang() + [ali_dir], outputs=[exp_dir])]
+    if decode:
+        stages += [
+            Stage(name + '_graph', 'utils/mkgraph.sh %s %s %s/graph' % (
+                lang_dir, exp_dir, exp_dir), inputs=lang(True) + model(
+                exp_dir), outputs=[exp_dir + '/graph']),
+            Stage(name + '_decode', 'steps/decode.sh --nj $nj --cmd '
+                '"$decode_cmd" %s/graph %s %s/decode' % (exp_dir, test_dir,
+                exp_dir), inputs=[exp_dir + '/graph'] + feats(test_dir) +
+                model(exp_dir), outputs=[exp_dir + '/decode'])]
+    return stages
+
+
+def recipe_stages():
+    ''' Returns the stages of the recipe, in the order of run.sh. '''
+    stages = []
+
+    # ============= Feature extraction =============
+    stages += [
+        Stage('whole_spk2utt', 'utils/utt2spk_to_spk2utt.pl %s/utt2spk > '
+            '%s/spk2utt' % (whole_dir, whole_dir),
+            inputs=[whole_dir + '/utt2spk'], outputs=[whole_dir +
+            '/spk2utt']),
+        Stage('mfcc_whole', 'steps/make_mfcc.sh --nj $nj --cmd "$train_cmd" '
+            '%s exp/make_mfcc/whole $mfccdir' % whole_dir,
+            inputs=data(whole_dir) + ['conf/mfcc.conf'],
+            outputs=[whole_dir + '/feats.scp']),
+        # Select the test speakers such that they form about 15% of the
+        # whole data set
+        Stage('test_split', 'num_utts=$(< %s/segments wc -l)\n'
+            'num_utts_test=$(awk "BEGIN{printf \\"%%d\\n\\",${num_utts}*0.15}")'
+            '\nutils/subset_data_dir.sh --speakers %s $num_utts_test %s' % (
+            whole_dir, whole_dir, test_dir), inputs=data(whole_dir) +
+            [whole_dir + '/feats.scp'], outputs=[test_dir]),
+        # Remove the test speakers from the training set
+        Stage('train_split', 'rm -rf %s\ncp -r %s %s\n'
+            'python utils/remove_test_speakers.py %s %s' % (train_dir,
+            whole_dir, train_dir, train_dir, test_dir),
+            inputs=data(whole_dir) + [whole_dir + '/feats.scp', test_dir +
+            '/utt2spk'], outputs=[train_dir]),
+        cmvn_stage('train', train_dir),
+        # Select 10,000 shortest utterances in the training set. The
+        # directory is copied, so it waits for cmvn.scp to be written.
+        Stage('train_10000', 'utils/subset_data_dir.sh --shortest %s 10000 '
+            '%s' % (train_dir, train_dir_10000), inputs=data(train_dir) +
+            [train_dir + '/feats.scp'], outputs=[train_dir_10000],
+            after=['cmvn_train']),
+        cmvn_stage('test', test_dir),
+        cmvn_stage('train_10000', train_dir_10000)]
+
+    # ============= Language model =============
+    stages += [
+        Stage('lang', 'rm -rf data/local/lang %s data/local/dict/lexiconp.txt'
+            '\nutils/prepare_lang.sh data/local/dict "<UNK>" data/local/lang '
+            '%s' % (lang_dir, lang_dir), inputs=['data/local/dict'],
+            outputs=[lang_dir, 'data/local/lang',
+            'data/local/dict/lexiconp.txt']),
+        Stage('lm_text', 'python utils/prepare_lm_text.py %s/text '
+            '--varikn-corpus %s/text_variKN --varikn-vocab '
+            'data/local/vocab.txt --lexicon data/local/dict/lexicon.txt' % (
+            train_dir, train_dir), inputs=[train_dir + '/text',
+            'data/local/dict/lexicon.txt'], outputs=[train_dir +
+            '/text_variKN', 'data/local/vocab.txt']),
+        Stage('lm', 'steps/produce_n_gram_lm.sh %s/text_variKN '
+            'data/local/vocab.txt data/local/lm_n_gram.arpa' % train_dir,
+            inputs=[train_dir + '/text_variKN', 'data/local/vocab.txt'],
+            outputs=['data/local/lm_n_gram.arpa']),
+        Stage('g_fst', 'python utils/filter_arpa.py --vocab %s/words.txt '
+            'data/local/lm_n_gram.arpa data/local/lm_n_gram.filtered.arpa\n'
+            'arpa2fst --disambig-symbol=#0 --read-symbol-table=%s/words.txt '
+            'data/local/lm_n_gram.filtered.arpa %s/G.fst' % (lang_dir,
+            lang_dir, lang_dir), inputs=['data/local/lm_n_gram.arpa',
+            lang_dir + '/words.txt'], outputs=[lang_dir + '/G.fst',
+            'data/local/lm_n_gram.filtered.arpa'])]
+
+    # ============= Monophone model =============
+    stages += [
+        Stage('mono', 'steps/train_mono.sh --nj $nj --cmd "$train_cmd" %s %s '
+            'exp/mono' % (train_dir_10000, lang_dir), inputs=feats(
+            train_dir_10000) + lang(), outputs=['exp/mono']),
+        Stage('mono_graph', 'utils/mkgraph.sh %s exp/mono exp/mono/graph' %
+            lang_dir, inputs=lang(True) + model('exp/mono'),
+            outputs=['exp/mono/graph']),
+        Stage('mono_decode', 'steps/decode.sh --nj $nj --cmd "$decode_cmd" '
+            'exp/mono/graph %s exp/mono/decode' % test_dir,
+            inputs=['exp/mono/graph'] + feats(test_dir) + model('exp/mono'),
+            outputs=['exp/mono/decode']),
+        align_stage('mono_ali', 'align_si', train_dir_10000, 'exp/mono')]
+
+    # ============= Tri-phone models =============
+    stages += gmm_stages('tri1', 'steps/train_deltas.sh', '2000 15000',
+        train_dir, 'exp/mono_ali')
+    stages.append(align_stage('tri1_ali', 'align_si', train_dir, 'exp/tri1'))
+    stages += gmm_stages('tri2a', 'steps/train_lda_mllt.sh --splice-opts '
+        '"--left-context=3 --right-context=3"', '2500 15000', train_dir,
+        'exp/tri1_ali')
+    stages.append(align_stage('tri2a_ali', 'align_si', train_dir,
+        'exp/tri2a'))
+    stages += gmm_stages('tri2b', 'steps/train_sat.sh', '4200 40000',
+        train_dir, 'exp/tri2a_ali', decode=False)
+    stages.append(align_stage('tri2b_ali', 'align_si', train_dir,
+        'exp/tri2b'))
+
+    # ============= Cleaning and segmenting =============
+    stages += [
+        Stage('cleanup', 'steps/cleanup/clean_and_segment_data.sh %s %s '
+            'exp/tri2b exp/tri2b_cleanup %s' % (train_dir, lang_dir,
+            train_dir_cleaned), inputs=feats(train_dir) + lang() +
+            model('exp/tri2b'), outputs=['exp/tri2b_cleanup',
+            train_dir_cleaned])]
+
+    # ============= i-vector and TDNN training =============
+    stages += [cmvn_stage('train_cleaned', train_dir_cleaned),
+        align_stage('tri2b_cleanup_ali', 'align_fmllr', train_dir_cleaned,
+        'exp/tri2b')]
+    stages += gmm_stages('tri3a', 'steps/train_sat.sh', '4200 40000',
+        train_dir_cleaned, 'exp/tri2b_cleanup_ali', decode=False)
+    stages += [
+        # Perform volume and speed perturbation (after cmvn_train, since the
+        # training directory is copied)
+        Stage('perturb', 'rm -rf %s\ncp -r %s %s\n'
+            'utils/data/perturb_data_dir_volume.sh %s\n'
+            'utils/data/perturb_data_dir_speed_3way.sh %s %s' % (
+            train_dir_vp, train_dir, train_dir_vp, train_dir_vp,
+            train_dir_vp, train_dir_vp_sp), inputs=data(train_dir),
+            outputs=[train_dir_vp, train_dir_vp_sp], after=['cmvn_train'])]
+    stages += feats_stages('train_vp_sp', train_dir_vp_sp)
+    stages.append(align_stage('tri3a_ali', 'align_fmllr', train_dir_vp_sp,
+        'exp/tri3a'))
+    stages += gmm_stages('tri3b', 'steps/train_lda_mllt.sh', '2500 15000',
+        train_dir_vp_sp, 'exp/tri3a_ali', decode=False)
+    stages += [
+        # Extract a 20% subset of the training data for the universal
+        # background model
+        Stage('ubm_subset', 'num_utts=$(< %s/segments wc -l)\n'
+            'num_utts_20=$(awk "BEGIN{printf \\"%%d\\n\\",${num_utts}*0.2}")'
+            '\nutils/subset_data_dir.sh %s $num_utts_20 %s' % (
+            train_dir_vp_sp, train_dir_vp_sp, train_dir_vp_sp_20),
+            inputs=feats(train_dir_vp_sp), outputs=[train_dir_vp_sp_20]),
+        Stage('diag_ubm', 'steps/online/nnet2/train_diag_ubm.sh %s 1024 '
+            'exp/tri3b exp/diag_ubm' % train_dir_vp_sp_20,
+            inputs=feats(train_dir_vp_sp_20) + model('exp/tri3b'),
+            outputs=['exp/diag_ubm']),
+        Stage('ivector_extractor', 'steps/online/nnet2/'
+            'train_ivector_extractor.sh --cmd "$train_cmd" --nj 1 '
+            '--ivector-dim 1000 %s exp/diag_ubm exp/ivector_extractor' %
+            train_dir_vp_sp, inputs=feats(train_dir_vp_sp) +
+            ['exp/diag_ubm'], outputs=['exp/ivector_extractor'])]
+    for name, data_dir in [('train', train_dir_vp_sp), ('test', test_dir)]:
+        stages.append(Stage('ivectors_' + name, 'steps/online/nnet2/'
+            'extract_ivectors_online.sh --cmd "$train_cmd" --nj 2 %s '
+            'exp/ivector_extractor exp/ivectors_%s' % (data_dir, name),
+            inputs=feats(data_dir) + ['exp/ivector_extractor'],
+            outputs=['exp/ivectors_' + name]))
+    stages += [
+        Stage('tdnn', 'local/nnet3/run_tdnn.sh %s exp/ivectors_train %s '
+            'exp/tri3a exp/tri3a_ali exp/nnet3/tdnn' % (train_dir_vp_sp,
+            lang_dir), inputs=feats(train_dir_vp_sp) + lang(True) +
+            ['exp/ivectors_train', 'exp/tri3a_ali', 'local/nnet3/run_tdnn.sh']
+            + model('exp/tri3a'), outputs=['exp/nnet3/tdnn'])]
+
+    # ============= MGB-3 data =============
+    for name, data_dir in [('mgb3_adapt.20170322', mgb3_adapt_dir),
+        ('mgb3_dev.20170322', mgb3_dev_dir)]:
+        stages.append(Stage('spk2utt_' + name, 'utils/utt2spk_to_spk2utt.pl '
+            '%s/utt2spk > %s/spk2utt' % (data_dir, data_dir),
+            inputs=[data_dir + '/utt2spk'], outputs=[data_dir + '/spk2utt']))
+        stages += feats_stages(name, data_dir)
+    return stages
+
+
+def main():
+    ''' Run the stages of the recipe which are not up to date.
+    '''
+    arg_parser = argparse.ArgumentParser(description=('Run the stages of the '
+        'training recipe, skipping stages whose commands and inputs have not '
+        'changed since they last completed.'))
+    arg_parser.add_argument('targets', type=str, nargs='*',
+        help=('Stages to bring up to date, along with the stages they depend '
+        'on. Default is all stages.'))
+    arg_parser.add_argument('--force', type=str, action='append', default=[],
+        help='Run a stage (and the stages depending on it) even if it is up '
+        'to date. Can be repeated.')
+    arg_parser.add_argument('--max-parallel', dest='max_parallel', type=int,
+        default=2, help='Maximum number of stages run at a time. Default is '
+        '2.')
+    arg_parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+        help='Report which stages would run without running them.')
+    arg_parser.add_argument('--list', action='store_true',
+        help='List the stages and their dependencies.')
+    args = vars(arg_parser.parse_args())
+
+    runner = StageRunner(recipe_stages(), preamble,
+        max_parallel=args['max_parallel'])
+    if args['list']:
+        for stage in runner.stages:
+            print('%s: %s' % (stage.name, ' '.join(sorted(
+                runner.deps[stage.name]))))
+        return
+    try:
+        statuses = runner.run(args['targets'], args['force'],
+            args['dry_run'])
+    except ValueError as e:
+        print(e)
+        exit(1)
+    if any(status in ['failed', 'not run'] for status in statuses.values()):
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -42,18 +42,14 @@ num_utts_test=$(awk "BEGIN{printf \"%d\n\",${num_utts}*0.15}")
 utils/subset_data_dir.sh --speakers $whole_dir $num_utts_test $test_dir \
     || exit 1
 
-# Remove the test speakers from the training set and run Kaldi's
-# fix_data_dir
+# Remove the test speakers from the training set (every file of the
+# directory is filtered, so Kaldi's fix_data_dir is not needed)
 if [ -d $train_dir ]; then
     rm -r $train_dir
 fi
 cp -r $whole_dir $train_dir
 python utils/remove_test_speakers.py $train_dir $test_dir || exit 1
 
-# Remove extra utterances in any files with Kaldi's fix_data_dir
-utils/spk2utt_to_utt2spk.pl $train_dir/utt2spk > $train_dir/spk2utt || exit 1
-utils/fix_data_dir.sh $train_dir || exit 1
-
 # Select 10,000 shortest utterances in the training set and use them to
 # train a monophone GMM
 utils/subset_data_dir.sh --shortest $train_dir 10000 $train_dir_10000 || exit 1
@@ -80,19 +76,25 @@ fi
 utils/prepare_lang.sh data/local/dict "<UNK>" data/local/lang $lang_dir \
     || exit 1
 
-# Transform Kaldi corpus to the format used by variKN
-python utils/Kaldi_text2variKN_corpus.py data/train/text \
-    data/train/text_variKN || exit 1
+# Transform Kaldi corpus and lexicon to the formats used by variKN in one
+# pass over the corpus
+python utils/prepare_lm_text.py data/train/text \
+    --varikn-corpus data/train/text_variKN \
+    --varikn-vocab data/local/vocab.txt \
+    --lexicon data/local/dict/lexicon.txt || exit 1
 
 # Use variKN to produce Kneser-Ney smoothed n-gram model
-python utils/Kaldi_lex2variKN_vocab.py data/local/dict/lexicon.txt \
-    data/local/vocab.txt || exit 1
 steps/produce_n_gram_lm.sh data/train/text_variKN data/local/vocab.txt \
     data/local/lm_n_gram.arpa || exit 1
 
+# Remove n-grams with words outside the lexicon from the model, so they do
+# not end up in G.fst
+python utils/filter_arpa.py --vocab $lang_dir/words.txt \
+    data/local/lm_n_gram.arpa data/local/lm_n_gram.filtered.arpa || exit 1
+
 # Use arpa to produce G.fst
 arpa2fst --disambig-symbol=#0 --read-symbol-table=$lang_dir/words.txt \
-    data/local/lm_n_gram.arpa $lang_dir/G.fst || exit 1
+    data/local/lm_n_gram.filtered.arpa $lang_dir/G.fst || exit 1
 
 
 # ============= Monophone model =============
@@ -2,7 +2,8 @@
 #: Title : produce_n_gram_lm.sh
 #: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
 #: Version : 1.0
-#: Description : Produce n-gram language model from VariKN text file.
+#: Description : Produce n-gram language model from VariKN text file, after
+#    removing duplicate sentences.
 #: Arguments :
 #  1- Path to VariKN corpus
 #  2- Destination of the produced model
@@ -16,5 +17,13 @@ fi
 corpus_path=$1
 model_path=$2
 
+# Remove duplicate sentences (e.g. repeated broadcast boilerplate) from the
+# corpus, keeping the first occurrences in their original order
+dedup_corpus_path=$(dirname $model_path)/$(basename $corpus_path).dedup
+python utils/dedup_sentences.py --keep-order $corpus_path \
+    $dedup_corpus_path || exit 1
+
 # Use VariKN to train a Kneser-Ney smoothed model from the corpus
-$VariKN_bin/varigram_kn -a -D 0.001 -C -E 0.25 $corpus_path $model_path
+$VariKN_bin/varigram_kn -a -D 0.001 -C -E 0.25 $dedup_corpus_path \
+    $model_path || exit 1
+rm $dedup_corpus_path
@@ -0,0 +1,45 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    os.pardir, 'utils'))
+import symbol_table
+from symbol_table import FLAG_SPECIAL, FLAG_UNK, compile_words
+
+
+def test_bracketed_buckwalter_words_are_transliterated():
+    # <qr> is a real word (alef with hamza below, qaf, reh, alef with hamza
+    # above), not a special symbol
+    table = compile_words(['<eps>', '<UNK>', '<qr>', '>mr', '!SIL', '#0',
+        '#12', '<s>', '</s>'])
+    assert table.words[2] == u'إقرأ'
+    assert table.words[3] == u'أمر'
+    assert table.flags[2] == 0 and table.flags[3] == 0
+    assert table.decode([2, 3]) == [u'إقرأ',
+        u'أمر']
+    for word_id in [0, 4, 5, 6, 7, 8]:
+        assert table.flags[word_id] == FLAG_SPECIAL
+    assert table.flags[1] == FLAG_SPECIAL | FLAG_UNK
+
+
+def test_configured_unk_symbol():
+    table = compile_words(['<eps>', '<unk>', '<UNK>'], unk_symbol='<unk>')
+    assert table.flags[1] == FLAG_SPECIAL | FLAG_UNK
+    assert table.flags[2] == 0
+
+
+def test_cached_table_matches_compiled_table(tmp_path):
+    words_file_path = tmp_path / 'words.txt'
+    words_file_path.write_text('<eps> 0\n<UNK> 1\n<qr> 2\n#0 3\n')
+    table = symbol_table.get_symbol_table(str(words_file_path),
+        cache_dir_path=str(tmp_path / 'cache'))
+    assert table.file_path is not None
+    assert table.words[2] == u'إقرأ'
+    assert table.decode([0, 1, 2, 3], skip_flags=FLAG_SPECIAL) == [
+        u'إقرأ']
+
+
+def test_ids_outside_the_table_are_missing():
+    table = compile_words(['<eps>', '<UNK>', '<qr>'])
+    assert table.decode([2, 3, 1000, -1]) == [u'إقرأ']
+    assert table.decode([2, 3], skip_flags=FLAG_UNK) == [u'إقرأ', None]
@@ -1,18 +1,18 @@
 #: Title : ctm2srt.py
 #: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
 #: Version : 1.0
-#: Description : Produce SRT files from a CTM file
+#: Description : Produce SRT files (or WebVTT and JSON subtitles) from a CTM
+#    file
 #: Arguments :
 #  1- Path to CTM file
 #  2- Destination of SRT files
 #  3- Path to Kaldi words file
 
 import argparse
-import codecs
-import os
-from collections import defaultdict
-from datetime import timedelta
-from transliteration import transliterate
+from itertools import groupby
+from ctm_index import (DURATION, FORMATS, format_timestamps, load_ctm,
+    write_subtitles, write_subtitles_stream)
+from symbol_table import get_symbol_table
 
 __author__ = "Ahmed Ismail"
 __license__ = "GPL"
@@ -33,64 +33,159 @@ def parse_args():
     ctm_file_path_help = 'Path to the CTM file.'
     srt_dir_path_help = 'Destination of the SRT directory.'
     words_file_path_help = 'Path to the Kaldi words file.'
+    formats_help = ('Comma-separated subtitle formats to write, among %s. '
+        'Default is srt.' % ', '.join(FORMATS))
+    duration_help = ('Number of seconds covered by a subtitle. Default is '
+        '%d.' % DURATION)
+    symbol_table_cache_help = ('Directory where compiled symbol tables are '
+        'cached. Default is a .symbol_tables directory next to the words '
+        'file.')
+    nj_help = ('Number of workers rendering and writing subtitle files in '
+        'parallel. Default is 1.')
+    executor_help = ('Type of the workers: thread or process. Default is '
+        'thread.')
+    whole_file_help = ('Load the whole CTM file into memory and index it at '
+        'once, instead of streaming it recording by recording. Faster when '
+        'the CTM file fits in memory.')
     # Parse arguments
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument('ctm_file_path', type=str, help=ctm_file_path_help)
     arg_parser.add_argument('srt_dir_path', type= str, help=srt_dir_path_help)
     arg_parser.add_argument('words_file_path', type= str,
         help=words_file_path_help)
+    arg_parser.add_argument('--formats', type=str, default='srt',
+        help=formats_help)
+    arg_parser.add_argument('--duration', type=float, default=DURATION,
+        help=duration_help)
+    arg_parser.add_argument('--symbol-table-cache', dest='symbol_table_cache',
+        type=str, default=None, help=symbol_table_cache_help)
+    arg_parser.add_argument('--nj', type=int, default=1, help=nj_help)
+    arg_parser.add_argument('--executor', type=str, default='thread',
+        choices=['thread', 'process'], help=executor_help)
+    arg_parser.add_argument('--whole-file', dest='whole_file',
+        action='store_true', help=whole_file_help)
     args = vars(arg_parser.parse_args())
+    if args['nj'] < 1:
+        arg_parser.error('--nj must be positive.')
     return args
 
 
-def make_word_map(words_file_path):
-    word_map = dict()
-    with codecs.open(words_file_path, 'r') as words_file:
-        try:
-            for line in words_file:
-                word, word_num = line.strip().split()
-                word_map[word_num] = word
-        except Exception:
-            print(('Word file is not in specified format. Each line '
-                'should be in the form: <word> <word_number>'))
-            exit(1)
-    return word_map
-
-
-def word_nums2words(line, word_map):
-    line = ' '.join([word_map[word_num] for word_num in line.split()
-        if word_map[word_num] != '<UNK>'])
-    return line
-
-
-def format_time(time):
-    time_sec_frac = int(round(time - int(time), 3) * 1000)
-    time_sec = timedelta(seconds=int(time))
-    return str(time_sec) + ',' + str(time_sec_frac).zfill(3)
-
-
-def print_st(srt_file, index, lines, word_map, input_format=None,
-    output_format=None):
-    output = str(index + 1) + '\n'
-    start_time = format_time(lines[0]['start_time'])
-    end_time = format_time(lines[-1]['start_time'] +
-                        lines[-1]['duration'])
-    output += start_time + ' --> ' + end_time + '\n'
-    st = ' '.join([line['word_num'] for line in lines])
-    st = word_nums2words(st, word_map)
-    if input_format != None and output_format != None:
-        st_trans = transliterate(st, input_format, output_format)
-    elif input_format == None and output_format != None:
-        raise Exception('Input format not specified.')
-    elif input_format != None and output_format == None:
-        raise Exception('Output format not specified.')
-    output += st_trans + '\n\n'
-    try:
-        srt_file.write(output)
-    except Exception:
-        print('Could not process the following string:')
-        print(st)
-        exit(1)
+def print_st(srt_file, index, start_time, end_time, text):
+    ''' Writes one subtitle in the SRT format
+
+    This is the format ctm_index renders the SRT files of whole recordings
+    in.
+
+    Arguments
+    ---------
+
+    srt_file : File object of the SRT file.
+
+    index : Integer specifying the number of the subtitle in its recording,
+    counted from 0.
+
+    start_time, end_time : Times the subtitle spans, in seconds.
+
+    text : String of the words of the subtitle.
+    '''
+    start_time, end_time = format_timestamps([start_time, end_time])
+    srt_file.write(str(index + 1) + '\n' + start_time + ' --> ' + end_time +
+        '\n' + text + '\n\n')
+
+
+def iter_recordings(ctm_file):
+    ''' Iterates over the recordings of a CTM file one at a time
+
+    CTM files written by Kaldi are grouped by recording, so only the lines of
+    the current recording are kept in memory.
+
+    Arguments
+    ---------
+
+    ctm_file : File object of the CTM file.
+
+    Yields
+    ------
+
+    recording : Tuple of the recording ID and the list of its CTM lines, each
+    split into fields.
+    '''
+    seen_utt_ids = set()
+    lines = (line.strip().split() for line in ctm_file)
+    for utt_id, utt_lines in groupby((line for line in lines if line != []),
+        key=lambda line: line[0]):
+        if utt_id in seen_utt_ids:
+            raise Exception(('CTM file is not grouped by recording: lines of '
+                '%s are not contiguous. Sort the CTM file first.') % utt_id)
+        seen_utt_ids.add(utt_id)
+        yield utt_id, list(utt_lines)
+
+
+def write_srts(recordings, srt_dir_path, symbol_table, formats=('srt',),
+    duration=DURATION, srt_file_names=None, nj=1, executor='thread'):
+    ''' Writes the subtitle files of a stream of recordings
+
+    Recordings are indexed and written in batches by a pool of workers (see
+    ctm_index.write_subtitles_stream), so only a bounded number of
+    recordings is held in memory.
+
+    Arguments
+    ---------
+
+    recordings : Iterable of (recording ID, list of CTM lines split into
+    fields) tuples, e.g. from iter_recordings.
+
+    srt_dir_path : String specifying the destination of the subtitle files.
+
+    symbol_table : SymbolTable object decoding the word IDs.
+
+    formats : Subtitle formats to write, among 'srt', 'vtt' and 'json'.
+
+    duration : Number of seconds covered by a subtitle.
+
+    srt_file_names : Dictionary mapping recording IDs to SRT file paths
+    relative to srt_dir_path (other formats replace the extension). Default
+    is to name SRT files by recording ID, and other files by recording ID and
+    format.
+
+    nj : Integer specifying the number of workers. Default is 1.
+
+    executor : String specifying the type of the workers, 'thread' or
+    'process'. Default is 'thread'.
+
+    Returns
+    -------
+
+    num_recordings : Integer specifying the number of recordings written.
+    '''
+    return write_subtitles_stream(recordings, srt_dir_path, symbol_table,
+        formats, duration, srt_file_names, nj=nj, executor=executor)
+
+
+def ctm2srt(ctm_file_path, srt_dir_path, symbol_table, formats=('srt',),
+    duration=DURATION, srt_file_names=None, nj=1, executor='thread',
+    whole_file=False):
+    ''' Writes the subtitle files of every recording of a CTM file
+
+    The CTM file is streamed recording by recording, relying on Kaldi writing
+    it grouped by recording.
+
+    Arguments
+    ---------
+
+    ctm_file_path : String specifying the path to the CTM file.
+
+    whole_file : Boolean specifying whether to load the whole CTM file into
+    memory and index it at once instead. Default is False.
+
+    Other arguments and the return value are those of write_srts.
+    '''
+    if whole_file:
+        return write_subtitles(load_ctm(ctm_file_path), srt_dir_path,
+            symbol_table, formats, duration, srt_file_names)
+    with open(ctm_file_path, 'r', encoding='utf-8') as ctm_file:
+        return write_srts(iter_recordings(ctm_file), srt_dir_path,
+            symbol_table, formats, duration, srt_file_names, nj, executor)
 
 
 def main():
@@ -101,36 +196,22 @@ def main():
     input_format = 'buckwalter'
     output_format = 'unicode'
 
-    word_map = make_word_map(words_file_path)
-
-    duration = 5
-    start_time = 0
-    lines = []
-    index = 0
-    utterances = defaultdict(list)
-    with codecs.open(ctm_file_path, 'r') as ctm_file:
-        for line in ctm_file:
-            line = line.strip().split()
-            utterances[line[0]].append(line)
-    
-    for utt_id in utterances:
-        srt_file_path = os.path.join(srt_dir_path, utt_id)
-        srt_file = codecs.open(srt_file_path, 'w', 'utf-8')
-        for line in utterances[utt_id]:
-            line = {'utt_id': line[0], 'channel': line[1],
-                    'start_time': float(line[2]),
-                    'duration': float(line[3]), 'word_num': line[4],
-                    'confidence': float(line[5])}
-            if line['start_time'] >= start_time + duration:
-                if lines != []:
-                    print_st(srt_file, index, lines, word_map,
-                            input_format, output_format)
-                    index += 1
-                lines = [line]
-                start_time += duration
-            else:
-                lines.append(line)
-        srt_file.close()
+    # Decode word numbers through the compiled, transliterated symbol table,
+    # so no transliteration is needed per subtitle
+    symbol_table = get_symbol_table(words_file_path, input_format,
+        output_format, args['symbol_table_cache'])
+
+    formats = args['formats'].split(',')
+    for subtitle_format in formats:
+        if subtitle_format not in FORMATS:
+            print('Unknown subtitle format %s.' % subtitle_format)
+            exit(1)
+    # The CTM file is streamed by recording, and batches of recordings are
+    # indexed, windowed and formatted by the workers
+    ctm2srt(ctm_file_path, srt_dir_path, symbol_table, formats,
+        args['duration'], nj=args['nj'], executor=args['executor'],
+        whole_file=args['whole_file'])
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,475 @@
+#: Title : ctm_index.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : Columnar CTM index, with vectorized subtitle windowing and
+#    timestamp formatting, and SRT, WebVTT and JSON output (used by
+#    ctm2srt.py)
+
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+import numpy as np
+from symbol_table import FLAG_MISSING, FLAG_UNK
+
+__author__ = "Ahmed Ismail"
+__license__ = "GPL"
+__version__ = "1.0"
+__email__ = "ahmed.ismail.zahran@gmail.com"
+__status__ = "Development"
+
+
+# Number of seconds covered by a subtitle
+DURATION = 5
+FORMATS = ['srt', 'vtt', 'json']
+# Number of words indexed at a time when writing a stream of recordings
+BATCH_WORDS = 1 << 16
+# Words left out of subtitles (<UNK> and IDs missing from the words file)
+SKIP_FLAGS = FLAG_UNK | FLAG_MISSING
+
+
+class CtmIndex(object):
+    ''' Columnar CTM
+
+    Every field of the words is an array. Words are grouped by recording, in
+    the order the recordings first appear, and sorted by start time within
+    each recording.
+    '''
+
+    def __init__(self, rec_ids, rec_codes, start, duration, word_ids,
+        confidence):
+        ''' Creates an index from grouped and sorted columns
+
+        Arguments
+        ---------
+
+        rec_ids : List of recording IDs.
+
+        rec_codes : Integer array of the recording (index in rec_ids) of
+        every word.
+
+        start, duration : Float arrays of the start times and durations of
+        the words, in seconds.
+
+        word_ids : Integer array of the word IDs.
+
+        confidence : Float array of the confidences of the words.
+        '''
+        self.rec_ids = rec_ids
+        self.rec_codes = rec_codes
+        self.start = start
+        self.duration = duration
+        self.word_ids = word_ids
+        self.confidence = confidence
+        # The words of recording i are rec_offsets[i]:rec_offsets[i + 1]
+        self.rec_offsets = np.searchsorted(rec_codes, np.arange(len(rec_ids) +
+            1))
+
+    def __len__(self):
+        return len(self.start)
+
+
+def index_fields(fields):
+    ''' Builds a CtmIndex from a 2D array of CTM fields (bytes or strings):
+    recording ID, channel, start time, duration, word ID and optionally
+    confidence. '''
+    if fields.shape[0] == 0:
+        return CtmIndex([], np.zeros(0, np.int64), np.zeros(0), np.zeros(0),
+            np.zeros(0, np.int64), np.zeros(0, np.float32))
+    if fields.shape[1] not in [5, 6]:
+        raise ValueError('CTM lines should have 5 or 6 fields, not %d.' %
+            fields.shape[1])
+    # Code recordings in the order they first appear
+    rec_ids, first_rows, inverse = np.unique(fields[:, 0], return_index=True,
+        return_inverse=True)
+    order = np.argsort(first_rows, kind='stable')
+    ranks = np.empty(len(order), np.int64)
+    ranks[order] = np.arange(len(order))
+    rec_codes = ranks[inverse.ravel()]
+    start = fields[:, 2].astype(np.float64)
+    rows = np.lexsort((start, rec_codes))
+    fields = fields[rows]
+    rec_ids = [rec_id.decode('utf-8') if isinstance(rec_id, bytes) else
+        rec_id for rec_id in rec_ids[order].tolist()]
+    confidence = fields[:, 5].astype(np.float32) if fields.shape[1] == 6 \
+        else np.ones(len(fields), np.float32)
+    return CtmIndex(rec_ids, rec_codes[rows], start[rows],
+        fields[:, 3].astype(np.float64), fields[:, 4].astype(np.int64),
+        confidence)
+
+
+# Bytes split on by bytes.split()
+_whitespace = np.zeros(256, bool)
+_whitespace[list(b' \t\n\r\x0b\x0c')] = True
+
+
+def _line_field_counts(data):
+    ''' Returns the number of whitespace-separated fields of every line. '''
+    chars = np.frombuffer(data, np.uint8)
+    space = _whitespace[chars]
+    field_starts = ~space
+    field_starts[1:] &= space[:-1]
+    num_fields = np.cumsum(field_starts)
+    line_ends = np.flatnonzero(chars == ord('\n'))
+    if not data.endswith(b'\n'):
+        line_ends = np.append(line_ends, len(chars) - 1)
+    return np.diff(num_fields[line_ends], prepend=0)
+
+
+def parse_ctm(data):
+    ''' Builds a CtmIndex from the bytes of a CTM file. '''
+    tokens = data.split()
+    if tokens == []:
+        return index_fields(np.zeros((0, 6), 'S1'))
+    field_counts = _line_field_counts(data)
+    if not field_counts.all():
+        # Leave out blank lines
+        data = b'\n'.join(line for line in data.split(b'\n') if line.strip())
+        field_counts = _line_field_counts(data)
+    bad_lines = np.flatnonzero(field_counts != field_counts[0])
+    if len(bad_lines) > 0:
+        raise ValueError(('CTM lines do not all have the same number of '
+            'fields: line %d has %d fields, line 1 has %d.') % (
+            bad_lines[0] + 1, field_counts[bad_lines[0]], field_counts[0]))
+    return index_fields(np.array(tokens).reshape(len(field_counts), -1))
+
+
+def load_ctm(ctm_file_path):
+    ''' Loads a CTM file into a CtmIndex. '''
+    with open(ctm_file_path, 'rb') as ctm_file:
+        return parse_ctm(ctm_file.read())
+
+
+@lru_cache(maxsize=4)
+def _table_arrays(symbol_table):
+    return np.array(symbol_table.words, dtype=object), np.frombuffer(
+        bytes(symbol_table.flags), np.uint8)
+
+
+def _digits(values, width):
+    ''' Returns the zero-padded ASCII digits of non-negative integers as a
+    (len(values), width) array of bytes. '''
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    return (values[:, None] // powers % 10 + ord('0')).astype(np.uint8)
+
+
+def format_timestamps(seconds, decimal_mark=','):
+    ''' Formats times as HH:MM:SS,mmm (or HH:MM:SS.mmm for WebVTT)
+
+    Arguments
+    ---------
+
+    seconds : Array of times in seconds.
+
+    decimal_mark : Character separating the milliseconds.
+
+    Returns
+    -------
+
+    timestamps : Array of strings. Hours take more than two digits only when
+    needed.
+    '''
+    milliseconds = np.maximum(np.rint(np.asarray(seconds, np.float64) *
+        1000).astype(np.int64), 0)
+    hours, milliseconds = np.divmod(milliseconds, 3600000)
+    minutes, milliseconds = np.divmod(milliseconds, 60000)
+    secs, milliseconds = np.divmod(milliseconds, 1000)
+    hour_width = max(2, len(str(hours.max()))) if len(hours) else 2
+    chars = np.empty((len(hours), hour_width + 10), np.uint8)
+    chars[:, :hour_width] = _digits(hours, hour_width)
+    chars[:, hour_width] = ord(':')
+    chars[:, hour_width + 1:hour_width + 3] = _digits(minutes, 2)
+    chars[:, hour_width + 3] = ord(':')
+    chars[:, hour_width + 4:hour_width + 6] = _digits(secs, 2)
+    chars[:, hour_width + 6] = ord(decimal_mark)
+    chars[:, hour_width + 7:] = _digits(milliseconds, 3)
+    return chars.view('S%d' % chars.shape[1]).ravel().astype('U')
+
+
+def _join_words(words, subtitle_ids, num_subtitles):
+    ''' Joins words into the texts of their subtitles in a single string
+    join. Subtitle IDs are non-decreasing, and subtitles without words get
+    empty texts. '''
+    if len(words) == 0:
+        return [''] * num_subtitles
+    # Separators are a space within a subtitle, and a newline per subtitle
+    # boundary crossed
+    gaps = np.diff(subtitle_ids)
+    parts = np.empty(2 * len(words) + 1, object)
+    parts[0] = '\n' * subtitle_ids[0]
+    parts[1::2] = words
+    if len(gaps) > 0:
+        separators = np.char.multiply('\n', gaps).astype(object)
+        separators[gaps == 0] = ' '
+        parts[2:-1:2] = separators
+    parts[-1] = '\n' * (num_subtitles - 1 - subtitle_ids[-1])
+    return ''.join(parts.tolist()).split('\n')
+
+
+class Subtitles(object):
+    ''' Subtitles of the recordings of a CtmIndex
+
+    A word belongs to the window of `duration` seconds its start time falls
+    in, counted from the start of its recording, and every non-empty window
+    is a subtitle. A subtitle spans from the start of its first word to the
+    end of its last word.
+    '''
+
+    def __init__(self, index, symbol_table, duration=DURATION,
+        skip_flags=SKIP_FLAGS):
+        ''' Computes the subtitles of an index
+
+        Arguments
+        ---------
+
+        index : CtmIndex object.
+
+        symbol_table : SymbolTable object decoding the word IDs.
+
+        duration : Number of seconds covered by a subtitle.
+
+        skip_flags : Words with any of these symbol flags are left out of
+        the subtitle texts.
+        '''
+        self.index = index
+        num_words = len(index)
+        windows = np.floor(index.start / duration).astype(np.int64)
+        is_first = np.ones(num_words, bool)
+        is_first[1:] = (index.rec_codes[1:] != index.rec_codes[:-1]) | (
+            windows[1:] != windows[:-1])
+        first_words = np.flatnonzero(is_first)
+        last_words = np.append(first_words[1:], num_words) - 1
+        self.subtitle_ids = np.cumsum(is_first) - 1
+        self.start = index.start[first_words]
+        self.end = index.start[last_words] + index.duration[last_words]
+        self.rec_codes = index.rec_codes[first_words]
+        self.rec_offsets = np.searchsorted(self.rec_codes, np.arange(len(
+            index.rec_ids) + 1))
+        self.numbers = np.arange(len(first_words)) - self.rec_offsets[
+            self.rec_codes] + 1
+
+        # Decode the word IDs, leaving out unknown and skipped words
+        table_words, table_flags = _table_arrays(symbol_table)
+        word_ids = index.word_ids
+        keep = (word_ids >= 0) & (word_ids < len(table_words))
+        keep[keep] = table_flags[word_ids[keep]] & skip_flags == 0
+        self.words = np.full(num_words, None, object)
+        self.words[keep] = table_words[word_ids[keep]]
+        self.texts = _join_words(self.words[keep], self.subtitle_ids[keep],
+            len(first_words))
+
+    def __len__(self):
+        return len(self.start)
+
+    def _render_blocks(self, output_format):
+        if output_format == 'srt':
+            blocks = [self.numbers.astype('U'), '\n', format_timestamps(
+                self.start), ' --> ', format_timestamps(self.end), '\n',
+                np.array(self.texts, dtype='U'), '\n\n']
+        elif output_format == 'vtt':
+            blocks = [format_timestamps(self.start, '.'), ' --> ',
+                format_timestamps(self.end, '.'), '\n', np.array(self.texts,
+                dtype='U'), '\n\n']
+        else:
+            raise ValueError('Unknown subtitle format %s.' % output_format)
+        rendered = blocks[0]
+        for block in blocks[1:]:
+            rendered = np.char.add(rendered, block)
+        return rendered.tolist()
+
+    def _json(self, rec):
+        subtitles = slice(self.rec_offsets[rec], self.rec_offsets[rec + 1])
+        words = slice(self.index.rec_offsets[rec], self.index.rec_offsets[
+            rec + 1])
+        return json.dumps({
+            'recording': self.index.rec_ids[rec],
+            'subtitles': [{'start': start, 'end': end, 'text': text} for
+                start, end, text in zip(np.round(self.start[subtitles],
+                3).tolist(), np.round(self.end[subtitles], 3).tolist(),
+                self.texts[subtitles])],
+            'words': {
+                'word': self.words[words].tolist(),
+                'word_id': self.index.word_ids[words].tolist(),
+                'start': np.round(self.index.start[words], 3).tolist(),
+                'duration': np.round(self.index.duration[words], 3).tolist(),
+                'confidence': np.round(self.index.confidence[words].astype(
+                    np.float64), 3).tolist(),
+                'subtitle': (self.numbers[self.subtitle_ids[words]]).tolist()
+            }}, ensure_ascii=False) + '\n'
+
+    def render(self, output_format):
+        ''' Renders the subtitles of every recording
+
+        Arguments
+        ---------
+
+        output_format : 'srt', 'vtt' or 'json'.
+
+        Returns
+        -------
+
+        documents : List of strings, the document of every recording, in the
+        order of index.rec_ids.
+        '''
+        if output_format == 'json':
+            return [self._json(rec) for rec in range(len(
+                self.index.rec_ids))]
+        blocks = self._render_blocks(output_format)
+        header = 'WEBVTT\n\n' if output_format == 'vtt' else ''
+        return [header + ''.join(blocks[self.rec_offsets[rec]:
+            self.rec_offsets[rec + 1]]) for rec in range(len(
+            self.index.rec_ids))]
+
+
+def empty_document(output_format, rec_id):
+    ''' Returns the document of a recording without words. '''
+    if output_format == 'json':
+        return json.dumps({'recording': rec_id, 'subtitles': [], 'words':
+            {'word': [], 'word_id': [], 'start': [], 'duration': [],
+            'confidence': [], 'subtitle': []}}) + '\n'
+    return 'WEBVTT\n\n' if output_format == 'vtt' else ''
+
+
+def subtitle_file_path(output_dir_path, rec_id, output_format,
+    file_names=None):
+    ''' Returns the path of the subtitle file of a recording
+
+    Arguments
+    ---------
+
+    output_dir_path : Destination of the subtitle files.
+
+    rec_id : Recording ID.
+
+    output_format : 'srt', 'vtt' or 'json', used as the extension.
+
+    file_names : Dictionary mapping recording IDs to file paths relative to
+    output_dir_path, whose extensions are replaced by the format. Default is
+    to name SRT files by recording ID, as ctm2srt always did, and files of
+    the other formats by recording ID and format.
+    '''
+    if file_names is not None:
+        base_name = os.path.splitext(file_names[rec_id])[0]
+    elif output_format == 'srt':
+        return os.path.join(output_dir_path, rec_id)
+    else:
+        base_name = rec_id
+    return os.path.join(output_dir_path, base_name + '.' + output_format)
+
+
+def write_subtitles(index, output_dir_path, symbol_table, formats=('srt',),
+    duration=DURATION, file_names=None):
+    ''' Writes the subtitle files of every recording of a CtmIndex
+
+    Arguments
+    ---------
+
+    index : CtmIndex object.
+
+    output_dir_path : Destination of the subtitle files.
+
+    symbol_table : SymbolTable object decoding the word IDs.
+
+    formats : Formats to write, among 'srt', 'vtt' and 'json'.
+
+    duration : Number of seconds covered by a subtitle.
+
+    file_names : See subtitle_file_path.
+
+    Returns
+    -------
+
+    num_recordings : Number of recordings written.
+    '''
+    subtitles = Subtitles(index, symbol_table, duration)
+    for output_format in formats:
+        documents = subtitles.render(output_format)
+        for rec_id, document in zip(index.rec_ids, documents):
+            file_path = subtitle_file_path(output_dir_path, rec_id,
+                output_format, file_names)
+            # Batches of a stream may be written concurrently
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, 'w', encoding='utf-8') as subtitle_file:
+                subtitle_file.write(document)
+    return len(index.rec_ids)
+
+
+def _write_batch(ctm_lines, output_dir_path, symbol_table, formats, duration,
+    file_names):
+    return write_subtitles(index_fields(np.array(ctm_lines)), output_dir_path,
+        symbol_table, formats, duration, file_names)
+
+
+# Symbol table and file names of a worker process, set once by the pool
+# initializer
+_worker_symbol_table = None
+_worker_file_names = None
+
+
+def _init_worker(symbol_table, file_names):
+    global _worker_symbol_table, _worker_file_names
+    _worker_symbol_table = symbol_table
+    _worker_file_names = file_names
+
+
+def _write_batch_in_worker(ctm_lines, output_dir_path, formats, duration):
+    return _write_batch(ctm_lines, output_dir_path, _worker_symbol_table,
+        formats, duration, _worker_file_names)
+
+
+def write_subtitles_stream(recordings, output_dir_path, symbol_table,
+    formats=('srt',), duration=DURATION, file_names=None,
+    batch_words=BATCH_WORDS, nj=1, executor='thread'):
+    ''' Writes the subtitle files of a stream of recordings
+
+    Recordings are gathered into batches of about batch_words words, which
+    are indexed, rendered and written by a pool of nj workers. At most 2 * nj
+    batches are held in memory at a time, so memory does not grow with the
+    length of the stream.
+
+    Arguments
+    ---------
+
+    recordings : Iterable of (recording ID, list of CTM lines split into
+    fields) tuples, e.g. from ctm2srt.iter_recordings.
+
+    batch_words : Number of words indexed at a time.
+
+    nj : Number of workers. Default is 1.
+
+    executor : Type of the workers, 'thread' or 'process'. Default is
+    'thread'.
+
+    Other arguments and the return value are those of write_subtitles.
+    '''
+    if executor == 'process':
+        pool = ProcessPoolExecutor(nj, initializer=_init_worker,
+            initargs=(symbol_table, file_names))
+        write = _write_batch_in_worker
+        args = (output_dir_path, formats, duration)
+    else:
+        pool = ThreadPoolExecutor(nj)
+        write = _write_batch
+        args = (output_dir_path, symbol_table, formats, duration, file_names)
+    pending = deque()
+    num_recordings = 0
+    batch = []
+    with pool:
+        for rec_id, ctm_lines in recordings:
+            for line in ctm_lines:
+                if len(line) != len(ctm_lines[0]):
+                    raise ValueError(('CTM lines of %s do not all have the '
+                        'same number of fields.') % rec_id)
+            batch.extend(ctm_lines)
+            if len(batch) >= batch_words:
+                pending.append(pool.submit(write, batch, *args))
+                batch = []
+                # Bound the number of batches waiting to be written
+                while len(pending) >= 2 * nj:
+                    num_recordings += pending.popleft().result()
+        if batch:
+            pending.append(pool.submit(write, batch, *args))
+        while pending:
+            num_recordings += pending.popleft().result()
+    return num_recordings
@@ -0,0 +1,357 @@
+#: Title : dedup_sentences.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : Remove duplicate sentences from a (variKN) corpus which may
+#    not fit in memory, by hashing sentences into partitions on disk and
+#    deduplicating every partition in memory
+#: Arguments :
+#  1- Path to the corpus ('-' for the standard input)
+#  2- Destination of the deduplicated corpus ('-' for the standard output)
+
+import argparse
+import heapq
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import zlib
+from prepare_lm_text import BLOCK_SIZE, open_stream
+
+__author__ = "Ahmed Ismail"
+__license__ = "GPL"
+__version__ = "1.0"
+__email__ = "ahmed.ismail.zahran@gmail.com"
+__status__ = "Development"
+
+
+# Default memory budget in MB
+MEMORY = 1024
+# Approximate memory used to deduplicate a byte of text in memory
+MEMORY_FACTOR = 4
+# Assumed compression ratio of compressed inputs, to estimate their size
+COMPRESSION_RATIO = 4
+# Partitions are all open at once, so their number is also kept well below
+# the limit of open files (see max_partitions)
+MAX_PARTITIONS = 256
+# File descriptors left for the rest of the process
+RESERVED_FILES = 64
+# Partitions larger than the memory budget are split again by another hash,
+# at most this many times
+MAX_SPLITS = 3
+PARTITION_BUFFER_SIZE = 1 << 16
+
+
+def _iter_lines(stream, block_size=BLOCK_SIZE):
+    ''' Reads newline-terminated lines in blocks. '''
+    while True:
+        lines = stream.readlines(block_size)
+        if not lines:
+            return
+        if not lines[-1].endswith(b'\n'):
+            lines[-1] += b'\n'
+        yield lines
+
+
+def estimate_size(file_path):
+    ''' Estimates the uncompressed size of a file, or returns None for the
+    standard input. '''
+    if file_path == '-':
+        return None
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        magic = f.read(6)
+    if magic.startswith(b'\x1f\x8b') or magic.startswith(b'\xfd7zXZ\x00'):
+        size *= COMPRESSION_RATIO
+    return size
+
+
+def max_partitions():
+    ''' Returns the largest number of partitions which can be open at once
+    within the soft limit of open files. '''
+    soft_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft_limit == resource.RLIM_INFINITY:
+        return MAX_PARTITIONS
+    return max(2, min(MAX_PARTITIONS, soft_limit - RESERVED_FILES))
+
+
+def _dedup_in_memory(input_file, output_file):
+    seen = set()
+    num_lines = 0
+    for lines in _iter_lines(input_file):
+        num_lines += len(lines)
+        unique_lines = []
+        for line in lines:
+            if line not in seen:
+                seen.add(line)
+                unique_lines.append(line)
+        output_file.write(b''.join(unique_lines))
+    return num_lines, len(seen)
+
+
+def _partition(input_file, partition_file_paths, keep_order):
+    ''' Writes every line to the partition given by its hash, prefixed with
+    its (hexadecimal) line number if the order is kept. '''
+    num_partitions = len(partition_file_paths)
+    partition_files = [open(path, 'wb', buffering=PARTITION_BUFFER_SIZE)
+        for path in partition_file_paths]
+    num_lines = 0
+    try:
+        for lines in _iter_lines(input_file):
+            for line in lines:
+                partition_file = partition_files[zlib.crc32(line) %
+                    num_partitions]
+                if keep_order:
+                    partition_file.write(b'%x\t' % num_lines)
+                partition_file.write(line)
+                num_lines += 1
+    finally:
+        for partition_file in partition_files:
+            partition_file.close()
+    return num_lines
+
+
+def _line(record, keep_order):
+    ''' Returns the line of a partition record. '''
+    return record[record.index(b'\t') + 1:] if keep_order else record
+
+
+def _split_partition(partition_file_path, num_partitions, seed, keep_order):
+    ''' Splits a partition into sub-partitions by a hash of its lines
+    seeded with seed, independent of the hash the partition was made with,
+    and returns their paths. Records keep their order within every
+    sub-partition. '''
+    sub_partition_file_paths = ['%s.%d' % (partition_file_path, i) for i in
+        range(num_partitions)]
+    sub_partition_files = [open(path, 'wb', buffering=PARTITION_BUFFER_SIZE)
+        for path in sub_partition_file_paths]
+    try:
+        with open(partition_file_path, 'rb') as partition_file:
+            for records in _iter_lines(partition_file):
+                for record in records:
+                    sub_partition_files[hash((seed, _line(record,
+                        keep_order))) % num_partitions].write(record)
+    finally:
+        for sub_partition_file in sub_partition_files:
+            sub_partition_file.close()
+    os.remove(partition_file_path)
+    return sub_partition_file_paths
+
+
+def _dedup_partition(partition_file_path, keep_order, memory=MEMORY,
+    oversized=None, num_splits=0):
+    ''' Deduplicates a partition in place and returns its number of unique
+    lines. Lines keep their order within the partition.
+
+    Partitions which do not fit in the memory budget (in MB) are split into
+    sub-partitions by another hash, which are deduplicated recursively and
+    put back together. The sizes of partitions which still do not fit after
+    MAX_SPLITS splits are appended to the oversized list.
+    '''
+    size = os.path.getsize(partition_file_path)
+    memory_bytes = memory << 20
+    if size * MEMORY_FACTOR > memory_bytes:
+        if num_splits < MAX_SPLITS:
+            return _dedup_split_partition(partition_file_path, keep_order,
+                memory, oversized, num_splits, size)
+        if oversized is not None:
+            oversized.append(size)
+    return _dedup_records(partition_file_path, keep_order)
+
+
+def _dedup_records(partition_file_path, keep_order):
+    ''' Deduplicates a partition in place, holding only its unique lines in
+    memory. '''
+    seen = set()
+    num_unique = 0
+    dedup_file_path = partition_file_path + '.dedup'
+    with open(partition_file_path, 'rb') as partition_file, \
+        open(dedup_file_path, 'wb') as dedup_file:
+        for records in _iter_lines(partition_file):
+            unique_records = []
+            for record in records:
+                line = _line(record, keep_order)
+                if line not in seen:
+                    seen.add(line)
+                    unique_records.append(record)
+            num_unique += len(unique_records)
+            dedup_file.write(b''.join(unique_records))
+    os.replace(dedup_file_path, partition_file_path)
+    return num_unique
+
+
+def _dedup_split_partition(partition_file_path, keep_order, memory,
+    oversized, num_splits, size):
+    num_partitions = max(2, min(max_partitions(), -(-size * MEMORY_FACTOR //
+        (memory << 20))))
+    sub_partition_file_paths = _split_partition(partition_file_path,
+        num_partitions, num_splits, keep_order)
+    try:
+        num_unique = 0
+        for sub_partition_file_path in sub_partition_file_paths:
+            # Lines which all hash together again are most likely the same
+            # line, which takes no memory to deduplicate, so they are not
+            # split further
+            if os.path.getsize(sub_partition_file_path) == size:
+                num_unique += _dedup_records(sub_partition_file_path,
+                    keep_order)
+            else:
+                num_unique += _dedup_partition(sub_partition_file_path,
+                    keep_order, memory, oversized, num_splits + 1)
+        # Put the sub-partitions back together, in line order if it is kept
+        sub_partition_files = [open(path, 'rb') for path in
+            sub_partition_file_paths]
+        try:
+            with open(partition_file_path, 'wb') as partition_file:
+                if keep_order:
+                    partition_file.writelines(heapq.merge(
+                        *sub_partition_files, key=_line_number))
+                else:
+                    for sub_partition_file in sub_partition_files:
+                        shutil.copyfileobj(sub_partition_file, partition_file)
+        finally:
+            for sub_partition_file in sub_partition_files:
+                sub_partition_file.close()
+    finally:
+        for sub_partition_file_path in sub_partition_file_paths:
+            if os.path.exists(sub_partition_file_path):
+                os.remove(sub_partition_file_path)
+    return num_unique
+
+
+def _line_number(record):
+    return int(record[:record.index(b'\t')], 16)
+
+
+def dedup_sentences(input_file_path, output_file_path, keep_order=False,
+    memory=MEMORY, tmp_dir_path=None, num_partitions=None):
+    ''' Removes duplicate sentences from a corpus with bounded memory
+
+    Corpora which fit in the memory budget are deduplicated in a single pass.
+    Larger corpora are split into partitions on disk by the hash of their
+    lines, so that duplicates end up in the same partition, and every
+    partition is deduplicated in memory.
+
+    Arguments
+    ---------
+
+    input_file_path : String specifying the path to the corpus (possibly
+    compressed), or '-' for the standard input.
+
+    output_file_path : Destination of the deduplicated corpus, or '-' for
+    the standard output.
+
+    keep_order : If True, the first occurrences of the sentences are written
+    in their original order, by merging the deduplicated partitions on line
+    numbers. Otherwise sentences are written partition by partition.
+
+    memory : Memory budget in MB.
+
+    tmp_dir_path : Directory for the partitions. Default is the directory of
+    the output.
+
+    num_partitions : Number of partitions. Default is to choose it from the
+    size of the input and the memory budget. It is capped by
+    max_partitions(), and partitions which still exceed the memory budget
+    are split again.
+
+    Returns
+    -------
+
+    num_lines : Number of lines read.
+
+    num_unique : Number of lines written.
+    '''
+    size = estimate_size(input_file_path)
+    memory_bytes = memory << 20
+    with open_stream(input_file_path, 'rb') as input_file, \
+        open_stream(output_file_path, 'wb') as output_file:
+        limit = max_partitions()
+        if num_partitions is None:
+            if size is not None and size * MEMORY_FACTOR <= memory_bytes:
+                return _dedup_in_memory(input_file, output_file)
+            # The size of the standard input is unknown, so it gets the
+            # largest number of partitions
+            num_partitions = limit if size is None else -(-size *
+                MEMORY_FACTOR // memory_bytes)
+        num_partitions = max(2, min(limit, num_partitions))
+
+        if tmp_dir_path is None:
+            tmp_dir_path = os.path.dirname(os.path.abspath(output_file_path))
+        partitions_dir_path = tempfile.mkdtemp(prefix='dedup.',
+            dir=tmp_dir_path)
+        try:
+            partition_file_paths = [os.path.join(partitions_dir_path, str(i))
+                for i in range(num_partitions)]
+            num_lines = _partition(input_file, partition_file_paths,
+                keep_order)
+            num_unique = 0
+            oversized = []
+            for partition_file_path in partition_file_paths:
+                num_unique += _dedup_partition(partition_file_path,
+                    keep_order, memory, oversized)
+                if not keep_order:
+                    with open(partition_file_path, 'rb') as partition_file:
+                        shutil.copyfileobj(partition_file, output_file)
+                    os.remove(partition_file_path)
+
+            # Merge the deduplicated partitions on line numbers
+            if keep_order:
+                partition_files = [open(path, 'rb') for path in
+                    partition_file_paths]
+                try:
+                    for record in heapq.merge(*partition_files,
+                        key=_line_number):
+                        output_file.write(record[record.index(b'\t') + 1:])
+                finally:
+                    for partition_file in partition_files:
+                        partition_file.close()
+        finally:
+            shutil.rmtree(partitions_dir_path)
+    if oversized:
+        print(('Warning: %d partitions (up to %.1f MB) did not fit in the '
+            'memory budget of %d MB after %d splits.') % (len(oversized),
+            max(oversized) / float(1 << 20), memory, MAX_SPLITS),
+            file=sys.stderr)
+    return num_lines, num_unique
+
+
+def main():
+    ''' Remove duplicate sentences from a corpus.
+    '''
+    arg_parser = argparse.ArgumentParser(description=('Remove duplicate '
+        'sentences from a corpus (e.g. a variKN corpus), using partitions on '
+        'disk for corpora larger than the memory budget.'))
+    arg_parser.add_argument('input_corpus', type=str,
+        help='Path to the corpus (- for the standard input).')
+    arg_parser.add_argument('output_corpus', type=str,
+        help=('Path to output file to save the deduplicated corpus (- for '
+        'the standard output).'))
+    arg_parser.add_argument('--keep-order', dest='keep_order',
+        action='store_true', help=('Keep the first occurrences of the '
+        'sentences in their original order.'))
+    arg_parser.add_argument('--memory', type=int, default=MEMORY,
+        help='Memory budget in MB. Default is %d.' % MEMORY)
+    arg_parser.add_argument('--tmp-dir', dest='tmp_dir', type=str,
+        help=('Directory for the partitions. Default is the directory of '
+        'the output.'))
+    arg_parser.add_argument('--partitions', type=int, default=None,
+        help=('Number of partitions (at most %d). Default is to choose it '
+        'from the size of the input and the memory budget.' %
+        MAX_PARTITIONS))
+    args = vars(arg_parser.parse_args())
+
+    if args['input_corpus'] != '-' and not os.path.exists(
+        args['input_corpus']):
+        print('Could not find corpus in specified location: %s.' %
+            args['input_corpus'])
+        exit(1)
+    num_lines, num_unique = dedup_sentences(args['input_corpus'],
+        args['output_corpus'], args['keep_order'], args['memory'],
+        args['tmp_dir'], args['partitions'])
+    print('%d duplicate sentences were removed (%d of %d sentences kept).' %
+        (num_lines - num_unique, num_unique, num_lines), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+#: Title : filter_arpa.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : Filter an ARPA language model to a vocabulary and prune
+#    low-probability n-grams, streaming the model section by section
+#: Arguments :
+#  1- Path to the ARPA model
+#  2- Destination of the filtered ARPA model
+#  Options --vocab (e.g. data/lang/words.txt) and --prune-threshold.
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+from prepare_lm_text import SENTENCE_END, SENTENCE_START, open_stream
+
+__author__ = "Ahmed Ismail"
+__license__ = "GPL"
+__version__ = "1.0"
+__email__ = "ahmed.ismail.zahran@gmail.com"
+__status__ = "Development"
+
+
+_count_re = re.compile(rb'^ngram\s+(\d+)\s*=\s*(\d+)\s*$')
+_section_re = re.compile(rb'^\\(\d+)-grams:\s*$')
+
+
+def read_vocab(vocab_file_path):
+    ''' Reads a set of bytes words from the first column of a file (e.g. a
+    Kaldi words.txt). <s> and </s> are always included. '''
+    vocab = set([SENTENCE_START, SENTENCE_END])
+    with open_stream(vocab_file_path, 'rb') as vocab_file:
+        for line in vocab_file:
+            fields = line.split(None, 1)
+            if fields:
+                vocab.add(fields[0])
+    return vocab
+
+
+def _read_header(arpa_file):
+    ''' Reads the \\data\\ section and returns the n-gram counts by order. '''
+    counts = dict()
+    for line in arpa_file:
+        line = line.strip()
+        if line == b'\\data\\' or line == b'':
+            if counts and line == b'':
+                break
+            continue
+        match = _count_re.match(line)
+        if match is None:
+            raise ValueError('Unexpected line in \\data\\ section of ARPA '
+                'model: %r.' % line)
+        counts[int(match.group(1))] = int(match.group(2))
+    if not counts:
+        raise ValueError('ARPA model has no \\data\\ section.')
+    return counts
+
+
+def _iter_sections(arpa_file):
+    ''' Yields (order, iterator of n-gram lines) for each section of the
+    model. Each iterator must be consumed before the next section. '''
+    line = arpa_file.readline()
+    while line:
+        stripped = line.strip()
+        match = _section_re.match(stripped)
+        if match is not None:
+            order = int(match.group(1))
+            pending = []
+
+            def section_lines():
+                for line in arpa_file:
+                    if line.startswith(b'\\'):
+                        pending.append(line)
+                        return
+                    if line.strip():
+                        yield line
+
+            yield order, section_lines()
+            line = pending[0] if pending else arpa_file.readline()
+        elif stripped == b'\\end\\':
+            return
+        elif stripped == b'':
+            line = arpa_file.readline()
+        else:
+            raise ValueError('Unexpected line in ARPA model: %r.' % stripped)
+
+
+def filter_arpa(arpa_file_path, output_file_path, vocab=None,
+    prune_threshold=None, tmp_dir_path=None):
+    ''' Filters and prunes an ARPA model
+
+    Sections are streamed one at a time, so memory use is bounded by the
+    number of n-grams of one order. An n-gram is kept if all its words are
+    in the vocabulary, its log10 probability is at least prune_threshold
+    (unigrams are never pruned), and its history (the n-gram of its first
+    n - 1 words) was kept, so that every history state of the model exists.
+    Like other vocabulary filters, probabilities and backoff weights are not
+    renormalized. The sections are spooled to a temporary file, so that the
+    \\data\\ counts can be rewritten before them.
+
+    Arguments
+    ---------
+
+    arpa_file_path : String specifying the path to the ARPA model (possibly
+    compressed).
+
+    output_file_path : Destination of the filtered ARPA model. It is written
+    compressed if its name ends in .gz or .xz.
+
+    vocab : Set of bytes words to keep, or None to keep all words.
+
+    prune_threshold : Minimum log10 probability of the n-grams of order 2
+    and higher, or None.
+
+    tmp_dir_path : Directory of the temporary file. Default is the directory
+    of the output.
+
+    Returns
+    -------
+
+    counts : Dictionary mapping n-gram orders to (number of n-grams read,
+    number of n-grams kept).
+    '''
+    if tmp_dir_path is None:
+        tmp_dir_path = os.path.dirname(os.path.abspath(output_file_path))
+    counts = dict()
+    with open_stream(arpa_file_path, 'rb') as arpa_file, \
+        tempfile.TemporaryFile(dir=tmp_dir_path) as sections_file:
+        header_counts = _read_header(arpa_file)
+        histories = None
+        for order, lines in _iter_sections(arpa_file):
+            if order not in header_counts:
+                raise ValueError('ARPA model has a %d-grams section, but no '
+                    'count for it.' % order)
+            sections_file.write(b'\n\\%d-grams:\n' % order)
+            # Keys of the kept n-grams of this order, checked as histories
+            # of the next order
+            kept_keys = set() if order < max(header_counts) else None
+            num_read = 0
+            num_kept = 0
+            for line in lines:
+                num_read += 1
+                fields = line.split()
+                words = fields[1:order + 1]
+                if len(words) != order:
+                    raise ValueError('Malformed %d-gram in ARPA model: %r.' %
+                        (order, line))
+                if vocab is not None and not all(word in vocab for word in
+                    words):
+                    continue
+                if order > 1:
+                    if prune_threshold is not None and float(fields[0]) < \
+                        prune_threshold:
+                        continue
+                    if histories is not None and b' '.join(words[:-1]) not \
+                        in histories:
+                        continue
+                if kept_keys is not None:
+                    kept_keys.add(b' '.join(words))
+                sections_file.write(line)
+                num_kept += 1
+            if num_read != header_counts[order]:
+                print('Warning: \\data\\ section lists %d %d-grams, but %d '
+                    'were found.' % (header_counts[order], order, num_read),
+                    file=sys.stderr)
+            counts[order] = (num_read, num_kept)
+            histories = kept_keys
+        sections_file.write(b'\n\\end\\\n')
+
+        # Write the \data\ section with the new counts, then the sections
+        sections_file.seek(0)
+        with open_stream(output_file_path, 'wb') as output_file:
+            output_file.write(b'\\data\\\n')
+            for order in sorted(counts):
+                output_file.write(b'ngram %d=%d\n' % (order,
+                    counts[order][1]))
+            shutil.copyfileobj(sections_file, output_file)
+    return counts
+
+
+def main():
+    ''' Filter and prune an ARPA language model.
+    '''
+    arg_parser = argparse.ArgumentParser(description=('Filter an ARPA '
+        'language model to a vocabulary and prune low-probability n-grams, '
+        'rewriting the \\data\\ counts.'))
+    arg_parser.add_argument('arpa', type=str,
+        help='Path to the ARPA model (- for the standard input).')
+    arg_parser.add_argument('output_arpa', type=str,
+        help='Path to output file to save the filtered ARPA model.')
+    arg_parser.add_argument('--vocab', type=str, help=('Path to a file '
+        'listing the words to keep in its first column (e.g. '
+        'data/lang/words.txt).'))
+    arg_parser.add_argument('--prune-threshold', dest='prune_threshold',
+        type=float, default=None, help=('Remove n-grams of order 2 and '
+        'higher with a log10 probability below this threshold.'))
+    arg_parser.add_argument('--tmp-dir', dest='tmp_dir', type=str,
+        help=('Directory of the temporary file. Default is the directory of '
+        'the output.'))
+    args = vars(arg_parser.parse_args())
+
+    for name in ['arpa', 'vocab']:
+        if args[name] not in [None, '-'] and not os.path.exists(args[name]):
+            print('Could not find file in specified location: %s.' %
+                args[name])
+            exit(1)
+    vocab = read_vocab(args['vocab']) if args['vocab'] is not None else None
+    try:
+        counts = filter_arpa(args['arpa'], args['output_arpa'], vocab,
+            args['prune_threshold'], args['tmp_dir'])
+    except ValueError as e:
+        print(e)
+        exit(1)
+    for order in sorted(counts):
+        num_read, num_kept = counts[order]
+        print('%d-grams: %d of %d kept.' % (order, num_kept, num_read),
+            file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
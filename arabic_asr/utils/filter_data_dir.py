@@ -0,0 +1,215 @@
+#: Title : filter_data_dir.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : Keep or exclude utterances, speakers or recordings from a
+#    Kaldi data directory, updating every file of the directory in place
+#: Arguments :
+#  1- Path to the Kaldi data directory to filter
+#  Options --keep-utts, --exclude-utts, --keep-spks, --exclude-spks,
+#  --keep-recs and --exclude-recs take files listing IDs in their first
+#  column.
+
+import argparse
+import os
+from kaldi_data_dir import (get_key, read_keys, rec_file_names,
+    spk_file_names, utt_file_names, write_atomically)
+
+__author__ = "Ahmed Ismail"
+__license__ = "GPL"
+__version__ = "1.0"
+__email__ = "ahmed.ismail.zahran@gmail.com"
+__status__ = "Development"
+
+
+def parse_args():
+    ''' Parses command line arguments
+
+    Returns
+    -------
+
+    args : A dictionary of arguments
+    '''
+    id_list_help = ('Path to a file listing %s IDs to %s (IDs are read from '
+        'the first column, so e.g. an utt2spk file can be passed).')
+    arg_parser = argparse.ArgumentParser(description=('Filter the files of '
+        'a Kaldi data directory in place by utterance, speaker or '
+        'recording.'))
+    arg_parser.add_argument('data_dir', type=str,
+        help='Path to the Kaldi data directory to filter.')
+    for option, kind in [('utts', 'utterance'), ('spks', 'speaker'),
+        ('recs', 'recording')]:
+        for action in ['keep', 'exclude']:
+            arg_parser.add_argument('--%s-%s' % (action, option),
+                dest='%s_%s' % (action, option), type=str,
+                help=id_list_help % (kind, action))
+    args = vars(arg_parser.parse_args())
+    return args
+
+
+def _passes(key, keep, exclude):
+    return (keep is None or key in keep) and (exclude is None or
+        key not in exclude)
+
+
+def _filter_lines(file_path, keys):
+    ''' Streams the lines of a Kaldi file whose first column is in keys. '''
+    with open(file_path, 'rb') as kaldi_file:
+        for line in kaldi_file:
+            if get_key(line) in keys:
+                yield line
+
+
+def _filter_spk2utt(file_path, spks, utts):
+    ''' Streams spk2utt lines restricted to the utterances kept. '''
+    with open(file_path, 'rb') as spk2utt_file:
+        for line in spk2utt_file:
+            fields = line.split()
+            if fields == [] or fields[0] not in spks:
+                continue
+            spk_utts = [utt for utt in fields[1:] if utt in utts]
+            if spk_utts != []:
+                yield b' '.join([fields[0]] + spk_utts) + b'\n'
+
+
+class _Counter(object):
+    ''' Iterable wrapper counting the items passed through it. '''
+
+    def __init__(self, iterable):
+        self.iterable = iterable
+        self.count = 0
+
+    def __iter__(self):
+        for item in self.iterable:
+            self.count += 1
+            yield item
+
+
+def filter_data_dir(data_dir_path, keep_utts=None, exclude_utts=None,
+    keep_spks=None, exclude_spks=None, keep_recs=None, exclude_recs=None):
+    ''' Filters every file of a Kaldi data directory in place.
+
+    An utterance is kept if it passes all the utterance, speaker and
+    recording filters passed and appears in every per-utterance file of the
+    directory, which gives the same result as running Kaldi's
+    fix_data_dir.sh afterwards. Files are streamed to temporary files which
+    are renamed over the originals, so memory use is bounded by the number
+    of IDs, not by the size of the files.
+
+    Arguments
+    ---------
+
+    data_dir_path : String specifying the path to the Kaldi data directory.
+
+    keep_utts, exclude_utts, keep_spks, exclude_spks, keep_recs,
+    exclude_recs : Sets of bytes IDs to keep or exclude, or None to skip the
+    corresponding filter.
+
+    Returns
+    -------
+
+    counts : Dictionary mapping the names of the files rewritten to the
+    number of lines kept.
+    '''
+    def path(file_name):
+        return os.path.join(data_dir_path, file_name)
+
+    utt2spk_file_path = path('utt2spk')
+    if not os.path.exists(utt2spk_file_path):
+        raise IOError('Could not find utt2spk file in specified location: %s.'
+            % utt2spk_file_path)
+    has_segments = os.path.exists(path('segments'))
+
+    # Utterances passing the utterance and speaker filters, with their
+    # speakers
+    utt2spk = dict()
+    with open(utt2spk_file_path, 'rb') as utt2spk_file:
+        for line in utt2spk_file:
+            fields = line.split()
+            if len(fields) != 2:
+                continue
+            utt, spk = fields
+            if _passes(utt, keep_utts, exclude_utts) and _passes(spk,
+                keep_spks, exclude_spks):
+                utt2spk[utt] = spk
+
+    # Apply the recording filter, using segments to find the recording of
+    # each utterance
+    utt2rec = dict()
+    if has_segments:
+        with open(path('segments'), 'rb') as segments_file:
+            for line in segments_file:
+                fields = line.split(None, 2)
+                if len(fields) >= 2 and fields[0] in utt2spk and _passes(
+                    fields[1], keep_recs, exclude_recs):
+                    utt2rec[fields[0]] = fields[1]
+        utts = set(utt2rec)
+    else:
+        utts = set(utt for utt in utt2spk if _passes(utt, keep_recs,
+            exclude_recs))
+
+    # Only keep utterances found in all per-utterance files
+    per_utt_file_names = [file_name for file_name in utt_file_names if
+        os.path.exists(path(file_name))]
+    if not has_segments:
+        per_utt_file_names += [file_name for file_name in rec_file_names if
+            os.path.exists(path(file_name))]
+    for file_name in per_utt_file_names:
+        if file_name not in ['utt2spk', 'segments']:
+            utts &= read_keys(path(file_name))
+
+    spks = set(utt2spk[utt] for utt in utts)
+    recs = set(utt2rec[utt] for utt in utts) if has_segments else utts
+    del utt2spk, utt2rec
+
+    # Stream the kept lines of every file to a temporary file and rename it
+    # into place
+    counts = dict()
+    jobs = [(file_name, utts) for file_name in per_utt_file_names]
+    jobs += [(file_name, spks) for file_name in spk_file_names]
+    if has_segments:
+        jobs += [(file_name, recs) for file_name in rec_file_names]
+    for file_name, keys in jobs:
+        file_path = path(file_name)
+        if not os.path.exists(file_path):
+            continue
+        if file_name == 'spk2utt':
+            lines = _filter_spk2utt(file_path, keys, utts)
+        else:
+            lines = _filter_lines(file_path, keys)
+        counter = _Counter(lines)
+        write_atomically(file_path, counter, encoding=None)
+        counts[file_name] = counter.count
+    return counts
+
+
+def read_id_list(file_path):
+    ''' Reads a set of bytes IDs from the first column of a file, or returns
+    None if no file is specified. '''
+    if file_path is None:
+        return None
+    if not os.path.exists(file_path):
+        print('Could not find ID list in specified location: %s.' % file_path)
+        exit(1)
+    return read_keys(file_path)
+
+
+def main():
+    ''' Filter a Kaldi data directory by utterance, speaker or recording.
+    '''
+    args = parse_args()
+    data_dir_path = args['data_dir']
+    id_lists = {name: read_id_list(args[name]) for name in ['keep_utts',
+        'exclude_utts', 'keep_spks', 'exclude_spks', 'keep_recs',
+        'exclude_recs']}
+    try:
+        counts = filter_data_dir(data_dir_path, **id_lists)
+    except IOError as e:
+        print(e)
+        exit(1)
+    for file_name, count in sorted(counts.items()):
+        print('%d entries were written to %s.' % (count, file_name))
+    return
+
+
+if __name__ == '__main__':
+    main()
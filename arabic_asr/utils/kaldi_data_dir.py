@@ -0,0 +1,442 @@
+#: Title : kaldi_data_dir.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : Helpers to read and write the files of a Kaldi data
+#    directory, and an indexed view of a data directory giving random access
+#    to its entries
+#: Arguments (when run as a script) :
+#  1- Path to the Kaldi data directory
+#  2- Utterance ID's to look up
+
+import argparse
+import array
+import json
+import mmap
+import os
+import re
+import tempfile
+
+__author__ = "Ahmed Ismail"
+__license__ = "GPL"
+__version__ = "1.0"
+__email__ = "ahmed.ismail.zahran@gmail.com"
+__status__ = "Development"
+
+
+# Files of a Kaldi data directory, grouped by the kind of ID found in their
+# first column. When there is no segments file, recordings and utterances
+# are the same, and per-recording files are keyed by utterance ID.
+utt_file_names = ['utt2spk', 'text', 'segments', 'feats.scp', 'utt2dur',
+    'utt2num_frames', 'utt2lang', 'utt2uniq', 'utt2warp', 'vad.scp']
+spk_file_names = ['spk2utt', 'cmvn.scp', 'spk2gender', 'spk2warp']
+rec_file_names = ['wav.scp', 'reco2dur', 'reco2file_and_channel',
+    'reco2num_samples']
+
+
+def get_key(line):
+    ''' Returns the ID in the first column of a Kaldi file line.
+
+    Arguments
+    ---------
+
+    line : String or bytes containing the line.
+
+    Returns
+    -------
+
+    key : First whitespace-delimited field of the line, or None for an empty
+    line.
+    '''
+    fields = line.split(None, 1)
+    return fields[0] if fields else None
+
+
+def read_keys(file_path):
+    ''' Reads the IDs in the first column of a Kaldi file as bytes.
+
+    Arguments
+    ---------
+
+    file_path : String specifying the path to the file.
+
+    Returns
+    -------
+
+    keys : Set of bytes IDs.
+    '''
+    with open(file_path, 'rb') as kaldi_file:
+        keys = set(get_key(line) for line in kaldi_file)
+    keys.discard(None)
+    return keys
+
+
+# Permissions of the files written by write_atomically, as open() would
+# create them. The umask can only be read by setting it, which is not thread
+# safe, so it is read once at import time.
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+
+def write_atomically(file_path, lines, encoding='utf-8'):
+    ''' Writes lines to a file through a temporary file in the same
+    directory, which is then renamed over the destination.
+
+    Lines may be a generator reading the destination file itself, since the
+    destination is only replaced once all lines were written.
+
+    Arguments
+    ---------
+
+    file_path : String specifying the destination file path.
+
+    lines : Iterable of strings (with line breaks) to write, or of bytes if
+    encoding is None.
+
+    encoding : String specifying the encoding of the lines, or None if lines
+    are bytes. Default is 'utf-8'.
+    '''
+    dir_path = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_file_path = tempfile.mkstemp(dir=dir_path,
+        prefix='.' + os.path.basename(file_path) + '.')
+    try:
+        if encoding is None:
+            tmp_file = os.fdopen(fd, 'wb')
+        else:
+            tmp_file = os.fdopen(fd, 'w', encoding=encoding, newline='')
+        with tmp_file:
+            tmp_file.writelines(lines)
+        # Keep the permissions a file created with open() would have
+        os.chmod(tmp_file_path, FILE_MODE)
+        os.replace(tmp_file_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_file_path):
+            os.remove(tmp_file_path)
+        raise
+
+
+# Name of the directory where KaldiDataDir persists its indexes, inside the
+# data directory
+INDEX_DIR_NAME = '.kaldi_index'
+# Version of the persisted index format
+INDEX_VERSION = 2
+
+# Matches the ID at the start of every non-empty line
+_key_re = re.compile(br'^(\S+)', re.M)
+
+
+class KaldiFileIndex(object):
+    ''' Byte-offset index of a Kaldi file, giving random access to its lines
+    by the ID in their first column.
+
+    The file is memory-mapped and the index only holds the offsets of the
+    lines and the lengths of their IDs, sorted by ID, as packed arrays. IDs
+    are read from the mapped file, so lookups bisect through the map in
+    O(log n) time without keeping the IDs in memory. The index can be saved
+    next to the file, where it is memory-mapped too, so opening it does not
+    parse anything. It is rebuilt when the size or modification time of the
+    file changes.
+    '''
+
+    def __init__(self, file_path, index_file_path=None):
+        ''' Opens a Kaldi file and loads or builds its index.
+
+        Arguments
+        ---------
+
+        file_path : String specifying the path to the Kaldi file.
+
+        index_file_path : String specifying where the index is persisted, or
+        None to keep the index in memory only.
+        '''
+        self.file_path = file_path
+        self.index_file_path = index_file_path
+        self._file = open(file_path, 'rb')
+        stat = os.fstat(self._file.fileno())
+        self._signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        if stat.st_size > 0:
+            self._data = mmap.mmap(self._file.fileno(), 0,
+                access=mmap.ACCESS_READ)
+        else:
+            self._data = b''
+        self._index_data = None
+        if not self._load_index():
+            self._build_index()
+            self._save_index()
+
+    def _build_index(self):
+        entries = sorted((match.group(1), match.start()) for match in
+            _key_re.finditer(self._data))
+        self.offsets = array.array('q', [offset for _, offset in entries])
+        self.key_lengths = array.array('I', [len(key) for key, _ in entries])
+
+    def _load_index(self):
+        ''' Maps the persisted index if it matches the current file.
+
+        The index file holds a JSON header line with the signature of the
+        indexed file, padded to a multiple of 8 bytes, followed by the line
+        offsets as 64-bit integers and the ID lengths as 32-bit integers.
+        '''
+        if self.index_file_path is None or not os.path.exists(
+            self.index_file_path):
+            return False
+        try:
+            with open(self.index_file_path, 'rb') as index_file:
+                header = json.loads(index_file.readline().decode('utf-8'))
+                if header['version'] != INDEX_VERSION or \
+                    header['signature'] != self._signature:
+                    return False
+                start = index_file.tell()
+                count = header['count']
+                if os.fstat(index_file.fileno()).st_size != start + 12 * count:
+                    return False
+                index_data = mmap.mmap(index_file.fileno(), 0,
+                    access=mmap.ACCESS_READ)
+        except (ValueError, KeyError, TypeError, OSError):
+            return False
+        self._index_data = index_data
+        view = memoryview(index_data)
+        self.offsets = view[start:start + 8 * count].cast('q')
+        self.key_lengths = view[start + 8 * count:].cast('I')
+        view.release()
+        return True
+
+    def _save_index(self):
+        if self.index_file_path is None:
+            return
+        header = json.dumps({'version': INDEX_VERSION, 'signature':
+            self._signature, 'count': len(self.offsets)}).encode('utf-8')
+        # Align the arrays to their item size
+        header += b' ' * (-(len(header) + 1) % 8) + b'\n'
+        lines = [header, self.offsets.tobytes(), self.key_lengths.tobytes()]
+        try:
+            index_dir_path = os.path.dirname(self.index_file_path)
+            if not os.path.isdir(index_dir_path):
+                os.makedirs(index_dir_path)
+            write_atomically(self.index_file_path, lines, encoding=None)
+        except OSError:
+            # The index still works from memory if the data directory is not
+            # writable
+            pass
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def _key(self, i):
+        offset = self.offsets[i]
+        return self._data[offset:offset + self.key_lengths[i]]
+
+    def _find(self, key):
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+        low = 0
+        high = len(self.offsets)
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.offsets) and self._key(low) == key:
+            return self.offsets[low]
+        return None
+
+    def _read_line(self, offset):
+        end = self._data.find(b'\n', offset)
+        if end == -1:
+            end = len(self._data)
+        return self._data[offset:end]
+
+    def get_line(self, key):
+        ''' Returns the raw line (bytes, without line break) of an ID, or
+        None if the ID is not in the file. '''
+        offset = self._find(key)
+        if offset is None:
+            return None
+        return self._read_line(offset)
+
+    def get(self, key, default=None):
+        ''' Returns the value of an ID, i.e. the rest of its line after the
+        ID, as a string, or default if the ID is not in the file. '''
+        line = self.get_line(key)
+        if line is None:
+            return default
+        fields = line.split(None, 1)
+        return fields[1].strip().decode('utf-8') if len(fields) > 1 else ''
+
+    def sorted_keys(self):
+        ''' Iterates over the IDs of the file in sorted order, as strings. '''
+        for i in range(len(self.offsets)):
+            yield self._key(i).decode('utf-8')
+
+    def items(self):
+        ''' Iterates over (ID, value) pairs in file order, reading lines
+        from the memory-mapped file. '''
+        start = 0
+        size = len(self._data)
+        while start < size:
+            end = self._data.find(b'\n', start)
+            if end == -1:
+                end = size
+            fields = self._data[start:end].split(None, 1)
+            if fields:
+                value = fields[1].strip() if len(fields) > 1 else b''
+                yield fields[0].decode('utf-8'), value.decode('utf-8')
+            start = end + 1
+
+    def close(self):
+        if self._index_data is not None:
+            self.offsets.release()
+            self.key_lengths.release()
+            self._index_data.close()
+            self._index_data = None
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+class KaldiDataDir(object):
+    ''' Indexed view of a Kaldi data directory.
+
+    Entries of text, segments, utt2spk, wav.scp and feats.scp are looked up by
+    ID through byte-offset indexes instead of parsing the files. Indexes are
+    built when a file is first accessed, persisted in a hidden directory
+    inside the data directory and rebuilt whenever the file changes.
+
+    e.g.:
+        data_dir = KaldiDataDir('data/train')
+        data_dir.get('text', utt_id)
+        data_dir.utterance(utt_id)
+    '''
+
+    indexed_file_names = ['text', 'segments', 'utt2spk', 'wav.scp',
+        'feats.scp']
+
+    def __init__(self, data_dir_path, persist=True):
+        ''' Opens a Kaldi data directory.
+
+        Arguments
+        ---------
+
+        data_dir_path : String specifying the path to the data directory.
+
+        persist : Boolean. If set to True, indexes are saved in the data
+        directory and reused by later instances. Default is True.
+        '''
+        if not os.path.isdir(data_dir_path):
+            raise IOError('Could not find Kaldi data directory in specified '
+                'location: %s.' % data_dir_path)
+        self.data_dir_path = data_dir_path
+        self.persist = persist
+        self._indexes = dict()
+
+    def has_file(self, file_name):
+        return os.path.exists(os.path.join(self.data_dir_path, file_name))
+
+    def index(self, file_name):
+        ''' Returns the KaldiFileIndex of a file of the directory. '''
+        if file_name not in self.indexed_file_names:
+            raise ValueError('File %s is not indexed. Indexed files are: %s.'
+                % (file_name, ', '.join(self.indexed_file_names)))
+        if file_name not in self._indexes:
+            file_path = os.path.join(self.data_dir_path, file_name)
+            if not os.path.exists(file_path):
+                raise IOError('Could not find %s file in specified location: '
+                    '%s.' % (file_name, file_path))
+            index_file_path = os.path.join(self.data_dir_path,
+                INDEX_DIR_NAME, file_name + '.idx') if self.persist else None
+            self._indexes[file_name] = KaldiFileIndex(file_path,
+                index_file_path)
+        return self._indexes[file_name]
+
+    def get(self, file_name, key, default=None):
+        ''' Returns the value of an ID in a file of the directory. '''
+        return self.index(file_name).get(key, default)
+
+    def items(self, file_name):
+        ''' Iterates over (ID, value) pairs of a file in file order. '''
+        return self.index(file_name).items()
+
+    def utterance_ids(self):
+        ''' Iterates over utterance ID's in sorted order. '''
+        return self.index('utt2spk').sorted_keys()
+
+    def recording_id(self, utt_id):
+        ''' Returns the recording ID of an utterance. Utterances are
+        recordings when the directory has no segments file. '''
+        if self.has_file('segments'):
+            segment = self.get('segments', utt_id)
+            return segment.split()[0] if segment is not None else None
+        return utt_id
+
+    def utterance(self, utt_id):
+        ''' Returns the entries of an utterance in all indexed files.
+
+        Returns
+        -------
+
+        entries : Dictionary mapping file names to the values for the
+        utterance (for wav.scp, the value for its recording). Files that do
+        not exist or do not contain the utterance are left out.
+        '''
+        entries = dict()
+        for file_name in self.indexed_file_names:
+            if not self.has_file(file_name):
+                continue
+            if file_name == 'wav.scp':
+                key = self.recording_id(utt_id)
+                if key is None:
+                    continue
+            else:
+                key = utt_id
+            value = self.get(file_name, key)
+            if value is not None:
+                entries[file_name] = value
+        return entries
+
+    def __len__(self):
+        return len(self.index('utt2spk'))
+
+    def __contains__(self, utt_id):
+        return utt_id in self.index('utt2spk')
+
+    def close(self):
+        for file_index in self._indexes.values():
+            file_index.close()
+        self._indexes = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    ''' Print the entries of utterances in a Kaldi data directory.
+    '''
+    arg_parser = argparse.ArgumentParser(description=('Look up utterances in '
+        'a Kaldi data directory through byte-offset indexes.'))
+    arg_parser.add_argument('data_dir', type=str,
+        help='Path to the Kaldi data directory.')
+    arg_parser.add_argument('utt_ids', type=str, nargs='+',
+        help='Utterance ID\'s to look up.')
+    args = vars(arg_parser.parse_args())
+
+    with KaldiDataDir(args['data_dir']) as data_dir:
+        for utt_id in args['utt_ids']:
+            entries = data_dir.utterance(utt_id)
+            if entries == {}:
+                print('%s: not found' % utt_id)
+                continue
+            for file_name in KaldiDataDir.indexed_file_names:
+                if file_name in entries:
+                    print('%s %s: %s' % (utt_id, file_name,
+                        entries[file_name]))
+
+
+if __name__ == '__main__':
+    main()
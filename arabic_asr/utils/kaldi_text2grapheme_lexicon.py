@@ -10,6 +10,8 @@
 import argparse
 import codecs
 import os
+from collections import Counter
+from word_counts import count_words, select_vocabulary
 
 __author__ = "Ahmed Ismail"
 __license__ = "GPL"
@@ -17,6 +19,72 @@ __version__ = "1.0"
 __email__ = "ahmed.ismail.zahran@gmail.com"
 __status__ = "Development"
 
+# Number of example words printed per rejected grapheme
+NUM_EXAMPLES = 5
+
+
+def write_lexicon(words, lexicon_file_path, phones=None):
+    ''' Writes a grapheme lexicon
+
+    Arguments
+    ---------
+
+    words : Iterable of words.
+
+    lexicon_file_path : String specifying the path to the lexicon file.
+
+    phones : Set of nonsilence phones. If passed, words including graphemes
+    outside the set are left out.
+
+    Returns
+    -------
+
+    rejected : Dictionary mapping every grapheme not found in phones to the
+    sorted list of words left out because of it.
+    '''
+    rejected = dict()
+    with codecs.open(lexicon_file_path, 'w', encoding='utf-8') as \
+        lexicon_file:
+        # Sort and output the words to the grapheme dictionary, along with
+        # their pronunciations
+        # Grapheme dictionary line format: '<word> <list of graphemes>'
+        for word in sorted(words):
+            graphemes = list(word)
+            # If the list of nonsilence phones is passed as an argument,
+            # ignore words that include phones outside the user-specified
+            # phone list
+            if phones is not None:
+                absent_graphemes = set(graphemes).difference(phones)
+                if absent_graphemes:
+                    for grapheme in absent_graphemes:
+                        rejected.setdefault(grapheme, []).append(word)
+                    continue
+            entry = '%s %s\n' % (word, ' '.join(graphemes))
+            lexicon_file.write(entry)
+        # Write the <UNK> entry
+        lexicon_file.write("<UNK> spn")
+    return rejected
+
+
+def print_rejected_report(rejected, counts):
+    ''' Prints one report of the graphemes not found in the phone list,
+    the most frequent first. '''
+    if not rejected:
+        return
+    rejected_words = set(word for words in rejected.values() for word in
+        words)
+    print(('Warning: Ignored %d words (%d occurrences) which contain '
+        'graphemes not found in the list passed.') % (len(rejected_words),
+        sum(counts[word] for word in rejected_words)))
+    grapheme_counts = Counter({grapheme: sum(counts[word] for word in words)
+        for grapheme, words in rejected.items()})
+    for grapheme, count in grapheme_counts.most_common():
+        words = sorted(rejected[grapheme], key=lambda word: -counts[word])
+        print('  %s (U+%04X): %d words, %d occurrences, e.g. %s' % (grapheme,
+            ord(grapheme), len(words), count, ', '.join(
+            words[:NUM_EXAMPLES])))
+
+
 def main():
     ''' Extract lexicon from Kaldi text
     '''
@@ -29,6 +97,13 @@ def main():
         help=(('Path to output file to save the Kaldi lexicon.')))
     arg_parser.add_argument('--nonsilence-phones', dest='phones',
         type=str, help='Path to the nonsilence phones file [optional].')
+    arg_parser.add_argument('--min-count', dest='min_count', type=int,
+        default=1, help='Minimum count of the words in the lexicon.')
+    arg_parser.add_argument('--top-n', dest='top_n', type=int, default=None,
+        help='Keep only the N most frequent words.')
+    arg_parser.add_argument('--nj', type=int, default=None,
+        help=('Number of processes counting words. Default is the number of '
+        'CPUs.'))
     args = vars(arg_parser.parse_args())
 
     text_file_path = args['kaldi_text']
@@ -43,50 +118,26 @@ def main():
         if os.path.exists(phones_file_path):
             with codecs.open(phones_file_path, 'r', encoding='utf-8') as \
                 phones_file:
-                phones = phones_file.readlines()
-                phones = [phone.strip() for phone in phones]
+                phones = set(phone.strip() for phone in phones_file)
         else:
             print(('Could not find nonsilence phones file in the specified '
                 'location: %s.') % phones_file_path)
+            exit(1)
     else:
         phones = None
 
-    # Open the Kaldi text file as a stream (It may be infeasible to perform
-    # offline processing in case of a large Kaldi text file).
-    with codecs.open(text_file_path, 'r', encoding='utf-8') as kaldi_text_file:
-
-        # Initialize an empty set of words
-        words = set()
-        # For each line in the Kaldi text, remove the utterance-id and add the
-        # words to the set of words
-        for line in kaldi_text_file:
-            line = ' '.join(line.split()[1:]) + '\n'
-            words.update(line.strip().split())
+    # Count the words of the Kaldi text in parallel over byte ranges of the
+    # file (It may be infeasible to perform offline processing in case of a
+    # large Kaldi text file).
+    try:
+        counts = count_words(text_file_path, args['nj'])
+    except IOError as e:
+        print(e)
+        exit(1)
+    words = select_vocabulary(counts, args['min_count'], args['top_n'])
 
-    # Open the lexicon file as a stream
-    with codecs.open(lexicon_file_path, 'w', encoding='utf-8') as \
-        lexicon_file:
-        # Sort and output the set of words to the grapheme dictionary, along
-        # with their pronunciations
-        # Grapheme dictionary line format: '<word> <list of graphemes>'
-        words = sorted(words)
-        for word in words:
-            graphemes = list(word)
-            # If the list of nonsilence phones is passed as an argument,
-            # ignore words that include phones outside the user-specified
-            # phone list
-            grapheme_set = set(graphemes)
-            if phones != None and not grapheme_set.issubset(phones):
-                absent_graphemes = grapheme_set.difference(phones)
-                print(('Warning: Ignoring word %s which contains graphemes '
-                    'not found in the list passed.') % (word))
-                print('Absent graphemes: %s.' % ', '.join(list(
-                    absent_graphemes)))
-                continue
-            entry = '%s %s\n' % (word, ' '.join(graphemes))
-            lexicon_file.write(entry)
-        # Write the <UNK> entry
-        lexicon_file.write("<UNK> spn")
+    rejected = write_lexicon(words, lexicon_file_path, phones)
+    print_rejected_report(rejected, counts)
 
 
 if __name__ == '__main__':
@@ -12,7 +12,8 @@ import csv
 import numpy as np
 import os
 import pandas as pd
-from transliteration import transliterate
+import re
+from transliteration import transliterate_batch
 
 
 def parse_args():
@@ -30,6 +31,8 @@ def parse_args():
         'character set will be ignored in the transliteration. If not, '
         'absent characters will be output without mapping in the '
         'transliteration.')
+    chunk_size_help = ('Number of tdf lines processed at a time. Default is '
+        '%d.' % CHUNK_SIZE)
     # Parse arguments
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument('tdf_file_path',
@@ -38,10 +41,175 @@ def parse_args():
         help=kaldi_data_dir_path_help)
     arg_parser.add_argument('--ignore-absent', action='store_true',
         help=ignore_absent_help)
+    arg_parser.add_argument('--chunk-size', dest='chunk_size', type=int,
+        default=CHUNK_SIZE, help=chunk_size_help)
     args = vars(arg_parser.parse_args())
     return args
 
 
+# Kaldi data directory files produced from a TDF file
+kaldi_file_names = ['wav.scp', 'segments', 'text', 'utt2spk']
+
+# Number of TDF lines read and converted at a time
+CHUNK_SIZE = 100000
+
+# TDF columns used in the conversion and their types. Times are read as
+# strings and converted after comment lines are removed, since comments do
+# not follow the column types.
+tdf_dtypes = {'file;unicode': str, 'start;float': str, 'end;float': str,
+    'speaker;unicode': str, 'transcript;unicode': str}
+
+# Foreign language utterances are removed and <non-MSA> tags are deleted
+# (since we will be working with a grapheme model) with a single regular
+# expression. Foreign language tags are replaced by a marker character which
+# is then used to drop the utterance.
+foreign_marker = '\x00'
+transcript_cleanup_re = re.compile(
+    '(<foreign language=".*"> </foreign>)|<non-MSA>')
+
+
+def _cleanup_match(match):
+    return foreign_marker if match.group(1) is not None else ''
+
+
+def _format_times(times):
+    ''' Formats float times the same way as Python's str.
+
+    pd.to_numeric gives integers for a chunk whose times are all integers,
+    so times are cast to float first, for 12 to be written 12.0 in every
+    chunk.
+    '''
+    return times.astype('float64').astype(str)
+
+
+def iter_tdf2kaldi_entries(tdf_file_path, ignore_absent=False,
+    chunk_size=CHUNK_SIZE):
+    ''' Converts a TDF file to the entries of a Kaldi data directory, chunk
+    by chunk
+
+    Only the needed columns are read, chunk_size lines at a time, so memory
+    use does not depend on the size of the TDF file.
+
+    Arguments
+    ---------
+
+    tdf_file_path : String specifying the path to the TDF file.
+
+    ignore_absent : Boolean. If set to True, characters absent from the
+    Buckwalter character set are ignored in the transliteration.
+
+    chunk_size : Integer specifying the number of TDF lines processed at a
+    time.
+
+    Yields
+    ------
+
+    entries : Dictionary whose keys are the Kaldi file names in
+    kaldi_file_names and whose values are lists of lines (with line breaks)
+    to be written to the corresponding files.
+    '''
+    # Recordings whose wav.scp entries were output for previous chunks
+    seen_files = set()
+
+    # Read tdf (tab-delimited format) file
+    tdf_reader = pd.read_csv(tdf_file_path, sep='\t', usecols=list(
+        tdf_dtypes), dtype=tdf_dtypes, quoting=csv.QUOTE_NONE,
+        keep_default_na=False, chunksize=chunk_size)
+    for tdf_df in tdf_reader:
+        # Remove comments (lines starting with ';;') from the tdf file
+        tdf_df = tdf_df[~tdf_df['file;unicode'].str.startswith(';;')]
+
+        # Remove foreign language utterances and non-MSA tags
+        transcripts = tdf_df['transcript;unicode'].fillna('').str.replace(
+            transcript_cleanup_re, _cleanup_match, regex=True)
+        keep = ~transcripts.str.contains(foreign_marker, regex=False)
+
+        # Remove utterances where end time is not larger than start time
+        start = pd.to_numeric(tdf_df['start;float'], errors='coerce')
+        end = pd.to_numeric(tdf_df['end;float'], errors='coerce')
+        keep &= start < end
+
+        transcripts = transcripts[keep]
+        start = _format_times(start[keep])
+        end = _format_times(end[keep])
+        files = tdf_df['file;unicode'][keep]
+
+        # Transliterate the text according to Buckwalter transliteration
+        transcripts = transliterate_batch(transcripts, 'unicode',
+            'buckwalter', ignore_absent)
+
+        # The value of column 'file;unicode' is used as utterance id (utt-id)
+        # Strip and remove spaces from speaker and file name to avoid errors
+        # from Kaldi (the original file name is used in computing the path to
+        # the wave file)
+        file_names = files.str.replace(' ', '', regex=False)
+        speakers = tdf_df['speaker;unicode'][keep].fillna('').str.replace(
+            ' ', '', regex=False)
+
+        # segments: <segment-id> <utt-id> start-time end-time
+        # Segment id = <speaker>-<file-name>_<start-time>-<end-time>
+        # (making speaker-id's prefixes of utterance-id's is related to Kaldi)
+        segment_ids = (speakers + '-' + file_names + '_' + start + '-' +
+            end).str.strip()
+
+        # utt2spk: <utt-id> <speaker>
+        # Use utt-id as a postfix to the speaker name to avoid ambiguity
+        # (some speakers are named as 'speaker 1' for example, so 'speaker 1'
+        # will exist in multiple LDC tdf files, although the speakers are
+        # different)
+        speakers = speakers + '-' + file_names
+
+        # wav.scp: <utt-id> /path/to/wave/file
+        # path to wave file is the same as the utt-id, with .wav extension
+        # instead of .sph. A TDF file refers to few recordings, so paths are
+        # only computed once per recording.
+        wav_scp = []
+        for file in files.unique():
+            if file in seen_files:
+                continue
+            seen_files.add(file)
+            wav_scp.append('%s %s\n' % (file.replace(' ', ''),
+                os.path.splitext(file)[0] + '.wav'))
+
+        entries = {'wav.scp': wav_scp,
+            'segments': (segment_ids + ' ' + file_names + ' ' + start + ' ' +
+                end + '\n').tolist(),
+            # text: <utt-id> <utterance>
+            'text': (segment_ids + '\t' + transcripts + '\n').tolist(),
+            'utt2spk': (segment_ids + ' ' + speakers + '\n').tolist()}
+        yield entries
+
+
+def tdf2kaldi_entries(tdf_file_path, ignore_absent=False,
+    chunk_size=CHUNK_SIZE):
+    ''' Converts a TDF file to the entries of a Kaldi data directory
+
+    Arguments
+    ---------
+
+    tdf_file_path : String specifying the path to the TDF file.
+
+    ignore_absent : Boolean. If set to True, characters absent from the
+    Buckwalter character set are ignored in the transliteration.
+
+    chunk_size : Integer specifying the number of TDF lines processed at a
+    time.
+
+    Returns
+    -------
+
+    entries : Dictionary whose keys are the Kaldi file names in
+    kaldi_file_names and whose values are lists of lines (with line breaks)
+    to be written to the corresponding files.
+    '''
+    entries = {file_name: [] for file_name in kaldi_file_names}
+    for chunk_entries in iter_tdf2kaldi_entries(tdf_file_path, ignore_absent,
+        chunk_size):
+        for file_name in kaldi_file_names:
+            entries[file_name].extend(chunk_entries[file_name])
+    return entries
+
+
 def main():
 
     # Parse arguments
@@ -49,53 +217,13 @@ def main():
     tdf_file_path = args['tdf_file_path']
     kaldi_data_dir_path = args['kaldi_data_dir_path']
     ignore_absent = args['ignore_absent']
-
-    foreign_lang_pattern = '<foreign language=".*"> </foreign>'
-    wav_scp_file_path = kaldi_data_dir_path + os.sep + 'wav.scp'
-    segments_file_path = kaldi_data_dir_path + os.sep + 'segments'
-    text_file_path = kaldi_data_dir_path + os.sep + 'text'
-    utt2spk_file_path = kaldi_data_dir_path + os.sep + 'utt2spk'
+    chunk_size = args['chunk_size']
 
     # Read tdf (tab-delimited format) file from the user-specified path
     if not os.path.exists(tdf_file_path):
         print('Error: Cannot find the tdf file in the path specified: %s.' %
             tdf_file_path)
         return 1
-    tdf_df = pd.read_csv(tdf_file_path, sep='\t')
-
-    # Remove comments (lines starting with ';;') from the tdf file
-    tdf_df = tdf_df[~tdf_df['file;unicode'].str.startswith(';;')]
-    # Drop irrelevant columns
-    cols_to_drop = ['section;int', 'turn;int', 'segment;int',
-        'sectionType;unicode', 'suType;unicode']
-    tdf_df = tdf_df.drop(columns=cols_to_drop)
-    print('Dropping columns: %s.' % ', '.join(cols_to_drop))
-    print('Successfully dropped columns: %s.' % ', '.join(cols_to_drop))
-    print('Columns in the Dataframe are:')
-    print(tdf_df.columns)
-
-    # Remove foreign language utterances
-    print('Removing utterances in foreign lanuages.')
-    tdf_df = tdf_df[~tdf_df['transcript;unicode'].str.contains(
-        foreign_lang_pattern)]
-    print('Successfully removed utterances in foreign lanuages.')
-
-    # Remove non-MSA tags (since we will be working with a grapheme model)
-    print(('Removing <non-MSA> tags (since we will be working with a '
-        'grapheme model).'))
-    tdf_df['transcript;unicode'] = tdf_df['transcript;unicode'].apply(
-        lambda x: x.replace('<non-MSA>', ''))
-    print('Successfully removed <non-MSA> tags.')
-
-    # Remove utterances where end time is not larger than start time
-    tdf_df = tdf_df[tdf_df['start;float'] < tdf_df['end;float']]
-
-    # Transliterate the text according to Buckwalter transliteration
-    print('Transliterating text according to Buckwalter transliteration.')
-    tdf_df['transcript;unicode'] = tdf_df['transcript;unicode'].apply(
-        lambda x: transliterate(x, 'unicode', 'buckwalter', ignore_absent))
-
-    # Save the data to a Kaldi data directory
 
     # Create the Kaldi data directory
     print('Creating Kaldi data directory at %s.' % kaldi_data_dir_path)
@@ -112,68 +240,26 @@ def main():
             return 1
     print('Successfully created Kaldi data directory.')
 
-    # Output the data to the files in the format accepted by Kaldi
-    # The value of column 'file;unicode' is used as utterance id (utt-id)
-    # Segment id is <file;unicode>-<start;float>-<end;float>
-
-    # Strip and remove spaces from speaker and file name to avoid errors from
-    # Kaldi
-    # Create a new file name column for this purpose (the original will be used
-    # in computing the path to the wave file)
-    tdf_df['file-name'] = tdf_df['file;unicode'].str.replace(
-        ' ', '')
-    tdf_df['speaker;unicode'] = tdf_df['speaker;unicode'].str.replace(
-        ' ', '')
-
-    # wav.scp: <utt-id> /path/to/wave/file
-    # path to wave file is the same as the utt-id, with .wav extension instead
-    # of .sph
-    print('Saving wav.scp file to %s.' % wav_scp_file_path)
-    tdf_df['file-path'] = tdf_df['file;unicode'].apply(lambda x:
-        os.path.splitext(x)[0] + '.wav')
-    to_print = ['file-name', 'file-path']
-    tdf_df[to_print].drop_duplicates().to_csv(wav_scp_file_path, mode='a',
-        sep=' ', header=False, index=False)
-    print('Successfully saved wav.scp.')
-
-    # segments: <segment-id> <utt-id> start-time end-time
-    # Segment id = <speaker>-<file-name>_<start-time>-<end-time>
-    # (making speaker-id's prefixes of utterance-id's is related to Kaldi)
-    print('Saving segments file to %s.' % segments_file_path)
-    tdf_df['segment-id'] = tdf_df.apply(lambda row: '%s-%s_%s-%s' %
-        (row['speaker;unicode'], row['file-name'], str(row['start;float']),
-        str(row['end;float'])), axis=1)
-    # Strip and remove spaces from segment-id to avoid errors from Kaldi
-    tdf_df['segment-id'] = tdf_df['segment-id'].str.strip().replace(' ', '')
-    to_print = ['segment-id', 'file-name', 'start;float', 'end;float']
-    tdf_df[to_print].to_csv(segments_file_path, mode='a', sep=' ',
-        header=False, index=False)
-    print('Successfully saved segments file.')
-
-    # text: <utt-id> <utterance>
-    print('Saving text file to %s.' % text_file_path)
-    to_print = ['segment-id', 'transcript;unicode',]
-    tdf_df[to_print].to_csv(text_file_path, mode='a', sep='\t', header=False,
-        index=False)
-    print('Successfully saved text segments file.')
-
-    # utt2spk: <utt-id> <speaker>
-    # Use utt-id as a postfix to the speaker name to avoid ambiguity
-    # (some speakers are named as 'speaker 1' for example, so 'speaker 1'
-    # will exist in multiple LDC tdf files, although the speakers are
-    # different)
-    print('Saving utt2spk to %s.' % utt2spk_file_path)
-    tdf_df['speaker;unicode'] = tdf_df.apply(lambda row: '%s-%s' % (
-        str(row['speaker;unicode']), str(row['file-name'])),
-        axis=1)
-
-    to_print = ['segment-id', 'speaker;unicode',]
-    tdf_df[to_print].to_csv(utt2spk_file_path, mode='a', sep=' ',
-        header=False, index=False)
-    print('Successfully saved utt2spk.')
+    # Convert the tdf file chunk by chunk and append each chunk to the files
+    # in the format accepted by Kaldi
+    print('Converting %s to Kaldi files.' % tdf_file_path)
+    kaldi_files = {file_name: codecs.open(kaldi_data_dir_path + os.sep +
+        file_name, 'a', encoding='utf-8') for file_name in kaldi_file_names}
+    num_segments = 0
+    try:
+        for entries in iter_tdf2kaldi_entries(tdf_file_path, ignore_absent,
+            chunk_size):
+            for file_name in kaldi_file_names:
+                kaldi_files[file_name].write(''.join(entries[file_name]))
+            num_segments += len(entries['segments'])
+    finally:
+        for kaldi_file in kaldi_files.values():
+            kaldi_file.close()
+    print('Successfully saved %d segments to %s.' % (num_segments,
+        ', '.join(kaldi_file_names)))
 
     return 0
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
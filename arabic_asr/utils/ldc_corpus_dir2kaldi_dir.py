@@ -0,0 +1,226 @@
+#: Title : ldc_corpus_dir2kaldi_dir.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : Transform all TDF files of an LDC corpus to a single Kaldi
+#    data directory, parsing the TDF files in parallel
+#: Arguments :
+#  1- Path to the LDC corpus directory containing TDF files
+#  2- Destination of the Kaldi data directory
+
+import argparse
+import glob
+import multiprocessing
+import os
+from kaldi_data_dir import write_atomically
+from ldc_corpus2kaldi_dir import kaldi_file_names, tdf2kaldi_entries
+
+
+def parse_args():
+    ''' Parses command line arguments
+
+    Returns
+    -------
+
+    args : A dictionary of arguments
+    '''
+    # Arguments help strings
+    ldc_corpus_dir_path_help = ('Path to the LDC corpus directory containing '
+        'the tdf files.')
+    kaldi_data_dir_path_help = 'Destination of the Kaldi directory.'
+    ignore_absent_help = ('If set, characters absent from the target '
+        'character set will be ignored in the transliteration. If not, '
+        'absent characters will be output without mapping in the '
+        'transliteration.')
+    nj_help = ('Number of worker processes parsing tdf files. Default is the '
+        'number of CPU cores.')
+    allow_failures_help = ('If set, the Kaldi directory is written from the '
+        'tdf files which could be processed, and the exit status is only an '
+        'error if none could. By default, nothing is written and the exit '
+        'status is an error if any tdf file fails.')
+    # Parse arguments
+    arg_parser = argparse.ArgumentParser(description=('Transform the tdf '
+        'files of an LDC corpus to a sorted Kaldi data directory.'))
+    arg_parser.add_argument('ldc_corpus_dir_path', type=str,
+        help=ldc_corpus_dir_path_help)
+    arg_parser.add_argument('kaldi_data_dir_path', type=str,
+        help=kaldi_data_dir_path_help)
+    arg_parser.add_argument('--ignore-absent', action='store_true',
+        help=ignore_absent_help)
+    arg_parser.add_argument('--nj', type=int, default=None, help=nj_help)
+    arg_parser.add_argument('--allow-failures', dest='allow_failures',
+        action='store_true', help=allow_failures_help)
+    args = vars(arg_parser.parse_args())
+    return args
+
+
+def convert_tdf_file(job):
+    ''' Converts one TDF file inside a worker process.
+
+    Arguments
+    ---------
+
+    job : Tuple of the TDF file path and the ignore_absent flag.
+
+    Returns
+    -------
+
+    result : Tuple of the TDF file path, the Kaldi entries dictionary (None
+    on failure) and the error message (None on success).
+    '''
+    tdf_file_path, ignore_absent = job
+    try:
+        entries = tdf2kaldi_entries(tdf_file_path, ignore_absent)
+    except Exception as e:
+        return tdf_file_path, None, '%s: %s' % (type(e).__name__, e)
+    return tdf_file_path, entries, None
+
+
+def make_spk2utt(utt2spk_lines):
+    ''' Builds spk2utt entries from sorted utt2spk entries.
+
+    Arguments
+    ---------
+
+    utt2spk_lines : Sorted list of utt2spk lines.
+
+    Returns
+    -------
+
+    spk2utt_lines : Sorted list of spk2utt lines.
+    '''
+    spk2utts = dict()
+    for line in utt2spk_lines:
+        utt_id, spk = line.split()
+        spk2utts.setdefault(spk, []).append(utt_id)
+    return sorted('%s %s\n' % (spk, ' '.join(utt_ids)) for spk, utt_ids in
+        spk2utts.items())
+
+
+def merge_entries(merged, entries, conflicts):
+    ''' Adds the Kaldi entries of a TDF file to the entries merged so far.
+
+    Entries are keyed by their ID. An ID already merged keeps its first
+    entry, and IDs whose entries differ are counted in conflicts.
+    '''
+    for file_name in kaldi_file_names:
+        file_entries = merged[file_name]
+        for line in entries[file_name]:
+            key = line.split(None, 1)[0]
+            merged_line = file_entries.setdefault(key, line)
+            if merged_line != line:
+                conflicts[file_name].append(key)
+
+
+def ingest_corpus(tdf_file_paths, kaldi_data_dir_path, ignore_absent=False,
+    nj=None, allow_failures=False):
+    ''' Converts TDF files in parallel and writes a sorted Kaldi data
+    directory.
+
+    Duplicate entries are removed and every file is sorted in C locale order,
+    as expected by Kaldi's validate_data_dir.sh. When the same ID has
+    different entries (e.g. two transcripts of a segment), the entry of the
+    first TDF file (in the order of tdf_file_paths) is kept and the conflict
+    is reported. Files are replaced atomically, so existing files in the
+    directory are only overwritten once all TDF files were processed.
+
+    Arguments
+    ---------
+
+    tdf_file_paths : List of strings specifying paths to the TDF files.
+
+    kaldi_data_dir_path : String specifying the destination of the Kaldi
+    data directory.
+
+    ignore_absent : Boolean. See ldc_corpus2kaldi_dir.tdf2kaldi_entries.
+
+    nj : Integer specifying the number of worker processes. Default is the
+    number of CPU cores.
+
+    allow_failures : Boolean. If set to True, the directory is written from
+    the TDF files which could be processed. Otherwise nothing is written if
+    any TDF file fails.
+
+    Returns
+    -------
+
+    failed : List of tuples of TDF file paths that could not be processed
+    and the corresponding error messages.
+    '''
+    merged = {file_name: dict() for file_name in kaldi_file_names}
+    conflicts = {file_name: [] for file_name in kaldi_file_names}
+    failed = []
+    jobs = [(tdf_file_path, ignore_absent) for tdf_file_path in
+        tdf_file_paths]
+    pool = multiprocessing.Pool(nj)
+    try:
+        # Results are merged in the order of the TDF files, so the entries
+        # kept on conflicts do not depend on the scheduling of the workers
+        for tdf_file_path, entries, error in pool.imap(convert_tdf_file,
+            jobs):
+            if entries is None:
+                print('Error: Could not create Kaldi files for ldc corpus '
+                    'file %s (%s).' % (tdf_file_path, error))
+                failed.append((tdf_file_path, error))
+                continue
+            merge_entries(merged, entries, conflicts)
+            print('Successfully created Kaldi files for ldc corpus file %s.'
+                % tdf_file_path)
+    finally:
+        pool.close()
+        pool.join()
+
+    for file_name in kaldi_file_names:
+        keys = sorted(set(conflicts[file_name]))
+        if keys:
+            print('Warning: %d IDs have conflicting entries in %s; the first '
+                'entry was kept (e.g. %s).' % (len(keys), file_name,
+                ', '.join(keys[:5])))
+    if failed != [] and not allow_failures:
+        print('Error: The Kaldi directory was not written since %d LDC files '
+            'could not be processed.' % len(failed))
+        return failed
+
+    if not os.path.isdir(kaldi_data_dir_path):
+        os.makedirs(kaldi_data_dir_path)
+    # Python orders strings by code point, which matches the byte order of
+    # UTF-8 strings, i.e. 'LC_ALL=C sort'
+    sorted_entries = {file_name: sorted(lines.values()) for file_name, lines
+        in merged.items()}
+    sorted_entries['spk2utt'] = make_spk2utt(sorted_entries['utt2spk'])
+    for file_name, lines in sorted_entries.items():
+        write_atomically(os.path.join(kaldi_data_dir_path, file_name), lines)
+        print('Saved %d entries to %s.' % (len(lines), file_name))
+    return failed
+
+
+def main():
+    # Parse arguments
+    args = parse_args()
+    ldc_corpus_dir_path = args['ldc_corpus_dir_path']
+    kaldi_data_dir_path = args['kaldi_data_dir_path']
+
+    if not os.path.isdir(ldc_corpus_dir_path):
+        print('Error: LDC corpus directory does not exist in the specified '
+            'location: %s.' % ldc_corpus_dir_path)
+        return 1
+    tdf_file_paths = sorted(glob.glob(os.path.join(ldc_corpus_dir_path,
+        '*.tdf')))
+    if tdf_file_paths == []:
+        print('Error: No LDC corpus files found in the specified directory: '
+            '%s. Make sure files exist in tdf format.' % ldc_corpus_dir_path)
+        return 1
+
+    failed = ingest_corpus(tdf_file_paths, kaldi_data_dir_path,
+        args['ignore_absent'], args['nj'], args['allow_failures'])
+    print('Successfully processed %d LDC files.' % (len(tdf_file_paths) -
+        len(failed)))
+    if failed == []:
+        return 0
+    print('Warning: %d LDC files could not be processed.' % len(failed))
+    if args['allow_failures'] and len(failed) < len(tdf_file_paths):
+        return 0
+    return 1
+
+
+if __name__ == '__main__':
+    exit(main())
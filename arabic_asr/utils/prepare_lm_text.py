@@ -0,0 +1,211 @@
+#: Title : prepare_lm_text.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : Prepare language model training text in a single pass over
+#    a Kaldi text (or plain text) file, writing plain text, a variKN corpus
+#    and a variKN vocabulary. Files ending in .gz or .xz are compressed.
+#: Arguments :
+#  1- Path to Kaldi text ('-' for the standard input)
+#  Options --plain-text, --varikn-corpus and --varikn-vocab give the
+#  destinations of the outputs ('-' for the standard output).
+
+import argparse
+import gzip
+import io
+import lzma
+import os
+import sys
+from contextlib import ExitStack
+
+__author__ = "Ahmed Ismail"
+__license__ = "GPL"
+__version__ = "1.0"
+__email__ = "ahmed.ismail.zahran@gmail.com"
+__status__ = "Development"
+
+
+BUFFER_SIZE = 1 << 20
+# Approximate number of bytes of lines processed at a time
+BLOCK_SIZE = 1 << 24
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+SENTENCE_START = b'<s>'
+SENTENCE_END = b'</s>'
+
+
+def open_stream(file_path, mode='rb', buffer_size=BUFFER_SIZE):
+    ''' Opens a (possibly compressed) binary stream
+
+    Arguments
+    ---------
+
+    file_path : String specifying the path to the file, or '-' for the
+    standard input or output.
+
+    mode : 'rb' or 'wb'. Files are read as gzip or xz if they start with the
+    corresponding magic bytes, and written compressed if their name ends in
+    .gz or .xz.
+
+    buffer_size : Size of the I/O buffer in bytes.
+
+    Returns
+    -------
+
+    stream : Buffered binary file object. Closing it closes the file, but
+    not the standard input or output.
+    '''
+    if mode not in ['rb', 'wb']:
+        raise ValueError('Unsupported mode: %s.' % mode)
+    if file_path == '-':
+        std_stream = sys.stdin if mode == 'rb' else sys.stdout
+        target = io.open(std_stream.fileno(), mode, buffering=0,
+            closefd=False)
+    else:
+        target = file_path
+
+    if mode == 'rb':
+        if file_path == '-':
+            target = io.BufferedReader(target, buffer_size)
+            magic = target.peek(len(XZ_MAGIC))[:len(XZ_MAGIC)]
+        else:
+            with open(file_path, 'rb') as f:
+                magic = f.read(len(XZ_MAGIC))
+        if magic.startswith(GZIP_MAGIC):
+            return io.BufferedReader(gzip.open(target, 'rb'), buffer_size)
+        if magic.startswith(XZ_MAGIC):
+            return io.BufferedReader(lzma.open(target, 'rb'), buffer_size)
+        if file_path == '-':
+            return target
+        return open(file_path, 'rb', buffering=buffer_size)
+
+    if file_path.endswith('.gz'):
+        return io.BufferedWriter(gzip.open(target, 'wb', compresslevel=6),
+            buffer_size)
+    if file_path.endswith('.xz'):
+        return io.BufferedWriter(lzma.open(target, 'wb', preset=3),
+            buffer_size)
+    if file_path == '-':
+        return io.BufferedWriter(target, buffer_size)
+    return open(file_path, 'wb', buffering=buffer_size)
+
+
+def read_lexicon_words(lexicon_file_path):
+    ''' Reads the words (first column) of a Kaldi lexicon as bytes. '''
+    with open_stream(lexicon_file_path, 'rb') as lexicon_file:
+        return [fields[0] for fields in (line.split(None, 1) for line in
+            lexicon_file) if fields]
+
+
+def prepare_lm_text(text_file_path, plain_text_file_path=None,
+    corpus_file_path=None, vocab_file_path=None, lexicon_file_path=None,
+    has_utt_ids=True, block_size=BLOCK_SIZE):
+    ''' Writes language model training text in one pass over a text file
+
+    Arguments
+    ---------
+
+    text_file_path : String specifying the path to the Kaldi text.
+
+    plain_text_file_path : Destination of the text without utterance IDs, or
+    None.
+
+    corpus_file_path : Destination of the variKN corpus, which adds sentence
+    start and end symbols (<s> and </s> respectively) to every line of the
+    plain text, or None.
+
+    vocab_file_path : Destination of the variKN vocabulary, or None. It holds
+    <s>, </s> and the words of the lexicon if one is passed, or else the
+    sorted words of the text.
+
+    lexicon_file_path : String specifying the path to a Kaldi lexicon.
+
+    has_utt_ids : If False, the input is plain text (without utterance IDs).
+
+    block_size : Approximate number of bytes of lines processed at a time.
+
+    Returns
+    -------
+
+    num_lines : Number of lines read.
+    '''
+    output_paths = [plain_text_file_path, corpus_file_path]
+    collect_vocab = vocab_file_path is not None and lexicon_file_path is None
+    words = set()
+    num_lines = 0
+    with ExitStack() as stack:
+        plain_text_file, corpus_file = [stack.enter_context(open_stream(
+            path, 'wb')) if path is not None else None for path in
+            output_paths]
+        text_file = stack.enter_context(open_stream(text_file_path, 'rb'))
+        while True:
+            lines = text_file.readlines(block_size)
+            if not lines:
+                break
+            num_lines += len(lines)
+            # Remove the utterance IDs and normalize white space
+            if has_utt_ids:
+                sentences = [b' '.join(line.split()[1:]) for line in lines]
+            else:
+                sentences = [b' '.join(line.split()) for line in lines]
+            if plain_text_file is not None:
+                plain_text_file.write(b'\n'.join(sentences) + b'\n')
+            if corpus_file is not None:
+                corpus_file.write(b''.join([SENTENCE_START + b' ' + sentence
+                    + b' ' + SENTENCE_END + b'\n' for sentence in
+                    sentences]))
+            if collect_vocab:
+                for sentence in sentences:
+                    words.update(sentence.split())
+
+    if vocab_file_path is not None:
+        if lexicon_file_path is not None:
+            vocab = read_lexicon_words(lexicon_file_path)
+        else:
+            vocab = sorted(words)
+        with open_stream(vocab_file_path, 'wb') as vocab_file:
+            vocab_file.write(b'\n'.join([SENTENCE_START, SENTENCE_END] +
+                vocab) + b'\n')
+    return num_lines
+
+
+def main():
+    ''' Prepare language model training text from a Kaldi text.
+    '''
+    arg_parser = argparse.ArgumentParser(description=('Prepare language '
+        'model training text in one pass over a Kaldi text file. Files '
+        'ending in .gz or .xz are written compressed, and compressed inputs '
+        'are detected automatically.'))
+    arg_parser.add_argument('kaldi_text', type=str,
+        help=('Path to the file containing the Kaldi text corpus (- for the '
+        'standard input).'))
+    arg_parser.add_argument('--plain-text', dest='plain_text', type=str,
+        help='Path to output file to save the corpus as plain text.')
+    arg_parser.add_argument('--varikn-corpus', dest='varikn_corpus',
+        type=str, help='Path to output file to save the variKN corpus.')
+    arg_parser.add_argument('--varikn-vocab', dest='varikn_vocab', type=str,
+        help='Path to output file to save the variKN vocabulary.')
+    arg_parser.add_argument('--lexicon', type=str, help=('Path to a Kaldi '
+        'lexicon to take the variKN vocabulary from. Default is the words of '
+        'the text.'))
+    arg_parser.add_argument('--no-utt-ids', dest='has_utt_ids',
+        action='store_false', help=('The input is plain text without '
+        'utterance IDs.'))
+    args = vars(arg_parser.parse_args())
+
+    if not any(args[name] for name in ['plain_text', 'varikn_corpus',
+        'varikn_vocab']):
+        arg_parser.error('No output requested.')
+    for name in ['kaldi_text', 'lexicon']:
+        if args[name] not in [None, '-'] and not os.path.exists(args[name]):
+            print('Could not find file in specified location: %s.' %
+                args[name])
+            exit(1)
+
+    num_lines = prepare_lm_text(args['kaldi_text'], args['plain_text'],
+        args['varikn_corpus'], args['varikn_vocab'], args['lexicon'],
+        args['has_utt_ids'])
+    print('%d lines were processed.' % num_lines, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
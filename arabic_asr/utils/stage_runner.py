@@ -0,0 +1,348 @@
+#: Title : stage_runner.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : Run the stages of a recipe as a DAG, skipping stages whose
+#    command, inputs and upstream stages have not changed since they last
+#    completed, and running independent stages concurrently
+
+import hashlib
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from kaldi_data_dir import write_atomically
+
+__author__ = "Ahmed Ismail"
+__license__ = "GPL"
+__version__ = "1.0"
+__email__ = "ahmed.ismail.zahran@gmail.com"
+__status__ = "Development"
+
+
+STAMP_DIR = 'exp/.stamps'
+HASH_CACHE_FILE_NAME = 'hashes.json'
+# Directories left out of directory hashes (Kaldi logs, job queues, data
+# directory splits and backups, and caches)
+ignored_dir_names = set(['log', 'q', '.backup', '.kaldi_index',
+    '.symbol_tables'])
+ignored_dir_prefixes = ('split',)
+MISSING = 'missing'
+
+
+class Stage(object):
+    ''' A stage of a recipe '''
+
+    def __init__(self, name, command, inputs=(), outputs=(), after=()):
+        ''' Declares a stage
+
+        Arguments
+        ---------
+
+        name : String naming the stage.
+
+        command : Bash command running the stage.
+
+        inputs : Paths (files or directories) the stage reads. A stage is
+        re-run when their content changes.
+
+        outputs : Paths the stage writes. A stage which reads a path written
+        by a stage declared before it depends on that stage.
+
+        after : Names of other stages the stage depends on.
+        '''
+        self.name = name
+        self.command = command
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = list(after)
+
+
+def _is_within(path, parent_path):
+    ''' Tells whether a path is or is inside another path. '''
+    path = os.path.normpath(path)
+    parent_path = os.path.normpath(parent_path)
+    return path == parent_path or path.startswith(parent_path + os.sep)
+
+
+def _overlaps(path, other_path):
+    ''' Tells whether a path is, contains or is inside another path. '''
+    path = os.path.normpath(path)
+    other_path = os.path.normpath(other_path)
+    return path == other_path or path.startswith(other_path + os.sep) or \
+        other_path.startswith(path + os.sep)
+
+
+class FileHasher(object):
+    ''' Content hashes of files and directories, cached by file size and
+    modification time so unchanged files are not read again. '''
+
+    def __init__(self, cache_file_path=None):
+        self.cache_file_path = cache_file_path
+        self.cache = dict()
+        self.lock = threading.Lock()
+        if cache_file_path is not None and os.path.exists(cache_file_path):
+            with open(cache_file_path, 'r') as cache_file:
+                try:
+                    self.cache = json.load(cache_file)
+                except ValueError:
+                    self.cache = dict()
+
+    def hash_file(self, file_path):
+        ''' Returns the SHA-1 hex digest of a file. '''
+        stat = os.stat(file_path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        with self.lock:
+            cached = self.cache.get(file_path)
+        if cached is not None and cached[:2] == signature:
+            return cached[2]
+        sha1 = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(block)
+        digest = sha1.hexdigest()
+        with self.lock:
+            self.cache[file_path] = signature + [digest]
+        return digest
+
+    def hash_path(self, path, excluded_paths=()):
+        ''' Hashes a file, or the relative paths and contents of the files
+        of a directory (leaving out ignored directories and any path inside
+        excluded_paths). '''
+        if os.path.isfile(path):
+            return self.hash_file(path)
+        if not os.path.isdir(path):
+            return MISSING
+        sha1 = hashlib.sha1()
+        for dir_path, dir_names, file_names in os.walk(path):
+            dir_names[:] = sorted(name for name in dir_names if name not in
+                ignored_dir_names and not name.startswith(
+                ignored_dir_prefixes) and not any(_is_within(os.path.join(
+                dir_path, name), excluded) for excluded in excluded_paths))
+            for file_name in sorted(file_names):
+                file_path = os.path.join(dir_path, file_name)
+                if any(_is_within(file_path, excluded) for excluded in
+                    excluded_paths):
+                    continue
+                sha1.update(os.path.relpath(file_path, path).encode('utf-8'))
+                sha1.update(self.hash_file(file_path).encode('ascii'))
+        return sha1.hexdigest()
+
+    def save(self):
+        ''' Saves the hash cache. '''
+        if self.cache_file_path is None:
+            return
+        with self.lock:
+            data = json.dumps(self.cache)
+        write_atomically(self.cache_file_path, [data])
+
+
+class StageRunner(object):
+    ''' Runs the stages of a recipe '''
+
+    def __init__(self, stages, preamble='', stamp_dir_path=STAMP_DIR,
+        max_parallel=1, cwd='.'):
+        ''' Creates a stage runner
+
+        Arguments
+        ---------
+
+        stages : List of Stage objects, in recipe order (a stage may only
+        depend on stages declared before it).
+
+        preamble : Bash commands run before the command of every stage (e.g.
+        sourcing cmd.sh and path.sh). It is not part of the stage hashes.
+
+        stamp_dir_path : Directory of the completion stamps and stage logs,
+        relative to cwd.
+
+        max_parallel : Maximum number of stages run at a time.
+
+        cwd : Directory the stages run in. Stage paths are relative to it.
+        '''
+        self.stages = stages
+        self.stage_map = dict((stage.name, stage) for stage in stages)
+        if len(self.stage_map) != len(stages):
+            raise ValueError('Stage names are not unique.')
+        self.preamble = preamble
+        self.cwd = cwd
+        self.stamp_dir_path = os.path.join(cwd, stamp_dir_path)
+        self.max_parallel = max_parallel
+        self.deps = self._dependencies()
+        self.keys = dict()
+        self.hasher = FileHasher(os.path.join(self.stamp_dir_path,
+            HASH_CACHE_FILE_NAME))
+
+    def _dependencies(self):
+        deps = dict()
+        for i, stage in enumerate(self.stages):
+            stage_deps = set()
+            for name in stage.after:
+                if name not in self.stage_map:
+                    raise ValueError('Stage %s depends on unknown stage %s.'
+                        % (stage.name, name))
+                stage_deps.add(name)
+            for earlier in self.stages[:i]:
+                if any(_overlaps(input_path, output_path) for input_path in
+                    stage.inputs for output_path in earlier.outputs):
+                    stage_deps.add(earlier.name)
+            deps[stage.name] = stage_deps
+        return deps
+
+    def ancestors(self, names):
+        ''' Returns the names of the given stages and of all the stages they
+        depend on. '''
+        selected = set()
+        stack = list(names)
+        while stack:
+            name = stack.pop()
+            if name not in self.stage_map:
+                raise ValueError('Unknown stage: %s.' % name)
+            if name not in selected:
+                selected.add(name)
+                stack.extend(self.deps[name])
+        return selected
+
+    def _path(self, path):
+        return os.path.join(self.cwd, path)
+
+    def stage_key(self, stage):
+        ''' Hashes the command, inputs and upstream stage keys of a stage.
+        The stage's own outputs are left out of its input hashes. '''
+        sha1 = hashlib.sha1(stage.command.encode('utf-8'))
+        outputs = [self._path(path) for path in stage.outputs]
+        for path in stage.inputs:
+            sha1.update(path.encode('utf-8'))
+            sha1.update(self.hasher.hash_path(self._path(path),
+                outputs).encode('ascii'))
+        for name in sorted(self.deps[stage.name]):
+            sha1.update(name.encode('utf-8'))
+            sha1.update(self.keys.get(name, MISSING).encode('ascii'))
+        return sha1.hexdigest()
+
+    def _stamp_file_path(self, stage):
+        return os.path.join(self.stamp_dir_path, stage.name + '.stamp')
+
+    def is_up_to_date(self, stage, key):
+        ''' Tells whether a stage completed with the same key and its
+        outputs still exist. '''
+        stamp_file_path = self._stamp_file_path(stage)
+        if not os.path.exists(stamp_file_path):
+            return False
+        with open(stamp_file_path, 'r') as stamp_file:
+            try:
+                stamp = json.load(stamp_file)
+            except ValueError:
+                return False
+        return stamp.get('key') == key and all(os.path.exists(self._path(
+            path)) for path in stage.outputs)
+
+    def run_stage(self, stage, force=False, dry_run=False):
+        ''' Runs a stage unless it is up to date
+
+        Returns
+        -------
+
+        status : 'skipped', 'ran' or 'would run'.
+        '''
+        key = self.stage_key(stage)
+        self.keys[stage.name] = key
+        if not force and self.is_up_to_date(stage, key):
+            return 'skipped'
+        if dry_run:
+            return 'would run'
+        stamp_file_path = self._stamp_file_path(stage)
+        if os.path.exists(stamp_file_path):
+            os.remove(stamp_file_path)
+        log_file_path = os.path.join(self.stamp_dir_path, stage.name + '.log')
+        start = time.time()
+        with open(log_file_path, 'w') as log_file:
+            subprocess.run(['bash', '-c', self.preamble + '\nset -e\n' +
+                stage.command], cwd=self.cwd, stdout=log_file,
+                stderr=subprocess.STDOUT, check=True)
+        write_atomically(stamp_file_path, [json.dumps({'key': key,
+            'command': stage.command, 'seconds': time.time() - start})])
+        self.hasher.save()
+        return 'ran'
+
+    def run(self, targets=None, force=(), dry_run=False, report=print):
+        ''' Runs the stages needed for the targets
+
+        Stages run as soon as the stages they depend on are done, with at
+        most max_parallel stages at a time. Once a stage fails, no new stage
+        is started.
+
+        Arguments
+        ---------
+
+        targets : Names of the stages to bring up to date, along with the
+        stages they depend on. Default is all stages.
+
+        force : Names of stages to run even if they are up to date, along
+        with the stages depending on them.
+
+        dry_run : If True, report what would run without running anything.
+        In a dry run, a stage depending on a stage which would run is
+        reported as running too.
+
+        report : Function called with progress messages.
+
+        Returns
+        -------
+
+        statuses : Dictionary mapping stage names to 'skipped', 'ran',
+        'would run', 'failed' or 'not run'.
+        '''
+        if not os.path.isdir(self.stamp_dir_path):
+            os.makedirs(self.stamp_dir_path)
+        selected = self.ancestors(targets) if targets else set(
+            self.stage_map)
+        order = [stage.name for stage in self.stages if stage.name in
+            selected]
+        force = set(force)
+        for stage in self.stages:
+            if self.deps[stage.name] & force:
+                force.add(stage.name)
+        statuses = dict()
+        pending = list(order)
+        running = dict()
+
+        def submit(pool, name):
+            stage = self.stage_map[name]
+            upstream_ran = any(statuses.get(dep) == 'would run' for dep in
+                self.deps[name])
+            report('[%s] started' % name if not dry_run else '[%s] checking' %
+                name)
+            running[pool.submit(self.run_stage, stage, name in force or
+                upstream_ran, dry_run)] = name
+
+        with ThreadPoolExecutor(self.max_parallel) as pool:
+            while pending or running:
+                failed = any(status == 'failed' for status in
+                    statuses.values())
+                if not failed:
+                    for name in list(pending):
+                        if len(running) >= self.max_parallel:
+                            break
+                        if all(dep in statuses or dep not in selected for
+                            dep in self.deps[name]):
+                            pending.remove(name)
+                            submit(pool, name)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        statuses[name] = future.result()
+                    except subprocess.CalledProcessError:
+                        statuses[name] = 'failed'
+                        report('[%s] failed, see %s' % (name, os.path.join(
+                            self.stamp_dir_path, name + '.log')))
+                        continue
+                    report('[%s] %s' % (name, statuses[name]))
+        for name in pending:
+            statuses[name] = 'not run'
+        self.hasher.save()
+        return statuses
@@ -0,0 +1,309 @@
+#: Title : symbol_table.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : Compiled Kaldi symbol table, giving transliterated words
+#    by integer word ID
+#: Arguments (when run as a script) :
+#  1- Path to Kaldi words file
+#  2- Directory to store the compiled symbol table in [optional]
+
+import argparse
+import hashlib
+import json
+import os
+import re
+from kaldi_data_dir import write_atomically
+from transliteration import transliterate_batch
+
+__author__ = "Ahmed Ismail"
+__license__ = "GPL"
+__version__ = "1.0"
+__email__ = "ahmed.ismail.zahran@gmail.com"
+__status__ = "Development"
+
+
+# Version of the compiled format, part of the cache key
+FORMAT_VERSION = 2
+MAGIC = b'SYMTAB1\n'
+
+# Flags of the symbols
+FLAG_MISSING = 1  # No word has this ID in the words file
+FLAG_SPECIAL = 2  # <eps>, <s>, </s>, #0, ... (see special_symbols)
+FLAG_UNK = 4  # The unknown word symbol
+
+UNK_SYMBOL = '<UNK>'
+# Symbols which are not words. Buckwalter words may start with '<' (alef
+# with hamza below) and end with '>' (alef with hamza above), so special
+# symbols are listed explicitly instead of being matched by their brackets.
+special_symbols = set(['<eps>', '<s>', '</s>', '!SIL'])
+# Disambiguation symbols #0, #1, ...
+_disambig_re = re.compile(r'^#\d+$')
+
+
+def hash_file(file_path, block_size=1 << 20):
+    ''' Returns the SHA-1 hex digest of a file. '''
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def read_words_file(words_file_path):
+    ''' Reads a Kaldi words file
+
+    Arguments
+    ---------
+
+    words_file_path : String specifying the path to the Kaldi words file.
+    Each line should be in the form: <word> <word_number>
+
+    Returns
+    -------
+
+    words : List of words indexed by word number, with None for numbers not
+    found in the file.
+    '''
+    word_map = dict()
+    with open(words_file_path, 'r', encoding='utf-8') as words_file:
+        for line in words_file:
+            fields = line.split()
+            if fields == []:
+                continue
+            if len(fields) != 2 or not fields[1].isdigit():
+                raise ValueError(('Word file is not in specified format. '
+                    'Each line should be in the form: <word> <word_number>'))
+            word_map[int(fields[1])] = fields[0]
+    words = [None] * (max(word_map) + 1 if word_map else 0)
+    for word_num, word in word_map.items():
+        words[word_num] = word
+    return words
+
+
+class SymbolTable(object):
+    ''' Symbol table indexed by integer word ID
+
+    Words are stored already transliterated, with flags marking special
+    symbols, so decoding a word ID is a list lookup.
+    '''
+
+    def __init__(self, words, flags, file_path=None):
+        ''' Creates a symbol table
+
+        Arguments
+        ---------
+
+        words : List of (transliterated) words indexed by word ID.
+
+        flags : Bytes of symbol flags indexed by word ID.
+
+        file_path : String specifying the compiled file the table was loaded
+        from, if any.
+        '''
+        self.words = words
+        self.flags = flags
+        self.file_path = file_path
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, word_id):
+        return self.words[word_id]
+
+    def decode(self, word_ids, skip_flags=FLAG_UNK | FLAG_MISSING):
+        ''' Decodes word IDs to words
+
+        Arguments
+        ---------
+
+        word_ids : Iterable of integer word IDs.
+
+        skip_flags : Integer. Words with any of these flags are left out.
+        Default is to leave out <UNK> and unknown IDs. IDs outside the table
+        are unknown (FLAG_MISSING), like the gaps in it.
+
+        Returns
+        -------
+
+        words : List of words, where unknown IDs which are not left out are
+        None.
+        '''
+        words = self.words
+        flags = self.flags
+        num_words = len(words)
+        return [words[i] if 0 <= i < num_words else None for i in word_ids
+            if not (flags[i] if 0 <= i < num_words else FLAG_MISSING) &
+            skip_flags]
+
+    def __getstate__(self):
+        # Tables loaded from a compiled file are reloaded from it when passed
+        # to another process, instead of pickling all the words
+        if self.file_path is not None:
+            return {'file_path': self.file_path}
+        return {'words': self.words, 'flags': self.flags, 'file_path': None}
+
+    def __setstate__(self, state):
+        if state['file_path'] is not None:
+            state = load(state['file_path']).__dict__
+        self.__dict__.update(state)
+
+
+def is_special(word):
+    ''' Returns whether a symbol of a words file is not a real word. '''
+    return word in special_symbols or _disambig_re.match(word) is not None
+
+
+def compile_words(words, input_format='buckwalter', output_format='unicode',
+    unk_symbol=UNK_SYMBOL):
+    ''' Compiles a list of words into a SymbolTable
+
+    Arguments
+    ---------
+
+    words : List of words indexed by word ID (None for missing IDs).
+
+    input_format : String describing the format of the words.
+
+    output_format : String describing the format of the compiled words.
+    Special symbols are not transliterated.
+
+    unk_symbol : String specifying the unknown word symbol.
+
+    Returns
+    -------
+
+    symbol_table : SymbolTable object.
+    '''
+    flags = bytearray(len(words))
+    for i, word in enumerate(words):
+        if word is None:
+            flags[i] = FLAG_MISSING
+        elif word == unk_symbol:
+            flags[i] = FLAG_SPECIAL | FLAG_UNK
+        elif is_special(word):
+            flags[i] = FLAG_SPECIAL
+    plain = [i for i, flag in enumerate(flags) if flag == 0]
+    compiled = [word if word is not None else '' for word in words]
+    for i, word in zip(plain, transliterate_batch([words[i] for i in plain],
+        input_format, output_format)):
+        compiled[i] = word
+    return SymbolTable(compiled, bytes(flags))
+
+
+def save(symbol_table, file_path, header=None):
+    ''' Saves a symbol table in the compiled format
+
+    The file holds a magic line, a JSON header line, the flags (one byte per
+    word ID) and the newline-separated UTF-8 words.
+    '''
+    blob = '\n'.join(symbol_table.words).encode('utf-8')
+    header = dict(header or {})
+    header.update({'count': len(symbol_table), 'words_bytes': len(blob)})
+    write_atomically(file_path, [MAGIC, json.dumps(header).encode('utf-8') +
+        b'\n', symbol_table.flags, blob], encoding=None)
+
+
+def load(file_path):
+    ''' Loads a compiled symbol table
+
+    Returns
+    -------
+
+    symbol_table : SymbolTable object, or None if the file is not a valid
+    compiled symbol table.
+    '''
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    try:
+        if data[:len(MAGIC)] != MAGIC:
+            return None
+        header_end = data.find(b'\n', len(MAGIC))
+        header = json.loads(data[len(MAGIC):header_end].decode('utf-8'))
+        flags_start = header_end + 1
+        words_start = flags_start + header['count']
+        if words_start + header['words_bytes'] != len(data):
+            return None
+        flags = data[flags_start:words_start]
+        words = data[words_start:].decode('utf-8').split('\n') if \
+            header['count'] else []
+    except (ValueError, KeyError):
+        return None
+    if len(words) != header['count']:
+        return None
+    return SymbolTable(words, flags, file_path)
+
+
+def get_symbol_table(words_file_path, input_format='buckwalter',
+    output_format='unicode', cache_dir_path=None, unk_symbol=UNK_SYMBOL):
+    ''' Returns the compiled symbol table of a Kaldi words file
+
+    Compiled tables are cached in cache_dir_path, keyed by the hash of the
+    words file, the formats and the unknown word symbol, so a words file is
+    only compiled once.
+
+    Arguments
+    ---------
+
+    words_file_path : String specifying the path to the Kaldi words file.
+
+    input_format : String describing the format of the words.
+
+    output_format : String describing the format of the compiled words.
+
+    cache_dir_path : String specifying the cache directory. Default is a
+    '.symbol_tables' directory next to the words file. If the directory
+    cannot be written, the table is compiled in memory.
+
+    unk_symbol : String specifying the unknown word symbol.
+
+    Returns
+    -------
+
+    symbol_table : SymbolTable object.
+    '''
+    if cache_dir_path is None:
+        cache_dir_path = os.path.join(os.path.dirname(os.path.abspath(
+            words_file_path)), '.symbol_tables')
+    words_sha1 = hash_file(words_file_path)
+    unk_sha1 = hashlib.sha1(unk_symbol.encode('utf-8')).hexdigest()
+    cache_file_path = os.path.join(cache_dir_path, '%s.%s-%s.%s.v%d.symtab' %
+        (words_sha1, input_format, output_format, unk_sha1[:8],
+        FORMAT_VERSION))
+    if os.path.exists(cache_file_path):
+        symbol_table = load(cache_file_path)
+        if symbol_table is not None:
+            return symbol_table
+    symbol_table = compile_words(read_words_file(words_file_path),
+        input_format, output_format, unk_symbol)
+    try:
+        if not os.path.isdir(cache_dir_path):
+            os.makedirs(cache_dir_path)
+        save(symbol_table, cache_file_path, {'words_sha1': words_sha1,
+            'input_format': input_format, 'output_format': output_format,
+            'unk_symbol': unk_symbol})
+    except OSError:
+        print('Warning: Could not save compiled symbol table to %s.' %
+            cache_file_path)
+        return symbol_table
+    return load(cache_file_path)
+
+
+def main():
+    ''' Compile a Kaldi words file into the symbol table cache.
+    '''
+    arg_parser = argparse.ArgumentParser(description=('Compile a Kaldi words '
+        'file into a transliterated symbol table.'))
+    arg_parser.add_argument('words_file_path', type=str,
+        help='Path to the Kaldi words file.')
+    arg_parser.add_argument('cache_dir_path', type=str, nargs='?',
+        help=('Directory to store the compiled symbol table in. Default is '
+        'a .symbol_tables directory next to the words file.'))
+    args = vars(arg_parser.parse_args())
+    symbol_table = get_symbol_table(args['words_file_path'],
+        cache_dir_path=args['cache_dir_path'])
+    print('Compiled %d symbols to %s.' % (len(symbol_table),
+        symbol_table.file_path))
+
+
+if __name__ == '__main__':
+    main()
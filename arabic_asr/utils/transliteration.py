@@ -1,7 +1,14 @@
 #: Title : transliteration.py
 #: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
 #: Version : 1.0
-#: Description : Functions to perform transliteration on a sentence
+#: Description : Functions to perform transliteration on a sentence, a
+#    batch of sentences or a whole file
+#: Arguments (when run as a script) :
+#  1- Path to the input text file
+#  2- Destination of the transliterated text file
+
+import argparse
+import io
 
 
 # Unicode/Buckwalter dictionary
@@ -22,6 +29,92 @@ unicode2buckwalter_dict = {u'\u0621': '\'', u'\u0622': '|', u'\u0623': '>',
 buckwalter2unicode_dict = {value: key for key, value in
     unicode2buckwalter_dict.items()}
 
+mappings = {('unicode', 'buckwalter'): unicode2buckwalter_dict,
+    ('buckwalter', 'unicode'): buckwalter2unicode_dict}
+
+# Size (in characters) of the blocks read when transliterating a file
+BUFFER_SIZE = 1 << 20
+
+
+class _IgnoreAbsentTable(dict):
+    ''' Translation table for str.translate which deletes characters absent
+    from the mapping.
+
+    The first lookup of an absent character is resolved in Python and cached
+    in the table, so every later occurrence is handled by str.translate
+    without leaving C.
+    '''
+
+    def __missing__(self, key):
+        self[key] = None
+        return None
+
+
+def _compile_table(mapping, ignore_absent, keep=''):
+    ''' Compiles a character mapping into a str.translate table.
+
+    Arguments
+    ---------
+
+    mapping : Dictionary mapping input characters to output strings.
+
+    ignore_absent : Boolean. If set to True, the table deletes characters
+    absent from the mapping.
+
+    keep : String of characters to pass through unchanged when they are
+    absent from the mapping, even if ignore_absent is set.
+
+    Returns
+    -------
+
+    table : Dictionary of code points usable with str.translate.
+    '''
+    table = _IgnoreAbsentTable() if ignore_absent else dict()
+    table.update({ord(c): c for c in keep})
+    table.update({ord(c): t for c, t in mapping.items()})
+    return table
+
+
+# Translation tables compiled once for every direction and both modes of
+# ignore_absent
+translation_tables = {(formats, ignore_absent): _compile_table(mapping,
+    ignore_absent) for formats, mapping in mappings.items()
+    for ignore_absent in (False, True)}
+
+# Same tables, but keeping line breaks, for transliterating whole files
+_file_translation_tables = {(formats, ignore_absent): _compile_table(
+    mapping, ignore_absent, keep='\n') for formats, mapping in
+    mappings.items() for ignore_absent in (False, True)}
+
+
+def get_translation_table(input_format='unicode', output_format='buckwalter',
+    ignore_absent=False):
+    ''' Returns the compiled str.translate table for a transliteration
+
+    Arguments
+    ---------
+
+    input_format : String describing input text format. Default is 'unicode'.
+
+    output_format : String describing output text format.
+    Default is 'buckwalter'.
+
+    ignore_absent : Boolean. See transliterate. Default is False.
+
+    Returns
+    -------
+
+    table : Dictionary usable with str.translate, or None if the input and
+    output formats are the same.
+    '''
+    if input_format == output_format:
+        return None
+    key = ((input_format, output_format), bool(ignore_absent))
+    if key not in translation_tables:
+        raise Exception('Unknown mapping formats defined.')
+    return translation_tables[key]
+
+
 
 def transliterate(text, input_format='unicode', output_format='buckwalter',
     ignore_absent=False):
@@ -48,18 +141,143 @@ def transliterate(text, input_format='unicode', output_format='buckwalter',
     text : String containing transliterated text.
     '''
 
-    if input_format == output_format:
+    table = get_translation_table(input_format, output_format, ignore_absent)
+    if table is None:
         return text
+    return text.translate(table)
 
-    if input_format == 'unicode' and output_format == 'buckwalter':
-        mapping = unicode2buckwalter_dict
-    elif input_format == 'buckwalter' and output_format == 'unicode':
-        mapping = buckwalter2unicode_dict
-    else:
-        raise Exception('Unknown mapping formats defined.')
 
-    if ignore_absent:
-        text = ''.join([mapping[c] if c in mapping else '' for c in text])
+def transliterate_batch(texts, input_format='unicode',
+    output_format='buckwalter', ignore_absent=False):
+    ''' Transliterates a batch of sentences using the specified mapping
+
+    Arguments
+    ---------
+
+    texts : Pandas Series of strings, or any iterable of strings.
+
+    input_format : String describing input text format. Default is 'unicode'.
+
+    output_format : String describing output text format.
+    Default is 'buckwalter'.
+
+    ignore_absent : Boolean. See transliterate. Default is False.
+
+    Returns
+    -------
+
+    texts : Pandas Series of transliterated strings if a Series was passed,
+    otherwise a list of transliterated strings.
+    '''
+    table = get_translation_table(input_format, output_format, ignore_absent)
+    # Pandas Series are translated through the vectorized string accessor
+    if hasattr(texts, 'str'):
+        if table is None:
+            return texts.copy()
+        return texts.str.translate(table)
+    if table is None:
+        return list(texts)
+    return [text.translate(table) for text in texts]
+
+
+def transliterate_file(input_file_path, output_file_path,
+    input_format='unicode', output_format='buckwalter', ignore_absent=False,
+    buffer_size=BUFFER_SIZE):
+    ''' Transliterates a text file into another file as a stream
+
+    The input is read in blocks of buffer_size characters, so memory use does
+    not depend on the size of the file. Line breaks are always kept, even if
+    ignore_absent is set.
+
+    Arguments
+    ---------
+
+    input_file_path : String specifying the path to the UTF-8 text file to
+    transliterate.
+
+    output_file_path : String specifying the destination of the
+    transliterated text.
+
+    input_format : String describing input text format. Default is 'unicode'.
+
+    output_format : String describing output text format.
+    Default is 'buckwalter'.
+
+    ignore_absent : Boolean. See transliterate. Default is False.
+
+    buffer_size : Integer specifying the number of characters read at a time.
+
+    Returns
+    -------
+
+    num_chars : Integer specifying the number of characters read.
+    '''
+    # Validate the formats before opening any file
+    get_translation_table(input_format, output_format, ignore_absent)
+    if input_format == output_format:
+        table = None
     else:
-        text = ''.join([mapping[c] if c in mapping else c for c in text])
-    return text
\ No newline at end of file
+        table = _file_translation_tables[((input_format, output_format),
+            bool(ignore_absent))]
+    num_chars = 0
+    with io.open(input_file_path, 'r', encoding='utf-8', newline='') as \
+        input_file, io.open(output_file_path, 'w', encoding='utf-8',
+        newline='') as output_file:
+        while True:
+            block = input_file.read(buffer_size)
+            if not block:
+                break
+            num_chars += len(block)
+            if table is not None:
+                block = block.translate(table)
+            output_file.write(block)
+    return num_chars
+
+
+def parse_args():
+    ''' Parses command line arguments
+
+    Returns
+    -------
+
+    args : A dictionary of arguments
+    '''
+    # Arguments help strings
+    input_file_path_help = 'Path to the UTF-8 text file to transliterate.'
+    output_file_path_help = 'Destination of the transliterated text file.'
+    input_format_help = 'Input text format. Default is unicode.'
+    output_format_help = 'Output text format. Default is buckwalter.'
+    ignore_absent_help = ('If set, characters absent from the target '
+        'character set will be ignored in the transliteration. If not, '
+        'absent characters will be output without mapping in the '
+        'transliteration.')
+    # Parse arguments
+    arg_parser = argparse.ArgumentParser(description=('Transliterate a text '
+        'file.'))
+    arg_parser.add_argument('input_file_path', type=str,
+        help=input_file_path_help)
+    arg_parser.add_argument('output_file_path', type=str,
+        help=output_file_path_help)
+    arg_parser.add_argument('--input-format', dest='input_format', type=str,
+        default='unicode', choices=['unicode', 'buckwalter'],
+        help=input_format_help)
+    arg_parser.add_argument('--output-format', dest='output_format',
+        type=str, default='buckwalter', choices=['unicode', 'buckwalter'],
+        help=output_format_help)
+    arg_parser.add_argument('--ignore-absent', action='store_true',
+        help=ignore_absent_help)
+    args = vars(arg_parser.parse_args())
+    return args
+
+
+def main():
+    args = parse_args()
+    num_chars = transliterate_file(args['input_file_path'],
+        args['output_file_path'], args['input_format'],
+        args['output_format'], args['ignore_absent'])
+    print('Transliterated %d characters.' % num_chars)
+    return 0
+
+
+if __name__ == '__main__':
+    main()
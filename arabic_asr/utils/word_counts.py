@@ -0,0 +1,210 @@
+#: Title : word_counts.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : Count the words of a (Kaldi) text file in parallel over
+#    newline-aligned byte ranges
+#: Arguments (when run as a script) :
+#  1- Path to Kaldi text
+#  2- Destination of the word counts
+
+import argparse
+import os
+import re
+from collections import Counter
+from multiprocessing import Pool, cpu_count
+
+__author__ = "Ahmed Ismail"
+__license__ = "GPL"
+__version__ = "1.0"
+__email__ = "ahmed.ismail.zahran@gmail.com"
+__status__ = "Development"
+
+
+# Size of the blocks read by the workers
+BLOCK_SIZE = 1 << 26
+# Minimum size of a byte range counted by a worker
+MIN_RANGE_SIZE = 1 << 20
+
+_first_field_re = re.compile(rb'^[ \t]*\S+', re.MULTILINE)
+
+
+def byte_ranges(file_path, num_ranges):
+    ''' Splits a file into newline-aligned byte ranges
+
+    Arguments
+    ---------
+
+    file_path : String specifying the path to the file.
+
+    num_ranges : Maximum number of ranges.
+
+    Returns
+    -------
+
+    ranges : List of (start, end) byte offsets covering the file. Every range
+    but the first starts right after a newline.
+    '''
+    size = os.path.getsize(file_path)
+    num_ranges = max(1, min(num_ranges, size // MIN_RANGE_SIZE))
+    bounds = [0]
+    with open(file_path, 'rb') as f:
+        for i in range(1, num_ranges):
+            offset = max(size * i // num_ranges, bounds[-1])
+            f.seek(offset)
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if
+        end > start]
+
+
+def _iter_blocks(file_path, start, end, block_size=BLOCK_SIZE):
+    ''' Reads a byte range in blocks of whole lines. '''
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        tail = b''
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            block = tail + block
+            cut = block.rfind(b'\n') + 1 if remaining > 0 else len(block)
+            tail = block[cut:]
+            yield block[:cut]
+        if tail:
+            yield tail
+
+
+def count_block(block, skip_first_field=True):
+    ''' Counts the words of a block of whole lines
+
+    Arguments
+    ---------
+
+    block : Bytes of whole lines.
+
+    skip_first_field : If True, the first field of every line (the utterance
+    ID of a Kaldi text) is not counted.
+
+    Returns
+    -------
+
+    counts : Counter of bytes words.
+    '''
+    if skip_first_field:
+        block = _first_field_re.sub(b'', block)
+    return Counter(block.split())
+
+
+def _count_range(job):
+    file_path, start, end, skip_first_field = job
+    counts = Counter()
+    for block in _iter_blocks(file_path, start, end):
+        counts.update(count_block(block, skip_first_field))
+    return counts
+
+
+def count_words(text_file_path, nj=None, skip_first_field=True):
+    ''' Counts the words of a text file with parallel workers
+
+    The file is split into newline-aligned byte ranges, the words of every
+    range are counted by a worker process, and the counters are merged.
+
+    Arguments
+    ---------
+
+    text_file_path : String specifying the path to the text file.
+
+    nj : Number of worker processes. Default is the number of CPUs.
+
+    skip_first_field : If True, the first field of every line (the utterance
+    ID of a Kaldi text) is not counted.
+
+    Returns
+    -------
+
+    counts : Counter of (unicode) words.
+    '''
+    if not os.path.exists(text_file_path):
+        raise IOError('Could not find text file in specified location: %s.'
+            % text_file_path)
+    nj = nj or cpu_count()
+    jobs = [(text_file_path, start, end, skip_first_field) for start, end in
+        byte_ranges(text_file_path, nj)]
+    counts = Counter()
+    if nj == 1 or len(jobs) <= 1:
+        for job in jobs:
+            counts.update(_count_range(job))
+    else:
+        with Pool(min(nj, len(jobs))) as pool:
+            for range_counts in pool.imap_unordered(_count_range, jobs):
+                counts.update(range_counts)
+    return Counter({word.decode('utf-8'): count for word, count in
+        counts.items()})
+
+
+def select_vocabulary(counts, min_count=1, top_n=None):
+    ''' Selects a vocabulary from word counts
+
+    Arguments
+    ---------
+
+    counts : Counter of words.
+
+    min_count : Minimum count of the words selected.
+
+    top_n : Maximum number of words selected, the most frequent first (ties
+    are broken alphabetically). Default is no limit.
+
+    Returns
+    -------
+
+    words : Set of selected words.
+    '''
+    words = [(word, count) for word, count in counts.items() if count >=
+        min_count]
+    if top_n is not None and len(words) > top_n:
+        words.sort(key=lambda item: (-item[1], item[0]))
+        words = words[:top_n]
+    return set(word for word, _ in words)
+
+
+def write_counts(counts, counts_file_path):
+    ''' Writes word counts, most frequent first, one '<word> <count>' line
+    per word. '''
+    with open(counts_file_path, 'w', encoding='utf-8') as counts_file:
+        for word, count in sorted(counts.items(), key=lambda item: (-item[1],
+            item[0])):
+            counts_file.write('%s %d\n' % (word, count))
+
+
+def main():
+    ''' Count the words of a Kaldi text.
+    '''
+    arg_parser = argparse.ArgumentParser(description=('Count the words of a '
+        'Kaldi text file with parallel workers.'))
+    arg_parser.add_argument('kaldi_text', type=str,
+        help='Path to the file containing the Kaldi text corpus.')
+    arg_parser.add_argument('output_counts', type=str,
+        help='Path to output file to save the word counts.')
+    arg_parser.add_argument('--nj', type=int, default=None,
+        help='Number of worker processes. Default is the number of CPUs.')
+    arg_parser.add_argument('--plain-text', dest='plain_text',
+        action='store_true', help=('The text has no utterance IDs (count '
+        'the first field of every line).'))
+    args = vars(arg_parser.parse_args())
+    try:
+        counts = count_words(args['kaldi_text'], args['nj'],
+            not args['plain_text'])
+    except IOError as e:
+        print(e)
+        exit(1)
+    write_counts(counts, args['output_counts'])
+    print('Counted %d words (%d distinct).' % (sum(counts.values()),
+        len(counts)))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,10 @@
 # In[50]:
 
 
+import cosine_scoring
 import dialect_enrollment
 import numpy as np
-import operator
 from sklearn.metrics import accuracy_score
-import scipy
 from utils.read_ivectors import read_ivectors_from_file, read_ivecs_set
 
 
@@ -40,21 +39,15 @@ de_model = dialect_enrollment.model(train_ivecs.drop('utt-id',
     axis='columns'), dev_ivecs.drop('utt-id', axis='columns'))
 
 
-# Compute cosine distance scores for the test set
-
-# In[35]:
-
-
-def cos_sim(X, Y):
-    return 1 - scipy.spatial.distance.cosine(X, Y)
-
+# Compute cosine similarity scores for the test set
 
 # In[51]:
 
 
-predictions = test_ivecs.drop(['utt-id', 'dialect'], axis='columns').apply(
-    lambda ivec: max((((dialect, cos_sim(de_model[dialect], ivec)))
-    for dialect in de_model), key=operator.itemgetter(1))[0], axis='columns')
+enrollment = cosine_scoring.enrollment_matrix(de_model, dialects)
+scores = cosine_scoring.score(test_ivecs.drop(['utt-id', 'dialect'],
+    axis='columns').values, enrollment)
+predictions = np.asarray(dialects)[scores.argmax(axis=1)]
 
 
 # In[52]:
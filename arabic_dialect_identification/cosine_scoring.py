@@ -0,0 +1,303 @@
+
+# coding: utf-8
+
+import argparse
+import dialect_enrollment
+import numpy as np
+from utils.read_ivectors import load_ivecs_set
+
+
+BLOCK_SIZE = 65536
+# Maximum number of scores held at a time by an interpolation sweep
+SWEEP_BUDGET = 1 << 24
+
+
+def parse_arguments():
+    '''Parses command line arguments.
+
+    Returns
+    -------
+
+    args : Dictionary of command line arguments.
+    '''
+    train_ivecs_dir_path_help = ('Path to directory containing training set '
+        'i-vectors.')
+    dev_ivecs_dir_path_help = ('Path to directory containing development set '
+        'i-vectors.')
+    test_ivecs_dir_path_help = ('Path to directory containing test set '
+        'i-vectors.')
+    block_size_help = ('Number of test i-vectors scored at a time. Default is '
+        '{}, or blocks of at most {} scores with --sweep.'.format(BLOCK_SIZE,
+        SWEEP_BUDGET))
+    top_k_help = 'Number of best scoring dialects to report per utterance.'
+    save_scores_help = 'Path to save the score matrix to (.npy).'
+    save_predictions_help = ('Path to save the predictions to, one '
+        '"<utt-id> <dialect>" line per utterance.')
+    interp_param_help = ('Interpolation parameter between training and '
+        'development models. Default is {}.'.format(
+        dialect_enrollment.INTERP_PARAM))
+    sweep_help = ('Instead of scoring with a single interpolation parameter, '
+        'report the test accuracy of SWEEP parameters evenly spaced between 0 '
+        'and 1.')
+    arg_parser = argparse.ArgumentParser(
+        description=('Score test i-vectors against dialect enrollment models '
+        'with cosine similarity.'),
+        epilog=('e.g.: python cosine_scoring.py /path/to/train_ivecs '
+        '/path/to/dev_ivecs /path/to/test_ivecs'))
+    arg_parser.add_argument('train_ivecs_dir_path', type=str,
+        help=train_ivecs_dir_path_help)
+    arg_parser.add_argument('dev_ivecs_dir_path', type=str,
+        help=dev_ivecs_dir_path_help)
+    arg_parser.add_argument('test_ivecs_dir_path', type=str,
+        help=test_ivecs_dir_path_help)
+    arg_parser.add_argument('--block-size', dest='block_size', type=int,
+        default=None, help=block_size_help)
+    arg_parser.add_argument('--top-k', dest='top_k', type=int, default=None,
+        help=top_k_help)
+    arg_parser.add_argument('--save-scores', dest='save_scores', type=str,
+        help=save_scores_help)
+    arg_parser.add_argument('--save-predictions', dest='save_predictions',
+        type=str, help=save_predictions_help)
+    arg_parser.add_argument('--interp-param', dest='interp_param',
+        type=float, default=dialect_enrollment.INTERP_PARAM,
+        help=interp_param_help)
+    arg_parser.add_argument('--sweep', type=int, default=None,
+        help=sweep_help)
+    args = vars(arg_parser.parse_args())
+    if args['block_size'] is not None and args['block_size'] < 1:
+        arg_parser.error('--block-size must be positive.')
+    if args['top_k'] is not None and args['top_k'] < 1:
+        arg_parser.error('--top-k must be positive.')
+    if args['sweep'] is not None and args['sweep'] < 1:
+        arg_parser.error('--sweep must be positive.')
+    return args
+
+
+def l2_normalize(ivecs):
+    '''Scales i-vectors to unit length.
+
+    Arguments
+    ---------
+
+    ivecs : 2-D NumPy array with one i-vector per row.
+
+    Returns
+    -------
+
+    normalized : float32 NumPy array of unit-length rows. Zero rows are left
+    as zeros.
+    '''
+    ivecs = np.asarray(ivecs, dtype=np.float32)
+    norms = np.linalg.norm(ivecs, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return ivecs / norms
+
+
+def enrollment_matrix(de_model, dialects=dialect_enrollment.dialects):
+    '''Stacks and L2-normalizes dialect enrollment models.
+
+    Arguments
+    ---------
+
+    de_model : Dictionary of dialect models, as returned by
+    dialect_enrollment.model.
+
+    dialects : List of dialects giving the order of the rows.
+
+    Returns
+    -------
+
+    enrollment : float32 NumPy array of shape (dialects, dimension) with
+    unit-length rows.
+    '''
+    return l2_normalize(np.stack([de_model[dialect] for dialect in
+        dialects]))
+
+
+def iter_score_blocks(test_ivecs, enrollment, block_size=BLOCK_SIZE):
+    '''Computes cosine similarity scores block by block.
+
+    Each block of test i-vectors is normalized and scored against all
+    dialects with a single matrix multiplication, so memory use is bounded by
+    the block size.
+
+    Arguments
+    ---------
+
+    test_ivecs : 2-D NumPy array (or memory map) of test i-vectors.
+
+    enrollment : Normalized enrollment matrix from enrollment_matrix.
+
+    block_size : Number of test i-vectors scored at a time.
+
+    Yields
+    ------
+
+    start : Index of the first i-vector of the block.
+
+    scores : float32 NumPy array of shape (block, dialects).
+    '''
+    enrollment_t = np.ascontiguousarray(enrollment.T)
+    for start in range(0, len(test_ivecs), block_size):
+        block = l2_normalize(test_ivecs[start:start + block_size])
+        yield start, block @ enrollment_t
+
+
+def score(test_ivecs, enrollment, block_size=BLOCK_SIZE):
+    '''Computes the cosine similarity score matrix of test i-vectors.
+
+    Arguments
+    ---------
+
+    test_ivecs : 2-D NumPy array (or memory map) of test i-vectors.
+
+    enrollment : Normalized enrollment matrix from enrollment_matrix.
+
+    block_size : Number of test i-vectors scored at a time.
+
+    Returns
+    -------
+
+    scores : float32 NumPy array of shape (test i-vectors, dialects).
+    '''
+    scores = np.empty((len(test_ivecs), len(enrollment)), dtype=np.float32)
+    for start, block_scores in iter_score_blocks(test_ivecs, enrollment,
+        block_size):
+        scores[start:start + len(block_scores)] = block_scores
+    return scores
+
+
+def top_k(scores, k):
+    '''Returns the indexes of the k best scoring dialects per row.
+
+    Arguments
+    ---------
+
+    scores : 2-D NumPy array of scores.
+
+    k : Number of dialects to return.
+
+    Returns
+    -------
+
+    best : int NumPy array of shape (rows, k), best dialect first.
+    '''
+    if k < 1:
+        raise ValueError('k must be positive, got {}'.format(k))
+    k = min(k, scores.shape[1])
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1)
+    return np.take_along_axis(best, order, axis=1)
+
+
+def interp_sweep(stats, test_ivecs, test_labels, interp_params,
+    block_size=None):
+    '''Computes the test accuracy of many interpolation parameters at once.
+
+    The cosine score of a test i-vector x against the interpolated model
+    (1 - a) * T + a * V is ((1 - a) * x.T + a * x.V) / |(1 - a) * T + a * V|
+    for a normalized x, so the train and dev means are scored once and the
+    scores of all parameters are combined as one batched array operation per
+    block of test i-vectors.
+
+    Arguments
+    ---------
+
+    stats : dialect_enrollment.EnrollmentStats object.
+
+    test_ivecs : 2-D NumPy array (or memory map) of test i-vectors.
+
+    test_labels : 1-D NumPy array of the dialect codes of the test
+    i-vectors.
+
+    interp_params : 1-D array of interpolation parameters.
+
+    block_size : Number of test i-vectors processed at a time. By default,
+    blocks are sized to hold at most SWEEP_BUDGET scores.
+
+    Returns
+    -------
+
+    accuracies : NumPy array of the accuracy of each interpolation
+    parameter.
+    '''
+    if len(interp_params) == 0:
+        raise ValueError('No interpolation parameters to sweep.')
+    alphas = np.asarray(interp_params, dtype=np.float64)[:, np.newaxis,
+        np.newaxis]
+    train_means = stats.means('train')
+    dev_means = stats.means('dev')
+    num_dialects = len(train_means)
+    if block_size is None:
+        block_size = max(1, SWEEP_BUDGET // (len(alphas) * num_dialects))
+    # Norms of the interpolated models of all parameters, shape
+    # (parameters, 1, dialects)
+    train_sq = np.sum(train_means * train_means, axis=1)
+    dev_sq = np.sum(dev_means * dev_means, axis=1)
+    cross = np.sum(train_means * dev_means, axis=1)
+    norms = np.sqrt((1 - alphas) ** 2 * train_sq + 2 * alphas * (1 - alphas)
+        * cross + alphas ** 2 * dev_sq)
+    norms[norms == 0] = 1
+    means = np.concatenate([train_means, dev_means]).astype(np.float32)
+
+    num_correct = np.zeros(len(alphas), dtype=np.int64)
+    for start, block_scores in iter_score_blocks(test_ivecs, means,
+        block_size):
+        train_scores = block_scores[np.newaxis, :, :num_dialects]
+        dev_scores = block_scores[np.newaxis, :, num_dialects:]
+        scores = ((1 - alphas) * train_scores + alphas * dev_scores) / norms
+        block_labels = test_labels[start:start + len(block_scores)]
+        num_correct += np.sum(scores.argmax(axis=2) == block_labels, axis=1)
+    return num_correct / max(len(test_ivecs), 1)
+
+
+def main():
+    args = parse_arguments()
+    dialects = dialect_enrollment.dialects
+
+    # Compute dialect enrollment statistics
+    stats = dialect_enrollment.EnrollmentStats(dialects)
+    for pool in dialect_enrollment.pools:
+        ivecs, _, labels = load_ivecs_set(args[pool + '_ivecs_dir_path'],
+            dialects)
+        stats.update(ivecs, labels, pool)
+    test_ivecs, utt_ids, labels = load_ivecs_set(args['test_ivecs_dir_path'],
+        dialects)
+
+    # Report the accuracy of a range of interpolation parameters
+    if args['sweep'] is not None:
+        interp_params = np.linspace(0, 1, args['sweep'])
+        accuracies = interp_sweep(stats, test_ivecs, labels, interp_params,
+            args['block_size'])
+        for interp_param, accuracy in zip(interp_params, accuracies):
+            print('{:.4f} {:.4f}'.format(interp_param, accuracy))
+        best = accuracies.argmax()
+        print('Best interpolation parameter: {:.4f} (accuracy {:.4f})'.format(
+            interp_params[best], accuracies[best]))
+        return 0
+
+    # Score the test set
+    enrollment = enrollment_matrix(stats.model(args['interp_param']),
+        dialects)
+    block_size = args['block_size']
+    if block_size is None:
+        block_size = BLOCK_SIZE
+    scores = score(test_ivecs, enrollment, block_size)
+    predictions = scores.argmax(axis=1)
+    print('Accuracy: {:.4f}'.format(np.mean(predictions == labels)))
+
+    if args['top_k'] is not None:
+        best = top_k(scores, args['top_k'])
+        print('Top-{} accuracy: {:.4f}'.format(args['top_k'],
+            np.mean((best == labels[:, np.newaxis]).any(axis=1))))
+    if args['save_scores'] is not None:
+        np.save(args['save_scores'], scores)
+    if args['save_predictions'] is not None:
+        with open(args['save_predictions'], 'w') as predictions_file:
+            predictions_file.writelines('{} {}\n'.format(utt_id,
+                dialects[p]) for utt_id, p in zip(utt_ids, predictions))
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -3,13 +3,15 @@
 
 import argparse
 import codecs
-import os
-import pandas as pd
-from utils.read_ivectors import read_ivecs_set
+import numpy as np
+from utils.read_ivectors import load_ivecs_set
 
 
 dialects = ['EGY', 'GLF', 'LAV', 'MSA', 'NOR']
 INTERP_PARAM = 0.83
+pools = ['train', 'dev']
+# Number of i-vectors accumulated at a time
+BLOCK_SIZE = 65536
 
 
 def parse_arguments():
@@ -25,59 +27,187 @@ def parse_arguments():
     dev_ivecs_dir_path_help=('Path to directory containing development set '
         'i-vectors.')
     save_to_help='Path to save dialect enrollment.'
+    load_stats_help=('Path to previously saved enrollment statistics (.npz) '
+        'to add the new i-vectors to. Can be repeated to merge statistics '
+        'computed on separate shards.')
+    save_stats_help='Path to save the enrollment statistics to (.npz).'
+    interp_param_help=('Interpolation parameter between training and '
+        'development models. Default is {}.'.format(INTERP_PARAM))
     arg_parser = argparse.ArgumentParser(
         description=('Calculate dialect enrollment for '
         'a group of i-vectors.'),
         epilog=('e.g.: python dialect_enrollment.py /path/to/train_ivecs '
         '/path/to/dev_ivecs'))
-    arg_parser.add_argument('train_ivecs_dir_path', type='str',
+    arg_parser.add_argument('train_ivecs_dir_path', type=str, nargs='?',
         help=train_ivecs_dir_path_help)
-    arg_parser.add_argument('dev_ivecs_dir_path', type='str',
+    arg_parser.add_argument('dev_ivecs_dir_path', type=str, nargs='?',
         help=dev_ivecs_dir_path_help)
     arg_parser.add_argument('--save-to', dest='save_to', type=str,
         help=save_to_help)
+    arg_parser.add_argument('--load-stats', dest='load_stats', type=str,
+        action='append', default=[], help=load_stats_help)
+    arg_parser.add_argument('--save-stats', dest='save_stats', type=str,
+        help=save_stats_help)
+    arg_parser.add_argument('--interp-param', dest='interp_param',
+        type=float, default=INTERP_PARAM, help=interp_param_help)
     args = vars(arg_parser.parse_args())
+    if args['train_ivecs_dir_path'] is None and args['load_stats'] == []:
+        arg_parser.error('Specify i-vector directories or statistics to '
+            'load with --load-stats.')
     return args
 
 
-def get_dial_model(ivec_df):
-    ''' Computes i-vector dialect model.
-    
-    Arguments
-    ---------
-    
-    ivec_df : Pandas DataFrame of i-vectors.
-    
-    Returns
-    -------
-    
-    model : Pandas Series containing the dialect model.
+class EnrollmentStats(object):
+    '''Per-dialect sufficient statistics of the training and development
+    i-vector pools.
+
+    Only the number of i-vectors and their sum are kept for each dialect and
+    pool, so statistics can be updated as new labeled i-vectors arrive, and
+    statistics accumulated on separate shards can be merged by adding them.
     '''
-    model = ivec_df.sum(axis=0) / ivec_df.shape[0]
-    return model
 
+    def __init__(self, dialects=dialects, dim=None):
+        '''Creates empty statistics.
 
-def get_interp_model(train_model, dev_model, interp_param=INTERP_PARAM):
-    '''Computes the interpolated dialect model from training and dev models
-    
-    Arguments
-    ---------
-    
-    train_model : Pandas Series containing i-vector dialect model for the
-    training set.
-    
-    dev_model : Pandas Series containing i-vector dialect model for the
-    development set.
-    
-    interp_param : Float specifying the interpolation parameter.
-    
-    Returns
-    -------
-    
-    interp_model: Numpy array containing the interpolated i-vector model.
-    '''
-    interp_model = (1 - interp_param) * train_model + interp_param * dev_model
-    return interp_model.values
+        Arguments
+        ---------
+
+        dialects : List of dialect names. Labels are indexes into this list.
+
+        dim : Integer specifying the i-vector dimension. If None, it is set
+        by the first update.
+        '''
+        self.dialects = list(dialects)
+        self.dim = dim
+        self.counts = {pool: np.zeros(len(self.dialects), dtype=np.int64)
+            for pool in pools}
+        self.sums = None
+        if dim is not None:
+            self._init_sums(dim)
+
+    def _init_sums(self, dim):
+        self.dim = dim
+        self.sums = {pool: np.zeros((len(self.dialects), dim),
+            dtype=np.float64) for pool in pools}
+
+    def update(self, ivecs, labels, pool='train'):
+        '''Adds labeled i-vectors to the statistics of a pool.
+
+        Arguments
+        ---------
+
+        ivecs : 2-D NumPy array (or memory map) of i-vectors.
+
+        labels : 1-D NumPy array of dialect codes (indexes into dialects),
+        or of dialect names.
+
+        pool : 'train' or 'dev'.
+
+        Returns
+        -------
+
+        self
+        '''
+        if pool not in pools:
+            raise ValueError('Unknown pool {}. Pools are: {}.'.format(pool,
+                ', '.join(pools)))
+        labels = self._codes(labels)
+        if len(ivecs) == 0:
+            return self
+        if self.sums is None:
+            self._init_sums(ivecs.shape[1])
+        elif ivecs.shape[1] != self.dim:
+            raise ValueError('Expected i-vectors of dimension {}, found {}.'
+                .format(self.dim, ivecs.shape[1]))
+        num_dialects = len(self.dialects)
+        self.counts[pool] += np.bincount(labels, minlength=num_dialects)
+        # Group-by sum over dialect codes as a one-hot matrix product, block
+        # by block to bound memory use
+        for start in range(0, len(ivecs), BLOCK_SIZE):
+            block_labels = labels[start:start + BLOCK_SIZE]
+            one_hot = np.zeros((num_dialects, len(block_labels)))
+            one_hot[block_labels, np.arange(len(block_labels))] = 1
+            self.sums[pool] += one_hot @ np.asarray(
+                ivecs[start:start + BLOCK_SIZE], dtype=np.float64)
+        return self
+
+    def _codes(self, labels):
+        labels = np.asarray(labels)
+        if labels.dtype.kind in 'iu':
+            return labels
+        codes = {dialect: code for code, dialect in enumerate(self.dialects)}
+        return np.array([codes[label] for label in labels], dtype=np.int64)
+
+    def merge(self, other):
+        '''Adds the statistics of another EnrollmentStats object.
+
+        Returns
+        -------
+
+        self
+        '''
+        if other.dialects != self.dialects:
+            raise ValueError('Cannot merge statistics of different dialects.')
+        if other.sums is None:
+            return self
+        if self.sums is None:
+            self._init_sums(other.dim)
+        elif other.dim != self.dim:
+            raise ValueError('Cannot merge statistics of dimensions {} and {}.'
+                .format(self.dim, other.dim))
+        for pool in pools:
+            self.counts[pool] += other.counts[pool]
+            self.sums[pool] += other.sums[pool]
+        return self
+
+    def means(self, pool):
+        '''Returns the mean i-vector of each dialect in a pool.
+
+        Returns
+        -------
+
+        means : NumPy array of shape (dialects, dimension). Rows of dialects
+        without i-vectors are NaN.
+        '''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.sums[pool] / self.counts[pool][:, np.newaxis]
+
+    def model(self, interp_param=INTERP_PARAM):
+        '''Computes interpolated i-vector dialect models.
+
+        Returns
+        -------
+
+        interp_ivec_dial_model : Dictionary mapping dialect names to NumPy
+        arrays containing the interpolated i-vector models.
+        '''
+        interp_models = ((1 - interp_param) * self.means('train') +
+            interp_param * self.means('dev'))
+        return {dialect: interp_models[code] for code, dialect in
+            enumerate(self.dialects)}
+
+    def save(self, file_path):
+        '''Saves the statistics to a .npz file.'''
+        arrays = {'dialects': np.array(self.dialects)}
+        for pool in pools:
+            arrays[pool + '_counts'] = self.counts[pool]
+            if self.sums is not None:
+                arrays[pool + '_sums'] = self.sums[pool]
+        with open(file_path, 'wb') as stats_file:
+            np.savez(stats_file, **arrays)
+
+    @classmethod
+    def load(cls, file_path):
+        '''Loads statistics saved with save.'''
+        with np.load(file_path) as arrays:
+            stats = cls(arrays['dialects'].tolist())
+            for pool in pools:
+                stats.counts[pool] = arrays[pool + '_counts']
+            if 'train_sums' in arrays:
+                stats._init_sums(arrays['train_sums'].shape[1])
+                for pool in pools:
+                    stats.sums[pool] = arrays[pool + '_sums']
+        return stats
 
 
 def model(train_ivecs, dev_ivecs, interp_param=INTERP_PARAM):
@@ -102,23 +232,15 @@ def model(train_ivecs, dev_ivecs, interp_param=INTERP_PARAM):
     different dialects. Keys are strings representing the name of the dialect,
     and values are Numpy array containing the interpolated i-vector model.
     '''
-    # Compute i-vector dialect models for training and development sets of
-    # different dialects
-    dial_models = dict()
-    for dialect in dialects:
-        train_dialect_ivecs = train_ivecs.loc[train_ivecs['dialect'] ==
-                                            dialect]
-        dev_dialect_ivecs = dev_ivecs.loc[dev_ivecs['dialect'] == dialect]
-        train_model = get_dial_model(train_dialect_ivecs.drop(
-            columns='dialect'))
-        dev_model = get_dial_model(dev_dialect_ivecs.drop(
-            columns='dialect'))
-        dial_models[dialect] = {'train_model': train_model, 'dev_model':
-                                dev_model}
+    # Accumulate per-dialect statistics of the training and development sets
+    # in one pass over each set
+    stats = EnrollmentStats(dialects)
+    for pool, ivecs in [('train', train_ivecs), ('dev', dev_ivecs)]:
+        stats.update(ivecs.drop(columns=['dialect', 'utt-id'],
+            errors='ignore').values,
+            ivecs['dialect'].values, pool)
     # Compute interpolated i-vector dialect models for each dialect
-    interp_ivec_dial_model = {dialect: get_interp_model(
-        models['train_model'], models['dev_model'], INTERP_PARAM) for dialect,
-            models in dial_models.items()}
+    interp_ivec_dial_model = stats.model(interp_param)
     return interp_ivec_dial_model
 
 
@@ -128,14 +250,24 @@ def main():
     train_ivecs_dir_path = args['train_ivecs_dir_path']
     dev_ivecs_dir_path = args['dev_ivecs_dir_path']
     model_file_path = args['save_to']
-    train_ivecs = read_ivecs_set(train_ivecs_dir_path, dialects)
-    dev_ivecs = read_ivecs_set(dev_ivecs_dir_path, dialects)
+    # Start from previously saved statistics, if any, and add the i-vectors
+    # of the directories specified
+    stats = EnrollmentStats(dialects)
+    for stats_file_path in args['load_stats']:
+        stats.merge(EnrollmentStats.load(stats_file_path))
+    for pool, ivecs_dir_path in [('train', train_ivecs_dir_path),
+        ('dev', dev_ivecs_dir_path)]:
+        if ivecs_dir_path is not None:
+            ivecs, _, labels = load_ivecs_set(ivecs_dir_path, dialects)
+            stats.update(ivecs, labels, pool)
+    if args['save_stats'] is not None:
+        stats.save(args['save_stats'])
     # Compute dialect enrollment for each dialect
-    de_model = model(train_ivecs, dev_ivecs)
+    de_model = stats.model(args['interp_param'])
     # Save model if specified
     if model_file_path is not None:
-        output = '\n'.join([d + ' '.join([str(x) for x in m]) for d, m in 
-                            de_model.items()])
+        output = '\n'.join([d + ' ' + ' '.join([str(x) for x in m]) for d, m
+                            in de_model.items()])
         try:
             with codecs.open(model_file_path, 'w') as model_file:
                 model_file.write(output)
@@ -0,0 +1,283 @@
+
+# coding: utf-8
+
+import argparse
+import json
+import keras
+import numpy as np
+import os
+import siamese_network
+import siamese_scoring
+import tensorflow as tf
+import time
+from utils.read_ivectors import load_ivecs_set
+
+
+QUANTIZED_FILE_NAME = 'embedding.tflite'
+# Number of i-vectors used to calibrate full-integer quantization
+CALIBRATION_SIZE = 500
+# Number of runs timed for single-utterance latency
+LATENCY_RUNS = 200
+
+
+def parse_arguments():
+    '''Parses command line arguments.
+
+    Returns
+    -------
+
+    args : Dictionary of command line arguments.
+    '''
+    embedding_dir_path_help = ('Path to directory containing the embedding '
+        'model and enrollment embeddings exported by siamese_network.py.')
+    arg_parser = argparse.ArgumentParser(
+        description=('Convert the embedding model of a Siamese NN to a '
+        'quantized TensorFlow Lite model for CPU inference, and benchmark it '
+        'against the float model.'),
+        epilog=('e.g.: python quantize_model.py export /path/to/model_dir '
+        '--mode int8 --calibration-ivecs /path/to/dev_ivecs\n'
+        '      python quantize_model.py benchmark /path/to/model_dir '
+        '/path/to/test_ivecs'))
+    subparsers = arg_parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    export_parser = subparsers.add_parser('export',
+        help='Write a quantized TensorFlow Lite embedding model.')
+    export_parser.add_argument('embedding_dir_path', type=str,
+        help=embedding_dir_path_help)
+    export_parser.add_argument('--mode', choices=['dynamic', 'int8'],
+        default='dynamic', help=('Quantize weights only (dynamic) or weights '
+        'and activations (int8). Default is dynamic.'))
+    export_parser.add_argument('--calibration-ivecs',
+        dest='calibration_ivecs_dir_path', type=str, help=('Path to '
+        'directory containing i-vectors to calibrate int8 quantization '
+        'with.'))
+
+    benchmark_parser = subparsers.add_parser('benchmark',
+        help='Compare the quantized model with the float model.')
+    benchmark_parser.add_argument('embedding_dir_path', type=str,
+        help=embedding_dir_path_help)
+    benchmark_parser.add_argument('test_ivecs_dir_path', type=str,
+        help='Path to directory containing held-out i-vectors.')
+    benchmark_parser.add_argument('--batch-size', dest='batch_size',
+        type=int, default=siamese_scoring.BATCH_SIZE,
+        help='Number of i-vectors per batch when measuring throughput.')
+    benchmark_parser.add_argument('--save-report', dest='save_report',
+        type=str, help='Path to save the benchmark results to (JSON).')
+    args = vars(arg_parser.parse_args())
+    return args
+
+
+def _tflite_converter(embedding_file_path):
+    # TensorFlow 1.x converts Keras files directly; 2.x converts models
+    if hasattr(tf.lite.TFLiteConverter, 'from_keras_model_file'):
+        return tf.lite.TFLiteConverter.from_keras_model_file(
+            embedding_file_path)
+    return tf.lite.TFLiteConverter.from_keras_model(
+        tf.keras.models.load_model(embedding_file_path, compile=False))
+
+
+def convert(embedding_file_path, output_file_path, mode='dynamic',
+    calibration_ivecs=None):
+    '''Converts a Keras embedding model to a quantized TensorFlow Lite model.
+
+    Arguments
+    ---------
+
+    embedding_file_path : Path to the Keras embedding model.
+
+    output_file_path : Path to write the TensorFlow Lite model to.
+
+    mode : 'dynamic' to quantize weights to int8 and compute in float, or
+    'int8' to also quantize activations, calibrated on calibration_ivecs.
+    Inputs and outputs stay float32 in both modes.
+
+    calibration_ivecs : 2-D NumPy array of i-vectors, required for 'int8'.
+
+    Returns
+    -------
+
+    size : Size of the written model in bytes.
+    '''
+    converter = _tflite_converter(embedding_file_path)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == 'int8':
+        if calibration_ivecs is None:
+            raise ValueError('int8 quantization requires calibration '
+                'i-vectors.')
+        calibration_ivecs = np.asarray(calibration_ivecs, dtype=np.float32)
+
+        def representative_dataset():
+            for ivec in calibration_ivecs:
+                yield [ivec[np.newaxis]]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    elif mode != 'dynamic':
+        raise ValueError('Unknown quantization mode: {}.'.format(mode))
+    tflite_model = converter.convert()
+    with open(output_file_path, 'wb') as output_file:
+        output_file.write(tflite_model)
+    return len(tflite_model)
+
+
+class TFLiteEmbedding(object):
+    '''TensorFlow Lite embedding model with the predict interface used by
+    siamese_scoring.score. '''
+
+    def __init__(self, model_file_path, num_threads=None):
+        try:
+            self.interpreter = tf.lite.Interpreter(model_path=model_file_path,
+                num_threads=num_threads)
+        except TypeError:
+            # num_threads was added in TensorFlow 2.3
+            self.interpreter = tf.lite.Interpreter(model_path=model_file_path)
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        self.output_index = self.interpreter.get_output_details()[0]['index']
+        self.batch_size = None
+
+    def predict(self, ivecs, batch_size=None):
+        '''Embeds a 2-D array of i-vectors. '''
+        ivecs = np.ascontiguousarray(ivecs, dtype=np.float32)
+        if len(ivecs) != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input_index,
+                ivecs.shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = len(ivecs)
+        self.interpreter.set_tensor(self.input_index, ivecs)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index).copy()
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def benchmark_model(embedding_model, load_time, test_ivecs, enrollment,
+    batch_size):
+    '''Measures the latency, throughput and scores of an embedding model.
+
+    Returns
+    -------
+
+    results : Dictionary of timings in seconds.
+
+    scores : float32 NumPy array of test scores.
+    '''
+    single = np.asarray(test_ivecs[:1], dtype=np.float32)
+    embedding_model.predict(single, batch_size=1)
+    latencies = []
+    for _ in range(LATENCY_RUNS):
+        latencies.append(_timed(embedding_model.predict, single, 1)[1])
+    scores, total_time = _timed(siamese_scoring.score, embedding_model,
+        test_ivecs, enrollment, batch_size)
+    results = {
+        'load_time': load_time,
+        'latency_median': float(np.median(latencies)),
+        'latency_p95': float(np.percentile(latencies, 95)),
+        'throughput': len(test_ivecs) / total_time,
+        }
+    return results, scores
+
+
+def benchmark(embedding_dir_path, test_ivecs_dir_path,
+    batch_size=siamese_scoring.BATCH_SIZE):
+    '''Compares the quantized embedding model with the float model.
+
+    Returns
+    -------
+
+    report : Dictionary with the results of the 'float' and 'quantized'
+    models (file size, load time, single-utterance latency, throughput and
+    accuracy) and their agreement.
+    '''
+    float_file_path = os.path.join(embedding_dir_path,
+        siamese_network.EMBEDDING_FILE_NAME)
+    quantized_file_path = os.path.join(embedding_dir_path,
+        QUANTIZED_FILE_NAME)
+    enrollment = siamese_scoring.load_enrollment_embeddings(
+        embedding_dir_path)
+    test_ivecs, _, labels = load_ivecs_set(test_ivecs_dir_path,
+        siamese_network.dialects)
+
+    report = dict()
+    all_scores = dict()
+    for name, file_path, loader in [
+        ('float', float_file_path, keras.models.load_model),
+        ('quantized', quantized_file_path, TFLiteEmbedding)]:
+        embedding_model, load_time = _timed(loader, file_path)
+        results, scores = benchmark_model(embedding_model, load_time,
+            test_ivecs, enrollment, batch_size)
+        results['file_size'] = os.path.getsize(file_path)
+        results['accuracy'] = float(np.mean(siamese_scoring.predict(
+            scores) == labels))
+        report[name] = results
+        all_scores[name] = scores
+    report['accuracy_difference'] = (report['quantized']['accuracy'] -
+        report['float']['accuracy'])
+    report['prediction_agreement'] = float(np.mean(
+        siamese_scoring.predict(all_scores['float']) ==
+        siamese_scoring.predict(all_scores['quantized'])))
+    report['max_score_difference'] = float(np.max(np.abs(
+        all_scores['float'] - all_scores['quantized']))) if len(
+        test_ivecs) else 0.0
+    return report
+
+
+def print_report(report):
+    '''Prints a benchmark report as a table. '''
+    rows = [('File size (MB)', 'file_size', 1e-6),
+        ('Load time (s)', 'load_time', 1),
+        ('Latency, median (ms)', 'latency_median', 1e3),
+        ('Latency, 95th percentile (ms)', 'latency_p95', 1e3),
+        ('Throughput (utterances/s)', 'throughput', 1),
+        ('Accuracy', 'accuracy', 1)]
+    print('{:<32}{:>12}{:>12}'.format('', 'float', 'quantized'))
+    for title, key, scale in rows:
+        print('{:<32}{:>12.4f}{:>12.4f}'.format(title,
+            report['float'][key] * scale, report['quantized'][key] * scale))
+    print('Accuracy difference: {:+.4f}'.format(
+        report['accuracy_difference']))
+    print('Prediction agreement: {:.4f}'.format(
+        report['prediction_agreement']))
+    print('Maximum score difference: {:.6f}'.format(
+        report['max_score_difference']))
+
+
+def main():
+    args = parse_arguments()
+    embedding_dir_path = args['embedding_dir_path']
+
+    if args['command'] == 'export':
+        calibration_ivecs = None
+        if args['calibration_ivecs_dir_path'] is not None:
+            calibration_ivecs = load_ivecs_set(
+                args['calibration_ivecs_dir_path'],
+                siamese_network.dialects)[0]
+            random_state = np.random.RandomState(0)
+            calibration_ivecs = calibration_ivecs[np.sort(
+                random_state.choice(len(calibration_ivecs), min(
+                CALIBRATION_SIZE, len(calibration_ivecs)), replace=False))]
+        output_file_path = os.path.join(embedding_dir_path,
+            QUANTIZED_FILE_NAME)
+        size = convert(os.path.join(embedding_dir_path,
+            siamese_network.EMBEDDING_FILE_NAME), output_file_path,
+            args['mode'], calibration_ivecs)
+        print('Wrote {} quantized model to {} ({:.2f} MB).'.format(
+            args['mode'], output_file_path, size * 1e-6))
+        return 0
+
+    report = benchmark(embedding_dir_path, args['test_ivecs_dir_path'],
+        args['batch_size'])
+    print_report(report)
+    if args['save_report'] is not None:
+        with open(args['save_report'], 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    main()
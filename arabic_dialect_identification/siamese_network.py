@@ -1,14 +1,19 @@
 import argparse
 import dialect_enrollment
+import os
 import numpy as np
-import pandas as pd
-import random
 import tensorflow as tf
 #from tensorflow import keras
 import keras
+from utils.read_ivectors import load_ivecs_set
 
 
 dialects = ['EGY', 'GLF', 'LAV', 'MSA', 'NOR']
+BATCH_SIZE = 50
+EPOCHS = 100
+# Files written by export_embedding
+EMBEDDING_FILE_NAME = 'embedding.hdf5'
+ENROLLMENT_FILE_NAME = 'enrollment_embeddings.npy'
 
 
 def parse_arguments():
@@ -28,12 +33,34 @@ def parse_arguments():
         type=str)
     parser.add_argument('dev_ivecs_dir_path', help=dev_ivecs_dir_path_help,
         type=str)
+    parser.add_argument('--batch-size', dest='batch_size', type=int,
+        default=BATCH_SIZE, help='Number of pairs per batch.')
+    parser.add_argument('--epochs', type=int, default=EPOCHS,
+        help='Number of training epochs.')
+    parser.add_argument('--workers', type=int, default=1,
+        help='Number of threads preparing batches ahead of training.')
+    parser.add_argument('--seed', type=int, default=0,
+        help='Seed of the pair sampler.')
+    parser.add_argument('--shared-tower', dest='shared_tower',
+        action='store_true', help=('Use a single tower with shared weights '
+        'for both branches of the network.'))
+    parser.add_argument('--output-dir', dest='output_dir_path', type=str,
+        default='.', help=('Directory to write checkpoints and the exported '
+        'embedding model to. Default is the current directory.'))
+    parser.add_argument('--export-checkpoint', dest='export_checkpoint',
+        type=str, help=('Skip training and export the embedding model of this '
+        'checkpoint.'))
     args = vars(parser.parse_args())
     return args
 
 
 def euclidean_distance(y_true, cos_sim):
     '''Euclidean distance loss function.
+
+    Pairs of the same dialect (label 1) are pushed to a cosine similarity of
+    1 and pairs of different dialects (label 0) to 0, so the dialect of an
+    utterance is the one with the highest score (see
+    siamese_scoring.predict).
     
     Arguments
     ---------
@@ -48,11 +75,82 @@ def euclidean_distance(y_true, cos_sim):
     euclid_dist : 0-D tensor of Euclidean distance between true labels
     and cosine similarity scores.
     '''
-    euclid_dist = keras.backend.sum(keras.backend.square(y_true - 
-        (1 - cos_sim)))
+    euclid_dist = keras.backend.sum(keras.backend.square(y_true - cos_sim))
     return euclid_dist
 
 
+class PairSequence(keras.utils.Sequence):
+    '''Samples balanced pairs of i-vectors and dialect models batch by batch.
+
+    Every batch draws random utterances and pairs half of them with the model
+    of their own dialect (label 1) and half with the model of another dialect
+    (label 0). Only the rows of a batch are read from the i-vector matrices,
+    which may be memory maps, so memory use does not grow with the training
+    set and every epoch sees new pairs.
+    '''
+
+    def __init__(self, ivecs_sets, enrollment, batch_size=BATCH_SIZE,
+        seed=0):
+        '''Creates a pair sampler.
+
+        Arguments
+        ---------
+
+        ivecs_sets : List of (ivecs, labels) tuples as returned by
+        load_ivecs_set, ivecs being 2-D float32 arrays (or memory maps) and
+        labels the dialect codes of their rows.
+
+        enrollment : float32 NumPy array of dialect models, one row per
+        dialect code.
+
+        batch_size : Number of pairs per batch.
+
+        seed : Seed of the sampler. Batch i of epoch e is always drawn from
+        the same random state, so batches can be prepared by several workers.
+        '''
+        self.ivecs_sets = [ivecs for ivecs, _ in ivecs_sets]
+        self.labels = np.concatenate([labels for _, labels in ivecs_sets])
+        self.offsets = np.cumsum([0] + [len(ivecs) for ivecs in
+            self.ivecs_sets])
+        self.enrollment = np.ascontiguousarray(enrollment, dtype=np.float32)
+        self.batch_size = batch_size
+        self.seed = seed
+        self.epoch = 0
+
+    def __len__(self):
+        return int(np.ceil(len(self.labels) / float(self.batch_size)))
+
+    def on_epoch_end(self):
+        self.epoch += 1
+
+    def _rows(self, indexes):
+        '''Gathers i-vectors by global (sorted) row index. '''
+        rows = np.empty((len(indexes), self.enrollment.shape[1]),
+            dtype=np.float32)
+        bounds = np.searchsorted(indexes, self.offsets)
+        for ivecs, offset, start, end in zip(self.ivecs_sets, self.offsets,
+            bounds[:-1], bounds[1:]):
+            rows[start:end] = ivecs[indexes[start:end] - offset]
+        return rows
+
+    def __getitem__(self, batch_num):
+        random_state = np.random.RandomState([self.seed, self.epoch,
+            batch_num])
+        # Sorted indexes keep reads from memory maps sequential
+        indexes = np.sort(random_state.randint(len(self.labels),
+            size=self.batch_size))
+        utt_dialects = self.labels[indexes].astype(np.int64)
+        num_dialects = len(self.enrollment)
+        y = np.zeros(self.batch_size, dtype=np.float32)
+        y[:self.batch_size // 2] = 1
+        random_state.shuffle(y)
+        # Negative pairs use one of the other dialects, chosen uniformly
+        shift = random_state.randint(1, num_dialects, size=self.batch_size)
+        model_dialects = np.where(y == 1, utt_dialects, (utt_dialects + shift)
+            % num_dialects)
+        return [self._rows(indexes), self.enrollment[model_dialects]], y
+
+
 def base_network(input_layer):
     '''Build the identical part constituting the Siamese NN branches.
     
@@ -82,6 +180,102 @@ def base_network(input_layer):
     return fc_3
 
 
+def tower_network(ivec_dim, name='tower'):
+    '''Wraps a branch of the Siamese NN in a model of its own.
+
+    Arguments
+    ---------
+
+    ivec_dim : Dimension of the input i-vectors.
+
+    name : Name of the tower model, which is also its layer name in the
+    Siamese NN.
+
+    Returns
+    -------
+
+    tower : keras.Model mapping i-vectors to 200-dimensional embeddings.
+    '''
+    input_layer = keras.layers.Input(shape=(ivec_dim,))
+    return keras.Model(inputs=input_layer, outputs=base_network(input_layer),
+        name=name)
+
+
+def siamese_model(ivec_dim, shared_tower=False):
+    '''Builds and compiles the Siamese NN.
+
+    Arguments
+    ---------
+
+    ivec_dim : Dimension of the input i-vectors.
+
+    shared_tower : If True, both branches use the same tower (named 'tower'),
+    halving the number of parameters. Otherwise the test i-vector and dialect
+    model branches have their own towers, named 'test_tower' and
+    'model_tower'.
+
+    Returns
+    -------
+
+    model : Compiled keras.Model taking [test i-vectors, dialect models] and
+    giving their cosine similarity.
+    '''
+    input_1 = keras.layers.Input(shape=(ivec_dim,))
+    input_2 = keras.layers.Input(shape=(ivec_dim,))
+    if shared_tower:
+        test_tower = model_tower = tower_network(ivec_dim)
+    else:
+        test_tower = tower_network(ivec_dim, 'test_tower')
+        model_tower = tower_network(ivec_dim, 'model_tower')
+    merged = keras.layers.Dot(normalize=True, axes=1)(
+        [test_tower(input_1), model_tower(input_2)])
+    model = keras.Model(inputs=[input_1, input_2], outputs=merged)
+    model.compile(loss=euclidean_distance, optimizer='adam',
+                metrics=['accuracy'])
+    return model
+
+
+def towers(model):
+    '''Returns the (test i-vector, dialect model) towers of a Siamese NN. '''
+    layer_names = [layer.name for layer in model.layers]
+    if 'tower' in layer_names:
+        return model.get_layer('tower'), model.get_layer('tower')
+    return model.get_layer('test_tower'), model.get_layer('model_tower')
+
+
+def load_siamese_model(model_file_path):
+    '''Loads a Siamese NN checkpoint written during training. '''
+    return keras.models.load_model(model_file_path,
+        custom_objects={'euclidean_distance': euclidean_distance})
+
+
+def export_embedding(model, enrollment, output_dir_path):
+    '''Exports the single-branch embedding model of a Siamese NN.
+
+    The dialect models only go through the model tower once, here, so scoring
+    a test i-vector takes one pass through the test tower and a dot product
+    with the saved enrollment embeddings (see siamese_scoring.py).
+
+    Arguments
+    ---------
+
+    model : Trained Siamese NN.
+
+    enrollment : NumPy array of dialect models, one row per dialect.
+
+    output_dir_path : Directory to write EMBEDDING_FILE_NAME and
+    ENROLLMENT_FILE_NAME to.
+    '''
+    test_tower, model_tower = towers(model)
+    embedding_model = keras.Model(inputs=test_tower.inputs,
+        outputs=test_tower.outputs)
+    embedding_model.save(os.path.join(output_dir_path, EMBEDDING_FILE_NAME))
+    enrollment_embeddings = model_tower.predict(np.asarray(enrollment,
+        dtype=np.float32))
+    np.save(os.path.join(output_dir_path, ENROLLMENT_FILE_NAME),
+        enrollment_embeddings.astype(np.float32))
+
+
 def main():
     # Parse arguments
     args = parse_arguments()
@@ -89,65 +283,57 @@ def main():
     train_ivecs_dir_path = args['train_ivecs_dir_path']
     dev_ivecs_dir_path = args['dev_ivecs_dir_path']
 
-    # Read i-vectors for training and test sets
-    train_ivecs = dialect_enrollment.read_ivecs_set(train_ivecs_dir_path,
-        dialects)
-    dev_ivecs = dialect_enrollment.read_ivecs_set(dev_ivecs_dir_path,
-        dialects)
+    # Read i-vectors for training and development sets
+    ivecs_sets = [load_ivecs_set(ivecs_dir_path, dialects)
+        for ivecs_dir_path in [train_ivecs_dir_path, dev_ivecs_dir_path]]
 
     # Compute dialect enrollment
-    de_model = dialect_enrollment.model(train_ivecs, dev_ivecs)
-
-    # Create dataset by randomly choosing utterances and a dialect enrollment model, and deducing the corresponding dialect.
-    #x_train = train_ivecs.sample(1000)
-    #x_train = x_train.append(dev_ivecs.sample(50))
-    x_train = train_ivecs.append(dev_ivecs)
-    # Make sure all models have the same dimensionality
-    model_lens = set(len(model) for model in de_model.values())
-    assert len(model_lens) == 1
-    # Form the other part of the training data from the model and append
-    # it to the training data i-vectors
-    de_model_df = pd.DataFrame([v.tolist() + [k] for k, v in
-        de_model.items()], columns=list(range(model_lens.pop())) 
-        + ['model_dialect'])
-    x_train_model = de_model_df.sample(len(x_train), replace=True)
-    x_train = x_train.reset_index(drop=True)
-    x_train_model = x_train_model.reset_index(drop=True)
-    y = pd.concat([x_train['dialect'],
-        x_train_model['model_dialect']], axis=1)
-    y['label'] = y.apply(lambda row: 1 if row['dialect'] ==
-        row['model_dialect'] else 0, axis=1)
-    y = y['label'].values
-    x_train = x_train.drop('dialect', axis=1)
-    x_train_model = x_train_model.drop('model_dialect', axis=1)
-
-    # Create base network for the Siamese neural network
-    input_1 = keras.layers.Input(shape=(400,))
-    input_2 = keras.layers.Input(shape=(400,))
-    base_net_1 = base_network(input_1)
-    base_net_2 = base_network(input_2)
+    stats = dialect_enrollment.EnrollmentStats(dialects)
+    for pool, (ivecs, _, labels) in zip(dialect_enrollment.pools,
+        ivecs_sets):
+        stats.update(ivecs, labels, pool)
+    de_model = stats.model(dialect_enrollment.INTERP_PARAM)
+    enrollment = np.stack([de_model[dialect] for dialect in dialects])
+
+    # Pair utterances with randomly chosen dialect enrollment models, batch
+    # by batch
+    pairs = PairSequence([(ivecs, labels) for ivecs, _, labels in
+        ivecs_sets], enrollment, args['batch_size'], args['seed'])
+    ivec_dim = enrollment.shape[1]
+
+    output_dir_path = args['output_dir_path']
+    if not os.path.isdir(output_dir_path):
+        os.makedirs(output_dir_path)
+
+    # Export the embedding model of an existing checkpoint
+    if args['export_checkpoint'] is not None:
+        export_embedding(load_siamese_model(args['export_checkpoint']),
+            enrollment, output_dir_path)
+        print('Exported embedding model to {}.'.format(output_dir_path))
+        return
+
     # Create Siamese neural network
-    merged = keras.layers.Dot(normalize=True, axes=1)(
-        [base_net_1, base_net_2])
-    model = keras.Model(inputs=[input_1, input_2], outputs=merged)
-    model.compile(loss=euclidean_distance, optimizer='adam',
-                metrics=['accuracy'])
+    model = siamese_model(ivec_dim, args['shared_tower'])
 
     print('Printing model summary..')
     print(model.summary())
 
-    # Setup a callback function to save the model every epoch
-    model_file_path = 'model.{epoch:02d}.hdf5'
+    # Setup a callback function to save the model every epoch the training
+    # loss improves (there is no validation data to monitor)
+    model_file_path = os.path.join(output_dir_path, 'model.{epoch:02d}.hdf5')
     checkpoint_callback = keras.callbacks.ModelCheckpoint(model_file_path,
-        monitor='val_acc', verbose=1, save_best_only=True)
+        monitor='loss', verbose=1, save_best_only=True)
     #batch_progress_callback = keras.callbacks.LambdaCallback(
     #    on_batch_begin=lambda batch,logs: print('Batch {}'.format(batch)))
 
-    # Train the network
-    history = model.fit([x_train, x_train_model], y,
-        epochs=100, batch_size=50, callbacks=[checkpoint_callback])
+    # Train the network, preparing batches ahead in background threads
+    history = model.fit_generator(pairs, epochs=args['epochs'],
+        callbacks=[checkpoint_callback], workers=args['workers'],
+        max_queue_size=max(10, 2 * args['workers']))
 
     print("Finished training.")
+    export_embedding(model, enrollment, output_dir_path)
+    print('Exported embedding model to {}.'.format(output_dir_path))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,143 @@
+
+# coding: utf-8
+
+import argparse
+import cosine_scoring
+import keras
+import numpy as np
+import os
+import siamese_network
+from utils.read_ivectors import load_ivecs_set
+
+
+BATCH_SIZE = 1024
+
+
+def parse_arguments():
+    '''Parses command line arguments.
+
+    Returns
+    -------
+
+    args : Dictionary of command line arguments.
+    '''
+    embedding_dir_path_help = ('Path to directory containing the embedding '
+        'model and enrollment embeddings exported by siamese_network.py.')
+    test_ivecs_dir_path_help = ('Path to directory containing test set '
+        'i-vectors.')
+    batch_size_help = ('Number of test i-vectors embedded at a time. Default '
+        'is {}.'.format(BATCH_SIZE))
+    top_k_help = 'Number of best scoring dialects to report per utterance.'
+    save_predictions_help = ('Path to save the predictions to, one '
+        '"<utt-id> <dialect>" line per utterance.')
+    arg_parser = argparse.ArgumentParser(
+        description=('Score test i-vectors with the embedding model of a '
+        'Siamese NN against precomputed dialect enrollment embeddings.'),
+        epilog=('e.g.: python siamese_scoring.py /path/to/model_dir '
+        '/path/to/test_ivecs'))
+    arg_parser.add_argument('embedding_dir_path', type=str,
+        help=embedding_dir_path_help)
+    arg_parser.add_argument('test_ivecs_dir_path', type=str,
+        help=test_ivecs_dir_path_help)
+    arg_parser.add_argument('--batch-size', dest='batch_size', type=int,
+        default=BATCH_SIZE, help=batch_size_help)
+    arg_parser.add_argument('--top-k', dest='top_k', type=int, default=None,
+        help=top_k_help)
+    arg_parser.add_argument('--save-predictions', dest='save_predictions',
+        type=str, help=save_predictions_help)
+    args = vars(arg_parser.parse_args())
+    return args
+
+
+def load_enrollment_embeddings(embedding_dir_path):
+    '''Loads exported enrollment embeddings, normalized to unit length. '''
+    enrollment = np.load(os.path.join(embedding_dir_path,
+        siamese_network.ENROLLMENT_FILE_NAME))
+    return cosine_scoring.l2_normalize(enrollment)
+
+
+def load_embedding(embedding_dir_path):
+    '''Loads an exported embedding model and its enrollment embeddings.
+
+    Returns
+    -------
+
+    embedding_model : keras.Model mapping i-vectors to embeddings.
+
+    enrollment : Normalized float32 NumPy array of dialect enrollment
+    embeddings, one row per dialect.
+    '''
+    embedding_model = keras.models.load_model(os.path.join(embedding_dir_path,
+        siamese_network.EMBEDDING_FILE_NAME))
+    return embedding_model, load_enrollment_embeddings(embedding_dir_path)
+
+
+def score(embedding_model, test_ivecs, enrollment, batch_size=BATCH_SIZE):
+    '''Scores test i-vectors against the dialect enrollment embeddings.
+
+    Each block of test i-vectors takes one forward pass through the
+    embedding model, then its cosine similarity with every dialect is a
+    single matrix multiplication.
+
+    Arguments
+    ---------
+
+    embedding_model : keras.Model mapping i-vectors to embeddings.
+
+    test_ivecs : 2-D NumPy array (or memory map) of test i-vectors.
+
+    enrollment : Normalized enrollment embeddings from load_embedding.
+
+    batch_size : Number of test i-vectors embedded at a time.
+
+    Returns
+    -------
+
+    scores : float32 NumPy array of shape (test i-vectors, dialects).
+    '''
+    scores = np.empty((len(test_ivecs), len(enrollment)), dtype=np.float32)
+    for start in range(0, len(test_ivecs), batch_size):
+        block = np.asarray(test_ivecs[start:start + batch_size],
+            dtype=np.float32)
+        embeddings = embedding_model.predict(block, batch_size=batch_size)
+        scores[start:start + len(block)] = cosine_scoring.score(embeddings,
+            enrollment, batch_size)
+    return scores
+
+
+def predict(scores):
+    '''Returns the index of the predicted dialect of every test i-vector.
+
+    The network is trained to give same-dialect pairs a cosine similarity of
+    1 and different-dialect pairs 0 (see siamese_network.euclidean_distance),
+    so the predicted dialect is the one with the highest score, and
+    cosine_scoring.top_k gives the best dialects.
+    '''
+    return scores.argmax(axis=1)
+
+
+def main():
+    args = parse_arguments()
+    dialects = siamese_network.dialects
+
+    embedding_model, enrollment = load_embedding(args['embedding_dir_path'])
+    test_ivecs, utt_ids, labels = load_ivecs_set(args['test_ivecs_dir_path'],
+        dialects)
+    scores = score(embedding_model, test_ivecs, enrollment,
+        args['batch_size'])
+    predictions = predict(scores)
+    print('Accuracy: {:.4f}'.format(np.mean(predictions == labels)))
+
+    if args['top_k'] is not None:
+        best = cosine_scoring.top_k(scores, args['top_k'])
+        print('Top-{} accuracy: {:.4f}'.format(args['top_k'],
+            np.mean((best == labels[:, np.newaxis]).any(axis=1))))
+    if args['save_predictions'] is not None:
+        with open(args['save_predictions'], 'w') as predictions_file:
+            predictions_file.writelines('{} {}\n'.format(utt_id,
+                dialects[p]) for utt_id, p in zip(utt_ids, predictions))
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -1,68 +1,439 @@
 import codecs
+import json
+import mmap
 import numpy as np
 import os
 import pandas as pd
+import re
+import struct
+import tempfile
+
+
+# Binary Kaldi objects start with '\0B' after the key
+BINARY_HEADER = b'\0B'
+# Element types of binary Kaldi vectors and matrices
+binary_dtypes = {b'FV': np.float32, b'DV': np.float64, b'FM': np.float32,
+    b'DM': np.float64}
+
+# Text ark record: <utt-id> [ <numbers> ]
+_text_record_re = re.compile(br'(\S+)\s*\[([^\]]*)\]')
+
+# Name of the directory where compiled i-vector sets are cached, inside the
+# i-vectors directory
+CACHE_DIR_NAME = '.ivec_cache'
+# Version of the compiled format, stored in the cache manifest
+CACHE_VERSION = 1
+# Arrays of a compiled i-vector set
+cache_array_names = ['ivecs', 'utt_ids', 'labels']
+# Permissions of the cache files, as open() would create them. The umask can
+# only be read by setting it, which is not thread safe, so it is read once at
+# import time.
+_umask = os.umask(0)
+os.umask(_umask)
+FILE_MODE = 0o666 & ~_umask
+
+
+def _read_int32(data, pos):
+    ''' Reads a binary Kaldi int32 (a size byte followed by the value). '''
+    if data[pos] != 4:
+        raise ValueError('Expected int32 at byte %d.' % pos)
+    return struct.unpack_from('<i', data, pos + 1)[0], pos + 5
+
+
+def _read_binary_object(data, pos, key):
+    ''' Reads a binary Kaldi vector or matrix starting after '\0B'.
+
+    Returns
+    -------
+
+    values : 1-D NumPy array (a view of data) holding the vector, or the
+    only row of a single-row matrix.
+
+    pos : Integer specifying the position after the object.
+    '''
+    token = bytes(data[pos:pos + 2])
+    if token not in binary_dtypes or data[pos + 2:pos + 3] != b' ':
+        raise ValueError(('Unsupported binary object %r for %s. Only FV, DV, '
+            'FM and DM objects are supported.') % (token, key))
+    dtype = binary_dtypes[token]
+    pos += 3
+    if token.endswith(b'V'):
+        size, pos = _read_int32(data, pos)
+    else:
+        rows, pos = _read_int32(data, pos)
+        cols, pos = _read_int32(data, pos)
+        if rows != 1:
+            raise ValueError(('Expected a single i-vector for %s, found a '
+                'matrix with %d rows.') % (key, rows))
+        size = cols
+    values = np.frombuffer(data, dtype=dtype, count=size, offset=pos)
+    return values, pos + size * np.dtype(dtype).itemsize
+
+
+def _parse_text_ark(data):
+    ''' Parses a Kaldi text ark of vectors in bulk.
+
+    All numbers are converted by a single NumPy call on the concatenated
+    vector bodies.
+    '''
+    utt_ids = []
+    bodies = []
+    for match in _text_record_re.finditer(data):
+        utt_ids.append(match.group(1))
+        bodies.append(match.group(2))
+    if utt_ids == []:
+        return np.zeros((0, 0), dtype=np.float32), np.array([], dtype=str)
+    data = b' ' + b' '.join(bodies)
+    values = np.fromstring(data.decode('ascii'), dtype=np.float32, sep=' ')
+    # Count the numbers of every record, since wrong dimensions may add up
+    # to the expected total. A number starts after every blank byte followed
+    # by a non-blank one, so with the leading space, starts[i] marks a number
+    # starting at data[i + 1], and record k covers starts[offsets[k]:].
+    blank = np.frombuffer(data, np.uint8) <= ord(' ')
+    starts = blank[:-1] > blank[1:]
+    offsets = np.cumsum([0] + [len(body) + 1 for body in bodies[:-1]])
+    dims = np.add.reduceat(starts.view(np.uint8), offsets, dtype=np.int64)
+    dim = dims[0]
+    wrong = np.flatnonzero(dims != dim)
+    if len(wrong) > 0:
+        raise ValueError(('i-vector %s has dimension %d, expected %d.') % (
+            utt_ids[wrong[0]].decode('utf-8'), dims[wrong[0]], dim))
+    if dim == 0 or values.size != dim * len(utt_ids):
+        raise ValueError('Could not parse i-vector values.')
+    return values.reshape(len(utt_ids), dim), np.array(
+        [utt_id.decode('utf-8') for utt_id in utt_ids])
+
+
+def _parse_binary_ark(data):
+    ''' Parses a Kaldi binary ark of vectors. '''
+    utt_ids = []
+    rows = []
+    pos = 0
+    size = len(data)
+    while pos < size:
+        # Skip whitespace between records
+        while pos < size and data[pos:pos + 1].isspace():
+            pos += 1
+        if pos >= size:
+            break
+        key_end = data.find(b' ', pos)
+        if key_end == -1 or data[key_end + 1:key_end + 3] != BINARY_HEADER:
+            raise ValueError('Malformed binary ark record at byte %d.' % pos)
+        key = data[pos:key_end].decode('utf-8')
+        values, pos = _read_binary_object(data, key_end + 3, key)
+        utt_ids.append(key)
+        rows.append(values)
+    return _stack(rows), np.array(utt_ids)
+
+
+def _stack(rows):
+    ''' Stacks i-vectors into a contiguous float32 matrix. '''
+    if rows == []:
+        return np.zeros((0, 0), dtype=np.float32)
+    dims = set(len(row) for row in rows)
+    if len(dims) != 1:
+        raise ValueError('i-vectors have different dimensions: %s.' %
+            ', '.join(str(dim) for dim in sorted(dims)))
+    ivecs = np.empty((len(rows), dims.pop()), dtype=np.float32)
+    for i, row in enumerate(rows):
+        ivecs[i] = row
+    return ivecs
+
+
+def read_ivectors(ivecs_file_path):
+    ''' Reads i-vectors from a Kaldi ark file (text or binary)
+
+    Arguments
+    ---------
+
+    ivecs_file_path : String specifying the path to the ark file. Vectors and
+    single-row matrices are supported, in text or binary ('\0B') form.
+
+    Returns
+    -------
+
+    ivecs : Contiguous float32 NumPy array of shape (utterances, dimension).
+
+    utt_ids : NumPy array of utterance ID strings.
+    '''
+    with open(ivecs_file_path, 'rb') as ivecs_file:
+        data = ivecs_file.read()
+    key_end = data.find(b' ')
+    if key_end != -1 and data[key_end + 1:key_end + 3] == BINARY_HEADER:
+        return _parse_binary_ark(data)
+    return _parse_text_ark(data)
+
+
+def _read_scp_entry(data, offset, utt_id, ark_path):
+    ''' Reads the i-vector at an offset of a memory-mapped ark, as a copy
+    which stays valid once the memory map is closed. '''
+    if data[offset:offset + 2] == BINARY_HEADER:
+        values, _ = _read_binary_object(data, offset + 2, utt_id)
+        return np.array(values, dtype=np.float32)
+    end = data.find(b']', offset)
+    start = data.find(b'[', offset, end)
+    if start == -1 or end == -1:
+        raise ValueError(('Could not find i-vector of %s in %s at offset %d.')
+            % (utt_id, ark_path, offset))
+    return np.fromstring(data[start + 1:end].decode('ascii'),
+        dtype=np.float32, sep=' ')
+
+
+def read_ivectors_from_scp(scp_file_path):
+    ''' Reads i-vectors through a Kaldi scp file
+
+    Arguments
+    ---------
+
+    scp_file_path : String specifying the path to the scp file. Each line is
+    in the form: <utt-id> <ark-path>:<offset>
+
+    Returns
+    -------
+
+    ivecs : Contiguous float32 NumPy array of shape (utterances, dimension),
+    in the order of the scp file.
+
+    utt_ids : NumPy array of utterance ID strings.
+    '''
+    entries = []
+    with codecs.open(scp_file_path, 'r', encoding='utf-8') as scp_file:
+        for line in scp_file:
+            fields = line.split()
+            if fields == []:
+                continue
+            ark_path, _, offset = fields[1].rpartition(':')
+            if ark_path == '' or not offset.isdigit():
+                raise ValueError(('scp entry of %s is not in the form '
+                    '<ark-path>:<offset>.') % fields[0])
+            entries.append((fields[0], ark_path, int(offset)))
+
+    # Open every ark once
+    arks = dict()
+    rows = []
+    try:
+        for utt_id, ark_path, offset in entries:
+            if ark_path not in arks:
+                with open(ark_path, 'rb') as ark_file:
+                    arks[ark_path] = mmap.mmap(ark_file.fileno(), 0,
+                        access=mmap.ACCESS_READ)
+            rows.append(_read_scp_entry(arks[ark_path], offset, utt_id,
+                ark_path))
+        ivecs = _stack(rows)
+    finally:
+        for data in arks.values():
+            data.close()
+    return ivecs, np.array([utt_id for utt_id, _, _ in entries])
+
+
+def ivectors_to_dataframe(ivecs, utt_ids):
+    ''' Returns a pandas view of i-vectors
+
+    Arguments
+    ---------
+
+    ivecs : NumPy array of i-vectors.
+
+    utt_ids : NumPy array of utterance IDs.
+
+    Returns
+    -------
+
+    ivecs_df : Pandas DataFrame with an 'utt-id' column followed by one
+    column per dimension, numbered from 1.
+    '''
+    ivecs_df = pd.DataFrame(ivecs, columns=range(1, ivecs.shape[1] + 1),
+        copy=False)
+    ivecs_df.insert(0, 'utt-id', utt_ids)
+    return ivecs_df
 
 
 def read_ivectors_from_file(ivecs_file_path):
     '''Reads i-vectors from a file
-    
+
     Arguments
     ---------
-    
+
     ivecs_file_path : String specifying the path to the file containing
-    i-vector files. i-vector files must be in Kaldi ark text format.
-        
+    i-vector files. i-vector files must be in Kaldi ark (text or binary)
+    format.
+
     Returns
     -------
-    
+
     ivecs : Pandas DataFrame containing i-vectors.
-    
+
     '''
     try:
-        with codecs.open(ivecs_file_path, 'r') as ivecs_file:
-            lines = ivecs_file.readlines()
-    except Exception:
+        ivecs, utt_ids = read_ivectors(ivecs_file_path)
+    except (IOError, OSError):
         print('Cannot open file for reading at path specified {}.'.
             format(ivecs_file_path))
         exit(1)
-    lines = ' '.join([line.strip() for line in lines]).strip().split(']')
-    lines = [line.strip().split() for line in lines if line.strip() != '']
-    ivecs = pd.DataFrame([[line[0]] + [np.float64(x) for x in line[2:]] for
-        line in lines])
-    ivecs = ivecs.rename(columns={0: 'utt-id'})
-    return ivecs
+    return ivectors_to_dataframe(ivecs, utt_ids)
+
+
+def _source_signatures(ivecs_dir_path, dialects):
+    ''' Returns the size and modification time of each dialect file. '''
+    signatures = dict()
+    for dialect in dialects:
+        stat = os.stat(os.path.join(ivecs_dir_path, dialect + '.ivec'))
+        signatures[dialect] = {'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns}
+    return signatures
+
+
+def compile_ivecs_set(ivecs_dir_path, dialects):
+    ''' Reads the i-vector files of the specified dialects into arrays
+
+    Returns
+    -------
+
+    arrays : Dictionary with the float32 i-vector matrix ('ivecs'), the
+    utterance IDs ('utt_ids') and the dialect codes ('labels'), i.e. the
+    index of the dialect of each utterance in dialects.
+    '''
+    ivecs = []
+    utt_ids = []
+    labels = []
+    for code, dialect in enumerate(dialects):
+        ivecs_file_path = os.path.join(ivecs_dir_path, dialect + '.ivec')
+        dialect_ivecs, dialect_utt_ids = read_ivectors(ivecs_file_path)
+        ivecs.append(dialect_ivecs)
+        utt_ids.append(dialect_utt_ids)
+        labels.append(np.full(len(dialect_utt_ids), code, dtype=np.int8))
+    # Leave out empty files, whose dimension is unknown
+    ivecs = [block for block in ivecs if len(block) > 0]
+    dims = set(block.shape[1] for block in ivecs)
+    if len(dims) > 1:
+        raise ValueError('i-vectors have different dimensions: %s.' %
+            ', '.join(str(dim) for dim in sorted(dims)))
+    return {'ivecs': np.concatenate(ivecs) if ivecs else np.zeros((0, 0),
+        dtype=np.float32),
+        'utt_ids': np.concatenate(utt_ids).astype(str),
+        'labels': np.concatenate(labels)}
+
+
+def _replace(tmp_file_path, file_path):
+    ''' Renames a temporary file into place, with the permissions a file
+    created with open() would have. '''
+    os.chmod(tmp_file_path, FILE_MODE)
+    os.replace(tmp_file_path, file_path)
+
+
+def _save_array(file_path, array):
+    ''' Saves an array to a .npy file through a temporary file renamed into
+    place. '''
+    fd, tmp_file_path = tempfile.mkstemp(dir=os.path.dirname(file_path),
+        prefix='.' + os.path.basename(file_path) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            np.save(tmp_file, array)
+        _replace(tmp_file_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_file_path):
+            os.remove(tmp_file_path)
+        raise
+
+
+def load_ivecs_set(ivecs_dir_path, dialects, cache_dir_path=None):
+    ''' Loads i-vector files of the specified dialects through a compiled
+    cache
+
+    The first call compiles the dialect files into .npy arrays in the cache
+    directory. Later calls check the cache against the sizes and modification
+    times of the source files and load it with mmap_mode='r', so the arrays
+    are read lazily and their pages are shared between processes.
+
+    Arguments
+    ---------
+
+    ivecs_dir_path : String specifying the path to the directory containing
+    <dialect>.ivec files.
+
+    dialects : A list of strings specifying dialects for which i-vectors will
+    be read.
+
+    cache_dir_path : String specifying the cache directory. Default is a
+    .ivec_cache directory inside ivecs_dir_path. If the cache cannot be
+    written, the arrays are returned from memory.
+
+    Returns
+    -------
+
+    ivecs : float32 NumPy array (read-only memory map) of shape (utterances,
+    dimension).
+
+    utt_ids : NumPy array of utterance ID strings.
+
+    labels : int8 NumPy array of dialect codes, indexes into dialects.
+    '''
+    if cache_dir_path is None:
+        cache_dir_path = os.path.join(ivecs_dir_path, CACHE_DIR_NAME)
+    cache_dir_path = os.path.join(cache_dir_path, '-'.join(dialects))
+    manifest_file_path = os.path.join(cache_dir_path, 'manifest.json')
+    array_file_paths = {name: os.path.join(cache_dir_path, name + '.npy') for
+        name in cache_array_names}
+    manifest = {'version': CACHE_VERSION, 'dialects': list(dialects),
+        'sources': _source_signatures(ivecs_dir_path, dialects)}
+
+    # Use the cache if it was compiled from the current source files
+    try:
+        with open(manifest_file_path, 'r') as manifest_file:
+            cached_manifest = json.load(manifest_file)
+        if cached_manifest == manifest:
+            return tuple(np.load(array_file_paths[name], mmap_mode='r') for
+                name in cache_array_names)
+    except (IOError, OSError, ValueError):
+        pass
+
+    arrays = compile_ivecs_set(ivecs_dir_path, dialects)
+    try:
+        if not os.path.isdir(cache_dir_path):
+            os.makedirs(cache_dir_path)
+        for name in cache_array_names:
+            _save_array(array_file_paths[name], arrays[name])
+        # The manifest is written last, so it only validates complete caches
+        fd, tmp_file_path = tempfile.mkstemp(dir=cache_dir_path,
+            prefix='.manifest.json.')
+        with os.fdopen(fd, 'w') as tmp_file:
+            json.dump(manifest, tmp_file)
+        _replace(tmp_file_path, manifest_file_path)
+    except (IOError, OSError):
+        print('Warning: Could not write i-vector cache to {}.'.format(
+            cache_dir_path))
+        return tuple(arrays[name] for name in cache_array_names)
+    return tuple(np.load(array_file_paths[name], mmap_mode='r') for name in
+        cache_array_names)
 
 
 def read_ivecs_set(ivecs_dir_path, dialects):
     '''Reads i-vector files of the specified dialects from a directory
-    
+
     Arguments
     ---------
-    
+
     ivecs_dir_path : String specifying the path to the directory
     containing i-vector files
-    
+
     dialects : A list of strings specifying dialects for which
     i-vectors will be read. The files in the directory must be named
     <dialect>.ivec, where <dialect> is the name of the dialect.
-    
+
     Returns
     -------
-    
+
     ivecs : Pandas DataFrame containing i-vectors and the corresponding
     dialects.
-    
-    '''
-    ivecs = pd.DataFrame()
-    for dialect in dialects:
-        ivecs_file_path = ivecs_dir_path + os.sep + dialect + '.ivec'
-        dialect_ivecs = read_ivectors_from_file(ivecs_file_path)
-        # Add the dialect as the utterance label
-        dialect_ivecs['dialect'] = dialect
-        # Drop the utterance id column
-        ivecs = ivecs.append(dialect_ivecs)
-    return ivecs
-
-
 
+    '''
+    try:
+        ivecs, utt_ids, labels = load_ivecs_set(ivecs_dir_path, dialects)
+    except (IOError, OSError):
+        print('Cannot open i-vector files for reading at path specified {}.'.
+            format(ivecs_dir_path))
+        exit(1)
+    ivecs_df = ivectors_to_dataframe(ivecs, utt_ids)
+    # Add the dialect as the utterance label
+    ivecs_df['dialect'] = np.asarray(dialects)[labels]
+    return ivecs_df
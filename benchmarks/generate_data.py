@@ -0,0 +1,311 @@
+#: Title : generate_data.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : Generate deterministic synthetic inputs for the benchmarks:
+#    Arabic Kaldi text and data directories, LDC TDF files, CTM files with a
+#    Kaldi words file, and text i-vector arks, at several scales
+#: Arguments :
+#  1- Destination of the generated data
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    os.pardir, 'arabic_asr', 'utils'))
+from transliteration import buckwalter2unicode_dict
+
+__author__ = "Ahmed Ismail"
+__license__ = "GPL"
+__version__ = "1.0"
+__email__ = "ahmed.ismail.zahran@gmail.com"
+__status__ = "Development"
+
+
+# Changing the version regenerates existing data
+GENERATOR_VERSION = 1
+SEED = 2018
+MANIFEST_FILE_NAME = 'manifest.json'
+
+# Sizes of the generated inputs
+scales = {
+    'small': {'utterances': 10000, 'ctm_words': 200000, 'ivectors': 5000},
+    'medium': {'utterances': 100000, 'ctm_words': 2000000,
+        'ivectors': 20000},
+    'large': {'utterances': 1000000, 'ctm_words': 10000000,
+        'ivectors': 50000}}
+
+VOCAB_SIZE = 50000
+IVECTOR_DIM = 400
+SPEAKERS_PER_RECORDING = 8
+UTTERANCES_PER_RECORDING = 200
+WORDS_PER_RECORDING = 9000
+# Fraction of the speakers of the data directory in the test directory
+TEST_SPEAKER_FRACTION = 0.1
+dialects = ['EGY', 'GLF', 'LAV', 'MSA', 'NOR']
+ivector_sets = {'train': 0.6, 'dev': 0.2, 'test': 0.2}
+
+# Buckwalter letters words are made of (no diacritics, which are rare in the
+# transcripts)
+letters = list('\'|><&}AbptvjHxd*rzs$SDTZEgfqklmnhwYy')
+# Columns of the LDC GALE TDF files
+tdf_columns = ['file;unicode', 'channel;int', 'start;float', 'end;float',
+    'speaker;unicode', 'speakerType;unicode', 'speakerDialect;unicode',
+    'transcript;unicode', 'section;int', 'turn;int', 'segment;int',
+    'sectionType;unicode', 'suType;unicode']
+special_words = ['<eps>', '<UNK>', '!SIL']
+disambiguation_words = ['#0', '<s>', '</s>']
+
+
+def make_vocab(rng, size=VOCAB_SIZE):
+    ''' Returns a list of distinct Buckwalter words with realistic lengths.
+    '''
+    vocab = []
+    seen = set()
+    while len(vocab) < size:
+        for length in rng.poisson(4, size) + 2:
+            word = ''.join(rng.choice(letters, length))
+            if word not in seen:
+                seen.add(word)
+                vocab.append(word)
+                if len(vocab) == size:
+                    break
+    return vocab
+
+
+def zipf_sample(rng, vocab_size, num_words):
+    ''' Samples word indexes following Zipf's law, as in natural text. '''
+    probs = 1.0 / np.arange(1, vocab_size + 1)
+    return rng.choice(vocab_size, num_words, p=probs / probs.sum())
+
+
+def to_unicode(word):
+    return ''.join(buckwalter2unicode_dict[letter] for letter in word)
+
+
+def make_utterances(rng, vocab, num_utterances):
+    ''' Generates utterances grouped by recording
+
+    Returns
+    -------
+
+    utterances : List of (recording, speaker, start, end, words) tuples,
+    where words is a list of indexes into the vocabulary.
+    '''
+    lengths = np.clip(rng.poisson(12, num_utterances), 1, None)
+    word_ids = zipf_sample(rng, len(vocab), int(lengths.sum()))
+    durations = np.round(lengths * rng.uniform(0.3, 0.5, num_utterances), 2)
+    utterances = []
+    pos = 0
+    time = 0.0
+    for i in range(num_utterances):
+        if i % UTTERANCES_PER_RECORDING == 0:
+            time = round(rng.uniform(0, 5), 2)
+        recording = 'ALJZ_NEWS_%05d' % (i // UTTERANCES_PER_RECORDING)
+        speaker = 'speaker%d' % rng.randint(SPEAKERS_PER_RECORDING)
+        start = time
+        end = round(start + durations[i], 2)
+        time = round(end + rng.uniform(0, 1), 2)
+        utterances.append((recording, speaker, start, end,
+            word_ids[pos:pos + lengths[i]].tolist()))
+        pos += lengths[i]
+    return utterances
+
+
+def write_tdf(tdf_file_path, utterances, vocab, rng):
+    ''' Writes utterances as an LDC TDF file, with the comment lines,
+    foreign language utterances, non-MSA tags and empty segments found in
+    real transcripts. '''
+    with open(tdf_file_path, 'w', encoding='utf-8') as tdf_file:
+        tdf_file.write('\t'.join(tdf_columns) + '\n')
+        tdf_file.write(';;MM sectionTypes\t[report, nontrans]\n')
+        tdf_file.write(';;MM sectionBoundaries\t[0.0, 9999.0]\n')
+        for i, (recording, speaker, start, end, word_ids) in enumerate(
+            utterances):
+            transcript = ' '.join(to_unicode(vocab[word_id]) for word_id in
+                word_ids)
+            kind = rng.randint(100)
+            if kind == 0:
+                transcript = '<foreign language="English"> </foreign>'
+            elif kind < 5:
+                transcript = '<non-MSA> ' + transcript
+            elif kind == 5:
+                end = start
+            tdf_file.write('\t'.join([recording + '.sph', '1', '%.2f' % start,
+                '%.2f' % end, speaker, 'male', 'native', transcript, '0',
+                str(i), '0', 'report', 'statement']) + '\n')
+
+
+def utterance_id(recording, speaker, start, end):
+    return '%s-%s_%07d-%07d' % (speaker, recording, int(round(start * 100)),
+        int(round(end * 100)))
+
+
+def write_data_dir(data_dir_path, utterances, vocab, speakers=None):
+    ''' Writes utterances as a Kaldi data directory with Buckwalter text,
+    keeping only the speakers passed if any. '''
+    if not os.path.isdir(data_dir_path):
+        os.makedirs(data_dir_path)
+    spk2utt = dict()
+    recordings = []
+    with open(os.path.join(data_dir_path, 'text'), 'w') as text_file, \
+        open(os.path.join(data_dir_path, 'segments'), 'w') as segments_file, \
+        open(os.path.join(data_dir_path, 'utt2spk'), 'w') as utt2spk_file:
+        for recording, speaker, start, end, word_ids in utterances:
+            spk = '%s-%s' % (speaker, recording)
+            if speakers is not None and spk not in speakers:
+                continue
+            utt_id = utterance_id(recording, speaker, start, end)
+            text_file.write('%s %s\n' % (utt_id, ' '.join(vocab[word_id] for
+                word_id in word_ids)))
+            segments_file.write('%s %s %.2f %.2f\n' % (utt_id, recording,
+                start, end))
+            utt2spk_file.write('%s %s\n' % (utt_id, spk))
+            spk2utt.setdefault(spk, []).append(utt_id)
+            if recordings == [] or recordings[-1] != recording:
+                recordings.append(recording)
+    with open(os.path.join(data_dir_path, 'spk2utt'), 'w') as spk2utt_file:
+        for spk in sorted(spk2utt):
+            spk2utt_file.write('%s %s\n' % (spk, ' '.join(spk2utt[spk])))
+    with open(os.path.join(data_dir_path, 'wav.scp'), 'w') as wav_scp_file:
+        for recording in recordings:
+            wav_scp_file.write('%s /data/wav/%s.wav\n' % (recording,
+                recording))
+
+
+def write_words(words_file_path, vocab):
+    ''' Writes a Kaldi words file and returns the ID of the unknown word. '''
+    with open(words_file_path, 'w') as words_file:
+        words = special_words + sorted(vocab) + disambiguation_words
+        for word_id, word in enumerate(words):
+            words_file.write('%s %d\n' % (word, word_id))
+    return special_words.index('<UNK>')
+
+
+def write_ctm(ctm_file_path, num_words, vocab_size, unk_id, rng):
+    ''' Writes a CTM file of lattice-to-ctm-conf output (word IDs and
+    confidences), with about 2% unknown words. '''
+    word_ids = zipf_sample(rng, vocab_size, num_words) + len(special_words)
+    word_ids[rng.uniform(size=num_words) < 0.02] = unk_id
+    durations = np.round(rng.uniform(0.1, 0.8, num_words), 2)
+    gaps = np.round(rng.exponential(0.1, num_words), 2)
+    confidences = np.round(rng.uniform(0.3, 1, num_words), 2)
+    with open(ctm_file_path, 'w') as ctm_file:
+        for first in range(0, num_words, WORDS_PER_RECORDING):
+            last = min(first + WORDS_PER_RECORDING, num_words)
+            starts = np.cumsum(durations[first:last] + gaps[first:last]) - \
+                durations[first:last]
+            recording = 'ALJZ_NEWS_%05d' % (first // WORDS_PER_RECORDING)
+            ctm_file.writelines('%s 1 %.2f %.2f %d %.2f\n' % (recording,
+                start, duration, word_id, confidence) for start, duration,
+                word_id, confidence in zip(starts, durations[first:last],
+                word_ids[first:last], confidences[first:last]))
+
+
+def write_ivector_sets(ivecs_dir_path, num_ivectors, rng, dim=IVECTOR_DIM):
+    ''' Writes the train, dev and test sets of <dialect>.ivec text arks,
+    drawn around a different mean for every dialect. '''
+    means = rng.normal(0, 1, (len(dialects), dim))
+    for ivecs_set, fraction in sorted(ivector_sets.items()):
+        set_dir_path = os.path.join(ivecs_dir_path, ivecs_set)
+        if not os.path.isdir(set_dir_path):
+            os.makedirs(set_dir_path)
+        num_dialect_ivecs = max(1, int(num_ivectors * fraction /
+            len(dialects)))
+        for code, dialect in enumerate(dialects):
+            ivecs = (means[code] + rng.normal(0, 3, (num_dialect_ivecs,
+                dim))).astype(np.float32)
+            with open(os.path.join(set_dir_path, dialect + '.ivec'),
+                'w') as ivecs_file:
+                for i, ivec in enumerate(ivecs):
+                    ivecs_file.write('%s-%s-%06d  [ %s ]\n' % (dialect,
+                        ivecs_set, i, ' '.join('%.4f' % value for value in
+                        ivec)))
+
+
+def generate(data_dir_path, scale):
+    ''' Generates the inputs of a scale in data_dir_path/<scale>, unless
+    they were generated already by the same generator version
+
+    Inputs are drawn from a NumPy RandomState seeded with SEED, whose
+    streams are stable across NumPy versions, so every machine benchmarks
+    the same inputs.
+
+    Arguments
+    ---------
+
+    data_dir_path : Directory of the generated data.
+
+    scale : Name of the scale, a key of scales.
+
+    Returns
+    -------
+
+    scale_dir_path : Directory of the inputs of the scale.
+    '''
+    sizes = scales[scale]
+    scale_dir_path = os.path.join(data_dir_path, scale)
+    manifest = {'version': GENERATOR_VERSION, 'seed': SEED, 'sizes': sizes}
+    manifest_file_path = os.path.join(scale_dir_path, MANIFEST_FILE_NAME)
+    if os.path.exists(manifest_file_path):
+        with open(manifest_file_path, 'r') as manifest_file:
+            if json.load(manifest_file) == manifest:
+                return scale_dir_path
+    if os.path.isdir(scale_dir_path):
+        shutil.rmtree(scale_dir_path)
+    os.makedirs(scale_dir_path)
+
+    rng = np.random.RandomState(SEED)
+    vocab = make_vocab(rng)
+    utterances = make_utterances(rng, vocab, sizes['utterances'])
+    write_tdf(os.path.join(scale_dir_path, 'corpus.tdf'), utterances, vocab,
+        rng)
+    with open(os.path.join(scale_dir_path, 'text.unicode'), 'w',
+        encoding='utf-8') as text_file:
+        for _, _, _, _, word_ids in utterances:
+            text_file.write(' '.join(to_unicode(vocab[word_id]) for word_id
+                in word_ids) + '\n')
+    write_data_dir(os.path.join(scale_dir_path, 'data'), utterances, vocab)
+    speakers = sorted(set('%s-%s' % (speaker, recording) for recording,
+        speaker, _, _, _ in utterances))
+    test_speakers = set(rng.choice(speakers, max(1, int(len(speakers) *
+        TEST_SPEAKER_FRACTION)), replace=False))
+    write_data_dir(os.path.join(scale_dir_path, 'test'), utterances, vocab,
+        test_speakers)
+
+    unk_id = write_words(os.path.join(scale_dir_path, 'words.txt'), vocab)
+    write_ctm(os.path.join(scale_dir_path, 'output.ctm'), sizes['ctm_words'],
+        len(vocab), unk_id, rng)
+    write_ivector_sets(os.path.join(scale_dir_path, 'ivectors'),
+        sizes['ivectors'], rng)
+
+    with open(manifest_file_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    return scale_dir_path
+
+
+def main():
+    ''' Generate the inputs of the benchmarks.
+    '''
+    arg_parser = argparse.ArgumentParser(description=('Generate '
+        'deterministic synthetic inputs for the benchmarks.'))
+    arg_parser.add_argument('data_dir_path', type=str,
+        help='Destination of the generated data.')
+    arg_parser.add_argument('--scales', type=str, default='small',
+        help=('Comma-separated scales to generate, among %s. Default is '
+        'small.' % ', '.join(scales)))
+    args = vars(arg_parser.parse_args())
+
+    for scale in args['scales'].split(','):
+        if scale not in scales:
+            print('Unknown scale %s.' % scale)
+            exit(1)
+        print('Inputs of scale %s are in %s.' % (scale, generate(
+            args['data_dir_path'], scale)))
+
+
+if __name__ == '__main__':
+    main()
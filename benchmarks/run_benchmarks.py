@@ -0,0 +1,413 @@
+#: Title : run_benchmarks.py
+#: Author : "Ahmed Ismail" <ahmed.ismail.zahran@gmail.com>
+#: Version : 1.0
+#: Description : Measure the throughput and peak memory of the data
+#    preparation, subtitle and dialect identification entry points on
+#    synthetic inputs, and compare them with a stored baseline
+#: Arguments :
+#  1- Destination of the JSON results
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+benchmarks_dir_path = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(benchmarks_dir_path, os.pardir,
+    'arabic_asr', 'utils'))
+sys.path.insert(0, os.path.join(benchmarks_dir_path, os.pardir,
+    'arabic_dialect_identification'))
+from generate_data import dialects, generate, scales
+
+__author__ = "Ahmed Ismail"
+__license__ = "GPL"
+__version__ = "1.0"
+__email__ = "ahmed.ismail.zahran@gmail.com"
+__status__ = "Development"
+
+
+RESULTS_VERSION = 1
+REPEAT = 3
+# Default relative slowdown (or memory growth) reported as a regression
+THRESHOLD = 0.2
+DATA_DIR = os.path.join(benchmarks_dir_path, 'data')
+BASELINE = os.path.join(benchmarks_dir_path, 'baseline.json')
+
+
+def _file_size(*paths):
+    return sum(os.path.getsize(path) for path in paths)
+
+
+def _count_lines(file_path):
+    with open(file_path, 'rb') as input_file:
+        return sum(block.count(b'\n') for block in iter(lambda:
+            input_file.read(1 << 20), b''))
+
+
+# Every benchmark takes the directory of the inputs of a scale and a scratch
+# directory, and returns a dictionary with:
+# run : Function running the entry point (the timed part).
+# prepare : Function run before every run, outside of the timing, or None.
+# items, unit : Number and kind of the items processed by a run.
+# bytes : Size of the input in bytes.
+
+def bench_transliterate(input_dir_path, work_dir_path):
+    from transliteration import transliterate
+    text_file_path = os.path.join(input_dir_path, 'text.unicode')
+    with open(text_file_path, 'r', encoding='utf-8') as text_file:
+        text = text_file.read()
+    return {'run': lambda: transliterate(text, 'unicode', 'buckwalter'),
+        'prepare': None, 'items': len(text), 'unit': 'chars',
+        'bytes': _file_size(text_file_path)}
+
+
+def bench_transliterate_file(input_dir_path, work_dir_path):
+    from transliteration import transliterate_file
+    text_file_path = os.path.join(input_dir_path, 'text.unicode')
+    return {'run': lambda: transliterate_file(text_file_path, os.path.join(
+        work_dir_path, 'text.buckwalter')), 'prepare': None,
+        'items': _count_lines(text_file_path), 'unit': 'lines',
+        'bytes': _file_size(text_file_path)}
+
+
+def bench_ldc_corpus2kaldi_dir(input_dir_path, work_dir_path):
+    from ldc_corpus2kaldi_dir import tdf2kaldi_entries
+    tdf_file_path = os.path.join(input_dir_path, 'corpus.tdf')
+    return {'run': lambda: tdf2kaldi_entries(tdf_file_path), 'prepare': None,
+        'items': _count_lines(tdf_file_path), 'unit': 'lines',
+        'bytes': _file_size(tdf_file_path)}
+
+
+def bench_remove_test_speakers(input_dir_path, work_dir_path):
+    from filter_data_dir import filter_data_dir
+    from remove_test_speakers import get_speaker_from_utt2spk
+    data_dir_path = os.path.join(input_dir_path, 'data')
+    to_clean_dir_path = os.path.join(work_dir_path, 'data')
+    test_utt2spk_file_path = os.path.join(input_dir_path, 'test', 'utt2spk')
+
+    def prepare():
+        # Filtering is done in place, so every run starts from a fresh copy
+        if os.path.isdir(to_clean_dir_path):
+            shutil.rmtree(to_clean_dir_path)
+        shutil.copytree(data_dir_path, to_clean_dir_path)
+
+    def run():
+        # Leave the progress messages out of the benchmark output
+        with contextlib.redirect_stdout(io.StringIO()):
+            filter_data_dir(to_clean_dir_path, exclude_spks=
+                get_speaker_from_utt2spk(test_utt2spk_file_path))
+
+    file_paths = [os.path.join(data_dir_path, file_name) for file_name in
+        os.listdir(data_dir_path)]
+    return {'run': run, 'prepare': prepare,
+        'items': _count_lines(os.path.join(data_dir_path, 'utt2spk')),
+        'unit': 'utterances', 'bytes': _file_size(*file_paths)}
+
+
+def bench_prepare_lm_text(input_dir_path, work_dir_path):
+    from prepare_lm_text import prepare_lm_text
+    text_file_path = os.path.join(input_dir_path, 'data', 'text')
+    return {'run': lambda: prepare_lm_text(text_file_path, os.path.join(
+        work_dir_path, 'lm_text'), os.path.join(work_dir_path, 'corpus'),
+        os.path.join(work_dir_path, 'vocab')), 'prepare': None,
+        'items': _count_lines(text_file_path), 'unit': 'lines',
+        'bytes': _file_size(text_file_path)}
+
+
+def bench_load_ctm(input_dir_path, work_dir_path):
+    from ctm_index import load_ctm
+    ctm_file_path = os.path.join(input_dir_path, 'output.ctm')
+    return {'run': lambda: load_ctm(ctm_file_path), 'prepare': None,
+        'items': _count_lines(ctm_file_path), 'unit': 'words',
+        'bytes': _file_size(ctm_file_path)}
+
+
+def bench_write_subtitles(input_dir_path, work_dir_path):
+    from ctm_index import load_ctm, write_subtitles
+    from symbol_table import get_symbol_table
+    ctm_file_path = os.path.join(input_dir_path, 'output.ctm')
+    index = load_ctm(ctm_file_path)
+    symbol_table = get_symbol_table(os.path.join(input_dir_path,
+        'words.txt'), 'buckwalter', 'unicode', os.path.join(work_dir_path,
+        'symbol_tables'))
+    srt_dir_path = os.path.join(work_dir_path, 'srt')
+    os.makedirs(srt_dir_path)
+    return {'run': lambda: write_subtitles(index, srt_dir_path,
+        symbol_table), 'prepare': None, 'items': len(index.start),
+        'unit': 'words', 'bytes': _file_size(ctm_file_path)}
+
+
+def bench_read_ivectors(input_dir_path, work_dir_path):
+    from utils.read_ivectors import read_ivectors
+    ivecs_file_path = os.path.join(input_dir_path, 'ivectors', 'train',
+        dialects[0] + '.ivec')
+    return {'run': lambda: read_ivectors(ivecs_file_path), 'prepare': None,
+        'items': _count_lines(ivecs_file_path), 'unit': 'ivectors',
+        'bytes': _file_size(ivecs_file_path)}
+
+
+def bench_cds_scoring(input_dir_path, work_dir_path):
+    import cosine_scoring
+    import dialect_enrollment
+    from utils.read_ivectors import read_ivecs_set
+
+    # Read the sets (and compile their caches) outside of the timing, as in
+    # cds.py, where they are read once
+    ivecs_dir_path = os.path.join(input_dir_path, 'ivectors')
+    ivecs = dict()
+    for ivecs_set in ['train', 'dev', 'test']:
+        set_dir_path = os.path.join(work_dir_path, ivecs_set)
+        shutil.copytree(os.path.join(ivecs_dir_path, ivecs_set),
+            set_dir_path)
+        ivecs[ivecs_set] = read_ivecs_set(set_dir_path, dialects)
+
+    def run():
+        de_model = dialect_enrollment.model(ivecs['train'].drop('utt-id',
+            axis='columns'), ivecs['dev'].drop('utt-id', axis='columns'))
+        enrollment = cosine_scoring.enrollment_matrix(de_model, dialects)
+        scores = cosine_scoring.score(ivecs['test'].drop(['utt-id',
+            'dialect'], axis='columns').values, enrollment)
+        predictions = np.asarray(dialects)[scores.argmax(axis=1)]
+        return np.mean(predictions == ivecs['test']['dialect'].values)
+
+    return {'run': run, 'prepare': None, 'items': sum(len(set_ivecs) for
+        set_ivecs in ivecs.values()), 'unit': 'ivectors',
+        'bytes': sum(_file_size(*[os.path.join(ivecs_dir_path, ivecs_set,
+        dialect + '.ivec') for dialect in dialects]) for ivecs_set in
+        ivecs)}
+
+
+benchmarks = [('transliterate', bench_transliterate),
+    ('transliterate_file', bench_transliterate_file),
+    ('ldc_corpus2kaldi_dir', bench_ldc_corpus2kaldi_dir),
+    ('remove_test_speakers', bench_remove_test_speakers),
+    ('prepare_lm_text', bench_prepare_lm_text),
+    ('load_ctm', bench_load_ctm),
+    ('write_subtitles', bench_write_subtitles),
+    ('read_ivectors', bench_read_ivectors),
+    ('cds_scoring', bench_cds_scoring)]
+
+
+def measure(benchmark, repeat=REPEAT):
+    ''' Runs a benchmark repeat times, then once more to trace its memory
+
+    Arguments
+    ---------
+
+    benchmark : Dictionary returned by a benchmark function.
+
+    repeat : Number of timed runs. The fastest one is reported, being the
+    least disturbed by other processes.
+
+    Returns
+    -------
+
+    result : Dictionary of the measures.
+    '''
+    prepare = benchmark['prepare'] or (lambda: None)
+    times = []
+    for _ in range(repeat):
+        prepare()
+        start = time.perf_counter()
+        benchmark['run']()
+        times.append(time.perf_counter() - start)
+    # Tracing slows allocations down, so memory is traced in a separate run.
+    # NumPy reports its array buffers to tracemalloc.
+    prepare()
+    tracemalloc.start()
+    try:
+        benchmark['run']()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    seconds = min(times)
+    return {'seconds': seconds, 'mean_seconds': sum(times) / len(times),
+        'items': benchmark['items'], 'unit': benchmark['unit'],
+        'throughput': benchmark['items'] / seconds,
+        'mb_per_second': benchmark['bytes'] / float(1 << 20) / seconds,
+        'peak_memory_mb': peak / float(1 << 20)}
+
+
+def run_benchmarks(data_dir_path, scale_names, names=None, repeat=REPEAT):
+    ''' Runs the benchmarks on the inputs of every scale, generating the
+    inputs if needed
+
+    Arguments
+    ---------
+
+    data_dir_path : Directory of the generated inputs.
+
+    scale_names : List of scales to run.
+
+    names : List of the benchmarks to run, or None for all of them.
+
+    repeat : Number of timed runs of every benchmark.
+
+    Returns
+    -------
+
+    results : Dictionary mapping '<scale>/<benchmark>' to the measures of the
+    benchmark, or to {'skipped': reason} if a dependency of the entry point
+    is not installed.
+    '''
+    results = dict()
+    for scale in scale_names:
+        print('Generating inputs of scale %s.' % scale)
+        input_dir_path = generate(data_dir_path, scale)
+        for name, bench in benchmarks:
+            if names is not None and name not in names:
+                continue
+            key = '%s/%s' % (scale, name)
+            work_dir_path = tempfile.mkdtemp(prefix='bench.')
+            try:
+                results[key] = measure(bench(input_dir_path, work_dir_path),
+                    repeat)
+            except ImportError as e:
+                results[key] = {'skipped': str(e)}
+            finally:
+                shutil.rmtree(work_dir_path, ignore_errors=True)
+            print(format_result(key, results[key]))
+    return results
+
+
+def format_result(key, result):
+    if 'skipped' in result:
+        return '%-36s skipped (%s)' % (key, result['skipped'])
+    return '%-36s %9.3f s %12.0f %s/s %8.1f MB/s %8.1f MB peak' % (key,
+        result['seconds'], result['throughput'], result['unit'],
+        result['mb_per_second'], result['peak_memory_mb'])
+
+
+def environment():
+    ''' Returns a description of the machine and library versions, saved
+    with the results since timings only compare on the same setup. '''
+    versions = {'python': platform.python_version(), 'numpy': np.__version__}
+    try:
+        import pandas
+        versions['pandas'] = pandas.__version__
+    except ImportError:
+        pass
+    return {'machine': platform.machine(), 'processor':
+        platform.processor(), 'system': platform.system(), 'cpus':
+        os.cpu_count(), 'versions': versions}
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    ''' Compares results with a baseline
+
+    Arguments
+    ---------
+
+    results : Dictionary of results returned by run_benchmarks.
+
+    baseline : Dictionary of results of an earlier run.
+
+    threshold : Relative increase of the time or peak memory of a benchmark
+    reported as a regression.
+
+    Returns
+    -------
+
+    lines : List of lines describing the changes.
+
+    regressions : List of the keys of the benchmarks which regressed.
+    '''
+    lines = []
+    regressions = []
+    for key in sorted(results):
+        result = results[key]
+        base = baseline.get(key)
+        if base is None or 'skipped' in result or 'skipped' in base:
+            continue
+        time_ratio = result['seconds'] / base['seconds']
+        memory_ratio = (result['peak_memory_mb'] / base['peak_memory_mb'] if
+            base['peak_memory_mb'] > 0 else 1)
+        regressed = time_ratio > 1 + threshold or memory_ratio > 1 + threshold
+        if regressed:
+            regressions.append(key)
+        lines.append('%-36s time x%.2f, peak memory x%.2f%s' % (key,
+            time_ratio, memory_ratio, '  REGRESSION' if regressed else ''))
+    return lines, regressions
+
+
+def main():
+    ''' Run the benchmarks and compare the results with a baseline.
+    '''
+    arg_parser = argparse.ArgumentParser(description=('Measure the '
+        'throughput and peak memory of the data preparation, subtitle and '
+        'dialect identification entry points on synthetic inputs.'))
+    arg_parser.add_argument('results_file_path', type=str,
+        help='Destination of the JSON results.')
+    arg_parser.add_argument('--scales', type=str, default='small',
+        help=('Comma-separated scales to run, among %s. Default is small.' %
+        ', '.join(scales)))
+    arg_parser.add_argument('--benchmarks', type=str, default=None,
+        help=('Comma-separated benchmarks to run, among %s. Default is all '
+        'of them.' % ', '.join(name for name, _ in benchmarks)))
+    arg_parser.add_argument('--repeat', type=int, default=REPEAT,
+        help='Number of timed runs of every benchmark. Default is %d.' %
+        REPEAT)
+    arg_parser.add_argument('--data-dir', dest='data_dir', type=str,
+        default=DATA_DIR, help=('Directory of the generated inputs, reused '
+        'between runs. Default is %s.' % DATA_DIR))
+    arg_parser.add_argument('--baseline', type=str, default=BASELINE,
+        help=('Results to compare with, if the file exists. Default is %s.'
+        % BASELINE))
+    arg_parser.add_argument('--threshold', type=float, default=THRESHOLD,
+        help=('Relative increase of time or peak memory reported as a '
+        'regression. Default is %.2f.' % THRESHOLD))
+    arg_parser.add_argument('--save-baseline', dest='save_baseline',
+        action='store_true', help='Also save the results as the baseline.')
+    args = vars(arg_parser.parse_args())
+
+    scale_names = args['scales'].split(',')
+    for scale in scale_names:
+        if scale not in scales:
+            print('Unknown scale %s.' % scale)
+            exit(1)
+    names = None
+    if args['benchmarks'] is not None:
+        names = args['benchmarks'].split(',')
+        for name in names:
+            if name not in dict(benchmarks):
+                print('Unknown benchmark %s.' % name)
+                exit(1)
+
+    results = run_benchmarks(args['data_dir'], scale_names, names,
+        args['repeat'])
+    output = {'version': RESULTS_VERSION, 'environment': environment(),
+        'results': results}
+    with open(args['results_file_path'], 'w') as results_file:
+        json.dump(output, results_file, indent=2, sort_keys=True)
+    print('Results were written to %s.' % args['results_file_path'])
+
+    regressions = []
+    if os.path.exists(args['baseline']) and not args['save_baseline']:
+        with open(args['baseline'], 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline['environment'] != output['environment']:
+            print('Warning: the baseline was measured on a different machine '
+                'or with different library versions.')
+        lines, regressions = compare(results, baseline['results'],
+            args['threshold'])
+        print('Compared with %s:' % args['baseline'])
+        print('\n'.join(lines))
+    if args['save_baseline'] and os.path.abspath(args['baseline']) != \
+        os.path.abspath(args['results_file_path']):
+        shutil.copyfile(args['results_file_path'], args['baseline'])
+        print('Results were saved as the baseline in %s.' % args['baseline'])
+    if regressions:
+        print('%d benchmarks regressed.' % len(regressions))
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()